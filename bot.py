@@ -10,12 +10,28 @@ Trench FnF Nation — Telegram Bot (python-telegram-bot v21+)
 
 from __future__ import annotations
 import os
+import asyncio
+import base64
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import logging
+import re
+import socket
+import sqlite3
+import struct
+import sys
+import threading
 import time
 import random
 import aiohttp
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
-from typing import Awaitable, Callable, Dict, List, Tuple, Optional
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple, Optional
 from pathlib import Path
 
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
@@ -28,8 +44,11 @@ from telegram.ext import (
     CommandHandler,
     filters,
     CallbackQueryHandler,
+    ChatMemberHandler,
+    BaseUpdateProcessor,
 )
 from telegram.helpers import mention_html
+from telegram.request import BaseRequest
 
 # ──────────────────────────────
 # Logging
@@ -39,6 +58,7 @@ logging.basicConfig(
     level=logging.INFO,
 )
 logger = logging.getLogger("trench-bot")
+PROCESS_T0 = time.monotonic()  # mesure du cold start (process → 1ère alerte)
 
 # ──────────────────────────────
 # Config
@@ -77,12 +97,20 @@ LEXIQUE_URL   = os.getenv("LEXIQUE_URL", "https://t.me/TrenchFnFNation/351")
 CommandFunc = Callable[[Update, ContextTypes.DEFAULT_TYPE, List[str]], Awaitable[None]]
 COMMANDS: Dict[str, Tuple[CommandFunc, str]] = {}
 ALIASES: Dict[str, str] = {}
+ADMIN_COMMANDS: set[str] = set()  # vérifiées dans le router (cache admins, pas d'appel API)
+COMMAND_COSTS: Dict[str, str] = {}  # classe de coût pour l'anti-spam: cheap | net | write
 
-def register_command(name: str, help_text: str, aliases: List[str] | None = None) -> Callable[[CommandFunc], CommandFunc]:
+def register_command(name: str, help_text: str, aliases: List[str] | None = None, admin: bool = False,
+                     cost: str = "cheap") -> Callable[[CommandFunc], CommandFunc]:
     def decorator(func: CommandFunc) -> CommandFunc:
         COMMANDS[name] = (func, help_text)
+        COMMAND_COSTS[name] = cost
         for alias in aliases or []:
             ALIASES[alias] = name
+        if admin:
+            ADMIN_COMMANDS.add(name)
+        else:
+            ADMIN_COMMANDS.discard(name)
         return func
     return decorator
 
@@ -107,6 +135,14 @@ def fmt_amount(x: float) -> str:
         return f"{x/1_000:.2f}k"
     return f"{x:.2f}"
 
+def parse_duration(s: str) -> Optional[float]:
+    """"90s", "30m", "2h", "1d" (ou un nombre de secondes) → secondes ; None si invalide."""
+    m = re.match(r"^\s*([0-9]+(?:[.,][0-9]+)?)\s*([smhdj]?)\s*$", s.lower())
+    if not m:
+        return None
+    mult = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "j": 86400}[m.group(2)]
+    return float(m.group(1).replace(",", ".")) * mult
+
 def parse_amount(s: str) -> float:
     s = s.strip().lower().replace(",", "")
     mult = 1.0
@@ -146,13 +182,81 @@ def parse_command(text: str) -> Optional[Tuple[str, List[str]]]:
     args = parts[1:]
     return (name, args)
 
+# Cache des admins par chat : rempli en bloc (get_chat_administrators), tenu à jour
+# par les updates ChatMemberUpdated, avec un TTL en filet de sécurité.
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "900"))
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+_admin_cache: Dict[int, Tuple[float, set[int]]] = {}  # chat_id -> (fetched_at, user_ids)
+
+async def chat_admin_ids(bot, chat_id: int) -> set[int]:
+    hit = _admin_cache.get(chat_id)
+    if hit and time.monotonic() - hit[0] < ADMIN_CACHE_TTL:
+        return hit[1]
+    admins = await bot.get_chat_administrators(chat_id)
+    ids = {m.user.id for m in admins}
+    _admin_cache[chat_id] = (time.monotonic(), ids)
+    return ids
+
 async def is_admin(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> bool:
+    if chat_id == user_id:  # DM: l'utilisateur est chez lui
+        return True
     try:
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        return member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+        return user_id in await chat_admin_ids(context.bot, chat_id)
     except Exception:
         return False
 
+async def update_is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    chat = update.effective_chat
+    user = update.effective_user
+    msg = update.effective_message
+    if not (chat and user):
+        return False
+    # admin anonyme: le message est envoyé "au nom" du groupe
+    if msg and msg.sender_chat and msg.sender_chat.id == chat.id:
+        return True
+    return await is_admin(context, chat.id, user.id)
+
+async def on_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cmu = update.chat_member or update.my_chat_member
+    if not cmu:
+        return
+    hit = _admin_cache.get(cmu.chat.id)
+    if not hit:
+        return
+    uid = cmu.new_chat_member.user.id
+    if cmu.new_chat_member.status in ADMIN_STATUSES:
+        hit[1].add(uid)
+    else:
+        hit[1].discard(uid)
+
+class TokenBucket:
+    """Seau à jetons: `rate` jetons/s, au plus `capacity` d'avance."""
+
+    __slots__ = ("rate", "capacity", "tokens", "t")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.t = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+
+    def try_take(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    async def take(self, n: float = 1.0):
+        n = min(n, self.capacity)
+        while not self.try_take(n):
+            await asyncio.sleep(max(0.01, (n - self.tokens) / self.rate))
+
 def Kb(*rows: List[InlineKeyboardButton]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(list(rows))
 
@@ -176,26 +280,98 @@ CG_IDS = {
 }
 FIATS = {"usd", "eur"}
 
-_prices_cache = {"t": 0, "data": {}}
+PRICE_TTL       = float(os.getenv("PRICE_TTL", "60"))         # au-delà: rafraîchi en fond (stale-while-revalidate)
+PRICE_MAX_STALE = float(os.getenv("PRICE_MAX_STALE", "900"))  # au-delà: on attend un vrai fetch
+PRICE_REFRESH   = float(os.getenv("PRICE_REFRESH", "45"))     # période du rafraîchissement proactif
+
+class PriceTable:
+    """
+    Prix en mémoire par (coingecko_id, fiat) avec leur propre horodatage.
+    Un seul appel CoinGecko rafraîchit tous les CG_IDS × FIATS ; les appels
+    concurrents partagent le fetch en cours (single-flight).
+    """
+
+    def __init__(self):
+        self.prices: Dict[Tuple[str, str], Tuple[float, float]] = {}  # (id, fiat) -> (price, fetched_at)
+        self.extra_ids: set[str] = set()
+        self._inflight: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def get(self, cid: str, fiat: str) -> Optional[Tuple[float, float]]:
+        """(prix, âge en s) depuis la mémoire, sans réseau."""
+        hit = self.prices.get((cid, fiat))
+        if not hit:
+            return None
+        return hit[0], time.time() - hit[1]
+
+    async def _fetch(self, ids: List[str]):
+        url = "https://api.coingecko.com/api/v3/simple/price"
+        params = {"ids": ",".join(sorted(ids)), "vs_currencies": ",".join(sorted(FIATS))}
+        try:
+            async with aiohttp.ClientSession() as s:
+                async with s.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as r:
+                    r.raise_for_status()
+                    data = await r.json()
+        except Exception as e:
+            # on garde les anciens prix ; les appelants verront l'âge
+            logger.warning("CoinGecko fetch failed: %s", e)
+            return
+        now = time.time()
+        for cid, quotes in (data or {}).items():
+            for fiat, px in (quotes or {}).items():
+                if px is not None:
+                    self.prices[(cid, fiat)] = (float(px), now)
+
+    def refresh(self) -> asyncio.Task:
+        """Lance (ou rejoint) le fetch en cours."""
+        if self._inflight is None or self._inflight.done():
+            ids = set(CG_IDS.values()) | self.extra_ids
+            self._inflight = asyncio.create_task(self._fetch(list(ids)))
+        return self._inflight
+
+    async def ensure(self, ids: List[str], vs: List[str]):
+        """Attend le réseau seulement si une paire manque ou est trop vieille."""
+        need_wait = False
+        need_bg = False
+        for cid in ids:
+            if cid not in CG_IDS.values():
+                self.extra_ids.add(cid)
+            for fiat in vs:
+                hit = self.get(cid, fiat)
+                if hit is None or hit[1] > PRICE_MAX_STALE:
+                    need_wait = True
+                elif hit[1] > PRICE_TTL:
+                    need_bg = True
+        if need_wait:
+            await asyncio.shield(self.refresh())
+        elif need_bg:
+            self.refresh()
+
+    async def _loop(self):
+        while True:
+            await asyncio.shield(self.refresh())
+            await asyncio.sleep(PRICE_REFRESH)
+
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._loop())
+
+PRICES = PriceTable()
 
 async def get_prices(ids: list[str], vs: list[str]) -> dict:
     """
-    Retourne {coingecko_id: {vs: price, ...}, ...} avec un cache ~60s.
+    Retourne {coingecko_id: {vs: price, ...}, ...} depuis la table en mémoire
+    (rafraîchie en fond ; n'attend le réseau qu'à froid).
     """
-    now = time.time()
-    key = (tuple(sorted(ids)), tuple(sorted(vs)))
-    cached = _prices_cache["data"].get(key)
-    if cached and (now - _prices_cache["t"] < 60):
-        return cached
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {"ids": ",".join(ids), "vs_currencies": ",".join(vs)}
-    async with aiohttp.ClientSession() as s:
-        async with s.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as r:
-            r.raise_for_status()
-            data = await r.json()
-    _prices_cache["t"] = now
-    _prices_cache["data"][key] = data
-    return data
+    PRICES.start()
+    await PRICES.ensure(ids, vs)
+    out: dict = {}
+    for cid in ids:
+        for fiat in vs:
+            hit = PRICES.get(cid, fiat)
+            if hit:
+                out.setdefault(cid, {})[fiat] = hit[0]
+    return out
 
 def _norm_sym(s: str) -> str:
     return (s or "").strip().lower()
@@ -285,8 +461,8 @@ async def cmd_commandes(update: Update, context: ContextTypes.DEFAULT_TYPE, args
         "• <code>!axiom</code>, <code>!bloom</code> (alias <code>!bloombot</code>), <code>!uxento</code>, <code>!raycyan</code> (alias <code>!ray</code>), <code>!mockape</code> (alias <code>!ma</code>), <code>!solincinerator</code>",
         "\n<b>📈 Marché (rapide)</b>",
         "• <code>!dex</code> — ce que signifie « payer le DEX » (bannière + réseaux sociaux, ≈1.5 SOL)",
-        "• <code>!fees</code> — slippage/priority/bribe conseillés",
-        "• <code>!bond</code> — explication de la migration (bond vers DEX)\n• <code>!convert</code> — conversions USD/EUR ⇄ SOL/ETH/AVAX/BASE/BTC/USDT/USDC",
+        "• <code>!fees</code> — priority fee en direct (low/medium/high/turbo) + slippage/bribe conseillés",
+        "• <code>!bond</code> — explication de la migration (bond vers DEX) • <code>!bond &lt;CA&gt;</code> — progression de la bonding curve en direct\n• <code>!check &lt;CA&gt;</code> — holders, authorities, supply, LP\n• <code>!early &lt;CA&gt; [N]</code> — premiers acheteurs (+ boutons watch)\n• <code>!convert</code> — conversions USD/EUR ⇄ SOL/ETH/AVAX/BASE/BTC/USDT/USDC et tokens SPL (ticker ou CA)",
         "\n<b>⚠️ Warning</b>",
         "• <code>!pnl</code> — mise en garde sur les cartes PnL (fausses captures, manipulations, etc.)",
         " \n<b>📒 Tutos</b>",
@@ -295,13 +471,19 @@ async def cmd_commandes(update: Update, context: ContextTypes.DEFAULT_TYPE, args
         "\n<b>🛰️ Tracker (Wallet temps réel)</b>",
         "• <code>!watch &lt;adresse&gt; [alias]</code> (alias <code>!wallet</code>) — suivre un wallet (image en haut, CA copiable, ticker/nom)",
         "• <code>!unwatch &lt;adresse&gt;</code> — arrêter le suivi",
-        "• <code>!unwatchall</code> — vider tout",
+        "• <code>!unwatchall</code> — vider tout (admin)",
+        "• <code>!watchmint &lt;CA&gt; [min_SOL]</code> — flux achats/ventes d'un token (résumés) | <code>!unwatchmint &lt;CA&gt;</code>",
         "• <code>!list</code> — liste compacte | <code>!listdetail</code> — alias, date, launchonly, minSOL",
-        "• <code>!setrpc &lt;http_url&gt;</code> — endpoint HTTP (pour <i>getTransaction</i>)",
-        "• <code>!setws &lt;wss_url&gt;</code> — endpoint WebSocket (sinon auto à partir du HTTP)",
+        "• <code>!setrpc &lt;http_url&gt;</code> — endpoint HTTP (pour <i>getTransaction</i>, admin)",
+        "• <code>!setws &lt;wss_url&gt;</code> — endpoint WebSocket (sinon auto à partir du HTTP, admin) • <code>!setws poll</code> — mode polling (RPC HTTP seul)",
         "• <code>!launchonly &lt;adresse&gt; on|off</code> — notifier seulement la <u>première</u> fois par token",
         "• <code>!minsol &lt;adresse&gt; &lt;montant_SOL&gt;</code> — filtrer les achats &lt; seuil de SOL",
         "• <code>!silent on/off</code> — notifications silencieuses (par chat)",
+        "• <code>!filter buys minusd=50 maxage=1h</code> — règles du chat | <code>!filter off</code>",
+        "• <code>!history &lt;adresse|alias&gt; [24h]</code> | <code>!who &lt;CA&gt; [24h]</code> — historique local des swaps",
+        "• <code>!wpnl &lt;adresse|alias&gt;</code> | <code>!leaderboard</code> — PnL réel des wallets suivis",
+        "• <code>!consensus 3 5</code> — alerte co-achats (N wallets en X min) | <code>!consensus off</code>",
+        "• <code>!trending [1h|24h] [global]</code> — tokens les plus achetés",
     ]
     await reply(update, "\n".join(lines))
 
@@ -317,7 +499,8 @@ async def cmd_start_alias(update: Update, context: ContextTypes.DEFAULT_TYPE, ar
 
 @register_command(name="about", help_text="À propos du bot", aliases=["info"])
 async def cmd_about(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    me = await context.bot.get_me()
+    # identité chargée une fois au démarrage (Application.initialize → get_me)
+    me = context.bot
     txt = (
         f"<b>🤖 {me.first_name}</b> (@{me.username})\n"
         f"Préfixe: <code>{CMD_PREFIX}</code>\n"
@@ -343,7 +526,7 @@ async def cmd_topic(update: Update, context: ContextTypes.DEFAULT_TYPE, args: Li
     await reply(update, f"🧵 <b>Topic ID:</b> <code>{thr}</code>" if thr else "(Pas de topic ici)")
 
 # Ping avec latence + bouton supprimer
-@register_command(name="ping", help_text="Ping + latence (ms)", aliases=["p"])
+@register_command(name="ping", help_text="Ping + latence (ms)", aliases=["p"], cost="net")
 async def cmd_ping(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     base = "🛰️ <b>Signal reçu</b> — <code>P O N G</code>"
     markup = Kb([InlineKeyboardButton("🗑 Supprimer", callback_data="pong:del")])
@@ -504,8 +687,10 @@ async def cmd_premierspas(update: Update, context: ContextTypes.DEFAULT_TYPE, ar
     )
     await reply(update, text)
 
-@register_command(name="bcurve", help_text="Bonding curve", aliases=["bondingcurve","bc"])
+@register_command(name="bcurve", help_text="Bonding curve (!bcurve <CA> = progression en direct)", aliases=["bondingcurve","bc"], cost="net")
 async def cmd_bcurve(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    if args:
+        await reply_bond(update, args[0].strip()); return
     text = (
         "<b>📈 Bonding curve</b>\n"
         "La courbe relie le prix à la quantité achetée/vendue.\n"
@@ -555,9 +740,18 @@ async def cmd_tracker(update: Update, context: ContextTypes.DEFAULT_TYPE, args:
 async def cmd_sniprug(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     await reply(update, f"<b>🎯 Sniper les ruggers</b>\nÉtapes et outils recommandés.\n👉 <a href=\"{T_SNIPRUG}\">{T_SNIPRUG}</a>")
 
-@register_command(name="fees", help_text="Frais conseillés (slippage/priority/bribe)")
+@register_command(name="fees", help_text="Frais conseillés (slippage/priority/bribe) + priority fees en direct")
 async def cmd_fees(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    FEES.start()
+    levels, age = FEES.snapshot()
+    if levels:
+        live = "\n".join(f"• {name}: <b>{fmt_price(fee_sol(levels[name]))} SOL</b> (<code>{fmt_amount(levels[name])}</code> µL/CU)"
+                         for name, _q in FEE_LEVELS)
+        live = f"<b>⚡ Priority fee en direct</b> <i>(il y a {int(age)} s, swap ~{FEE_CU // 1000}k CU)</i>\n{live}\n\n"
+    else:
+        live = "<i>Priority fees en direct: mesure en cours, réessaie dans quelques secondes.</i>\n\n"
     text = (
+        live +
         "<b>💸 Fees recommandés</b>\n"
         "• Slippage: <b>10%</b>\n"
         "• Priority fee: <b>0.001</b>\n"
@@ -566,8 +760,10 @@ async def cmd_fees(update: Update, context: ContextTypes.DEFAULT_TYPE, args: Lis
     )
     await reply(update, text)
 
-@register_command(name="bond", help_text="Qu'est-ce que la migration (bond) ?")
+@register_command(name="bond", help_text="Qu'est-ce que la migration (bond) ? — !bond <CA> = progression en direct", cost="net")
 async def cmd_bond(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    if args:
+        await reply_bond(update, args[0].strip()); return
     text = (
         "<b>🔄 Migration (Bond)</b>\n"
         "Passage d'un token d'un modèle initial (ex: pump.fun) vers une LP DEX stable.\n"
@@ -590,21 +786,24 @@ async def cmd_dex(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List
     await reply(update, text)
 
 
-@register_command(name="convert", help_text="Conversion: !convert 100 usd-sol (ou 2.5 sol-eur, 1 avax-base, 50 eur-usd)")
+@register_command(name="convert", help_text="Conversion: !convert 100 usd-sol (ou 2.5 sol-eur, 1 avax-base, 50 eur-usd, 1m bonk-usd, 2 sol-<CA>)", cost="net")
 async def cmd_convert(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     if not args:
-        await reply(update, "Usage: <code>!convert 100 usd-sol</code> • <code>!convert 2.5 sol-eur</code> • <code>!convert 1 avax-base</code> • <code>!convert 50 eur-usd</code>")
+        await reply(update, "Usage: <code>!convert 100 usd-sol</code> • <code>!convert 2.5 sol-eur</code> • <code>!convert 1 avax-base</code> • <code>!convert 50 eur-usd</code> • <code>!convert 2 sol-&lt;CA&gt;</code>")
         return
     raw = " ".join(args).strip()
     # Accept both "100 usd->sol" and "100usd->sol"
     import re as _re
-    m = _re.match(r"^\s*([0-9]+(?:[.,][0-9]+)?)\s*([a-zA-Z]+)\s*-\s*([a-zA-Z]+)\s*$", raw)
+    m = _re.match(r"^\s*([0-9]+(?:[.,][0-9]+)?(?:[kKmMbB](?=\s))?)\s*(\$?[a-zA-Z0-9]+)\s*-\s*(\$?[a-zA-Z0-9]+)\s*$", raw)
     if not m:
         await reply(update, "Format invalide. Ex: <code>!convert 100 usd-sol</code>")
         return
-    amount = float(m.group(1).replace(",", "."))
+    amount = parse_amount(m.group(1).replace(",", "."))
     base = _norm_sym(m.group(2))
     quote = _norm_sym(m.group(3))
+    if any(sym not in FIATS and sym not in CG_IDS for sym in (base, quote)):
+        await convert_spl(update, amount, m.group(2), m.group(3))
+        return
 
     def sym_to_id(sym: str):
         if sym in FIATS:
@@ -686,6 +885,52 @@ async def cmd_convert(update: Update, context: ContextTypes.DEFAULT_TYPE, args:
         return
 
     await reply(update, "Paire non prise en charge.")
+
+async def _convert_leg(raw: str) -> Tuple[Optional[float], Optional[str], Optional[str], List[str]]:
+    """(prix USD, libellé, mint, candidats) d'un côté de !convert ; libellé None = non résolu (candidats si ambigu)."""
+    sym = _norm_sym(raw).lstrip("$")
+    if sym == "usd":
+        return 1.0, "USD", None, []
+    if sym in FIATS:  # autre fiat : via le cours du SOL dans les deux devises
+        px = (await get_prices(["solana"], ["usd", sym])).get("solana") or {}
+        return (px["usd"] / px[sym] if px.get("usd") and px.get(sym) else None), sym.upper(), None, []
+    if sym in CG_IDS:
+        px = (await get_prices([CG_IDS[sym]], ["usd"])).get(CG_IDS[sym]) or {}
+        return px.get("usd"), sym.upper(), None, []
+    ca = raw.lstrip("$")
+    mint, cands = (ca, [ca]) if is_valid_pubkey(ca) else TOKENS.find_symbol(sym)
+    if not mint:
+        return None, None, None, cands
+    return await QUOTES.get(mint), _token_label(mint), mint, []
+
+async def convert_spl(update: Update, amount: float, raw_base: str, raw_quote: str):
+    """!convert dont au moins un côté est un token SPL (ticker connu ou CA), coté sur DEX."""
+    (px_b, lb_b, mint_b, cands_b), (px_q, lb_q, mint_q, cands_q) = await asyncio.gather(_convert_leg(raw_base), _convert_leg(raw_quote))
+    for raw, label, cands in ((raw_base, lb_b, cands_b), (raw_quote, lb_q, cands_q)):
+        if label is None and cands:
+            lines = [f"Plusieurs tokens <code>{raw}</code> — précise le CA :"]
+            lines += [f"• <code>{m}</code>" for m in cands[:5]]
+            if len(cands) > 5:
+                lines.append(f"… et {len(cands) - 5} autres")
+            await reply(update, "\n".join(lines))
+            return
+        if label is None:
+            await reply(update, f"Symbole inconnu: <code>{raw}</code> (essaie avec le CA)")
+            return
+    if not (px_b and px_q):
+        await reply(update, "Prix indisponible actuellement (token sans pool liquide ?).")
+        return
+    qty = amount * px_b / px_q
+
+    def num(x: float) -> str:
+        return fmt_amount(x) if abs(x) >= 1 else f"{x:.6g}"
+
+    lines = [f"{num(amount)} <b>{lb_b}</b> ≈ <code>{num(qty)}</code> <b>{lb_q}</b>"]
+    for label, px, mint in ((lb_b, px_b, mint_b), (lb_q, px_q, mint_q)):
+        if mint:
+            lines.append(f"1 {label} = <code>{num(px)}</code> $ • CA: <code>{mint}</code>")
+    await reply(update, "\n".join(lines))
+
 @register_command(name="pnl", help_text="Mise en garde sur les cartes PnL")
 async def cmd_pnl(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     text = (
@@ -738,24 +983,12 @@ async def cmd_gn(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[
 # ──────────────────────────────
 # UTILITAIRES
 # ──────────────────────────────
-@register_command(name="setrules", help_text="(Admin) Modifier les règles")
+@register_command(name="setrules", help_text="(Admin) Modifier les règles", admin=True, cost="write")
 async def cmd_setrules(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     global RULES_TEXT
     if not args:
         await reply(update, "Usage: <code>!setrules Ton nouveau texte (HTML autorisé)</code>")
         return
-    chat = update.effective_chat
-    user = update.effective_user
-    if not (chat and user):
-        await reply(update, "Contexte indisponible.")
-        return
-    try:
-        member = await context.bot.get_chat_member(chat.id, user.id)
-        if member.status not in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
-            await reply(update, "⛔ Seuls les admins peuvent modifier les règles.")
-            return
-    except Exception:
-        pass
     RULES_TEXT = " ".join(args)
     await reply(update, "✅ Règles mises à jour. Tape <code>!regles</code> pour vérifier.")
 
@@ -763,7 +996,7 @@ async def cmd_setrules(update: Update, context: ContextTypes.DEFAULT_TYPE, args:
 async def cmd_regles(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     await reply(update, RULES_TEXT)
 
-@register_command(name="vote", help_text="Créer un sondage: !vote Question ? | Option1 | Option2 | ...")
+@register_command(name="vote", help_text="Créer un sondage: !vote Question ? | Option1 | Option2 | ...", cost="net")
 async def cmd_vote(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
     raw = " ".join(args).strip()
     if "|" not in raw:
@@ -826,22 +1059,212 @@ def parse_prefix(update: Update) -> Optional[Tuple[str, List[str]]]:
         return None
     return parse_command(text)
 
+# ── Anti-spam: seaux à jetons par user / chat / classe de coût ───────────────
+# (jetons/s, rafale) côté user puis côté chat. Un raid sature le seau du chat,
+# les autres chats et les commandes "cheap" restent fluides.
+RATE_CLASSES: Dict[str, Tuple[Tuple[float, float], Tuple[float, float]]] = {
+    "cheap": ((1.0, 5), (5.0, 20)),   # textes statiques
+    "net":   ((0.2, 3), (1.0, 6)),    # appels réseau (CoinGecko, Bot API en plus)
+    "write": ((0.5, 5), (2.0, 10)),   # modifient le state (save_state)
+}
+RATE_KEYS_MAX     = int(os.getenv("RATE_KEYS_MAX", "20000"))  # seaux gardés (LRU)
+RATE_NOTICE_EVERY = float(os.getenv("RATE_NOTICE_EVERY", "30"))  # un seul avertissement par user et période
+
+class CommandRateLimiter:
+    def __init__(self, classes: Dict[str, Tuple[Tuple[float, float], Tuple[float, float]]], max_keys: int):
+        self.classes = classes
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        self.notified: Dict[int, float] = {}  # user -> fin de la période sans nouvel avertissement
+        self.dropped = 0
+
+    def _bucket(self, key: tuple, rate: float, burst: float) -> TokenBucket:
+        b = self.buckets.get(key)
+        if b is None:
+            b = self.buckets[key] = TokenBucket(rate, burst)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return b
+
+    def allow(self, user_id: int, chat_id: int, cost: str) -> bool:
+        (ur, ub), (cr, cb) = self.classes.get(cost) or self.classes["cheap"]
+        ubk = self._bucket(("u", user_id, cost), ur, ub)
+        cbk = self._bucket(("c", chat_id, cost), cr, cb)
+        ubk._refill()
+        cbk._refill()
+        if ubk.tokens >= 1 and cbk.tokens >= 1:
+            ubk.tokens -= 1
+            cbk.tokens -= 1
+            return True
+        self.dropped += 1
+        return False
+
+    def drop_idle(self, fraction: float) -> int:
+        """Retire des seaux pleins (inactifs) les plus anciens : identiques à un seau neuf, aucune limite n'est remise à zéro."""
+        want = max(1, int(len(self.buckets) * fraction))
+        idle = []
+        for key, b in self.buckets.items():
+            b._refill()
+            if b.tokens >= b.capacity:
+                idle.append(key)
+                if len(idle) >= want:
+                    break
+        for key in idle:
+            del self.buckets[key]
+        return len(idle)
+
+    def should_notify(self, user_id: int) -> bool:
+        now = time.monotonic()
+        if self.notified.get(user_id, 0.0) > now:
+            return False
+        if len(self.notified) > self.max_keys:
+            self.notified = {u: t for u, t in self.notified.items() if t > now}
+        self.notified[user_id] = now + RATE_NOTICE_EVERY
+        return True
+
+LIMITER = CommandRateLimiter(RATE_CLASSES, RATE_KEYS_MAX)
+
 async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     parsed = parse_prefix(update)
     if not parsed:
         return
     name, args = parsed
     real = ALIASES.get(name, name)
+    chat = update.effective_chat
+    user = update.effective_user
+    chat_id = chat.id if chat else 0
+    user_id = user.id if user else chat_id
+    if not LIMITER.allow(user_id, chat_id, COMMAND_COSTS.get(real, "cheap")):
+        if LIMITER.should_notify(user_id):
+            await reply(update, f"⏳ Doucement {_mention_user(update)}, réessaie dans quelques secondes.")
+        return
     if real not in COMMANDS:
         await reply(update, f"❓ Commande inconnue: <code>!{name}</code> — tape <code>!commandes</code>")
         return
     handler, _help = COMMANDS[real]
+    if real in ADMIN_COMMANDS and not await update_is_admin(update, context):
+        await reply(update, "⛔ Commande réservée aux admins.")
+        return
     try:
         await handler(update, context, args)
     except Exception:
         logger.exception("Erreur !%s", real)
         await reply(update, "⚠️ Erreur pendant la commande. Regarde les logs.")
 
+# ── Traitement des updates: concurrence bornée + ordre par chat ───────────────
+UPDATE_WORKERS   = int(os.getenv("UPDATE_WORKERS", "32"))      # handlers qui tournent en même temps (global)
+UPDATE_QUEUE_MAX = int(os.getenv("UPDATE_QUEUE_MAX", "2000"))  # updates admis (en cours + en attente)
+UPDATE_SHED_AT   = int(os.getenv("UPDATE_SHED_AT", "300"))     # au-delà: on jette le bavardage (non-commandes)
+
+def _update_chat_id(update: object) -> Optional[int]:
+    chat = update.effective_chat if isinstance(update, Update) else None
+    return chat.id if chat else None
+
+def _is_priority_update(update: object) -> bool:
+    """Commandes, clics et changements de membres: jamais jetés quand on sature."""
+    if not isinstance(update, Update):
+        return True
+    if update.callback_query or update.chat_member or update.my_chat_member:
+        return True
+    msg = update.effective_message
+    text = (msg.text or msg.caption or "") if msg else ""
+    return text.startswith((CMD_PREFIX, "/"))
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    File série par chat (les réponses d'un chat restent dans l'ordre) et
+    nombre global de handlers bornés (les chats tournent en parallèle).
+    Sous charge, les messages hors commande sont jetés au lieu d'attendre.
+    """
+
+    def __init__(self, workers: int, queue_max: int, shed_at: int):
+        super().__init__(max_concurrent_updates=queue_max)
+        self.workers = workers
+        self.shed_at = shed_at
+        self._slots = asyncio.Semaphore(workers)
+        self._tails: Dict[int, asyncio.Future] = {}  # chat_id -> fin du dernier update en file
+        self.pending = 0
+        self.running = 0
+        self.peak = 0
+        self.processed = 0
+        self.dropped = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        if self.pending >= self.shed_at and not _is_priority_update(update):
+            coroutine.close()  # type: ignore[attr-defined]
+            self.dropped += 1
+            return
+        chat_id = _update_chat_id(update)
+        prev = self._tails.get(chat_id) if chat_id is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if chat_id is not None:
+            self._tails[chat_id] = done
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        started = False
+        try:
+            if prev is not None:
+                await asyncio.shield(prev)
+            async with self._slots:
+                self.running += 1
+                started = True
+                try:
+                    await coroutine
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        finally:
+            if not started:
+                coroutine.close()  # type: ignore[attr-defined]
+            self.pending -= 1
+            if not done.done():
+                done.set_result(None)
+            if chat_id is not None and self._tails.get(chat_id) is done:
+                del self._tails[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "peak": self.peak,
+            "chats": len(self._tails),
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+
+@register_command(name="stats", help_text="(Admin) Charge du bot: file d'updates", admin=True)
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    proc = context.application.update_processor
+    if not isinstance(proc, ChatOrderedUpdateProcessor):
+        await reply(update, "Processeur d'updates par défaut (pas de stats).")
+        return
+    st = proc.stats()
+    txt = (
+        "<b>📊 Charge</b>\n"
+        f"File: <code>{st['pending']}</code> (pic <code>{st['peak']}</code>) • chats en file: <code>{st['chats']}</code>\n"
+        f"En cours: <code>{st['running']}</code>/<code>{proc.workers}</code>\n"
+        f"Traités: <code>{st['processed']}</code> • jetés: <code>{st['dropped']}</code> • anti-spam: <code>{LIMITER.dropped}</code>\n"
+        f"Uptime: <code>{int(time.monotonic() - PROCESS_T0)} s</code> • 1ère alerte: "
+        + (f"<code>+{_first_alert_at:.1f} s</code>" if _first_alert_at is not None else "<i>pas encore</i>")
+    )
+    if WS_SUBS is not None:
+        ws = WS_SUBS.stats()
+        txt += f"\nWS: <code>{ws['subscribed']}</code> abonnés • <code>{ws['pending']}</code> en attente • <code>{ws['failed']}</code> échecs"
+    if FILTER_STATS:
+        txt += "\nFiltre: " + " • ".join(f"{k}: <code>{v}</code>" for k, v in sorted(FILTER_STATS.items()))
+    if POLLER is not None:
+        pl = POLLER.stats()
+        txt += f"\nPolling: <code>{pl['wallets']}</code> wallets (<code>{pl['hot']}</code> actifs) • <code>{pl['polls']}</code> polls • <code>{pl['found']}</code> tx"
+    await reply(update, txt)
+
 # Wrappers pour éviter les lambdas (Pyright)
 async def _show_cmds(u: Update, c: ContextTypes.DEFAULT_TYPE):
     await cmd_commandes(u, c, [])
@@ -849,13 +1272,18 @@ async def _show_cmds(u: Update, c: ContextTypes.DEFAULT_TYPE):
 async def _show_help(u: Update, c: ContextTypes.DEFAULT_TYPE):
     await cmd_commandes(u, c, [])
 
-def build_app() -> Application:
-    app: Application = (
+def build_app(request: Optional[BaseRequest] = None) -> Application:
+    """`request` remplace le client HTTP de la Bot API (ex: loadgen.py)."""
+    builder = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
-        .concurrent_updates(True)
-        .build()
+        .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_WORKERS, UPDATE_QUEUE_MAX, UPDATE_SHED_AT))
+        .post_init(on_post_init)
+        .post_shutdown(on_post_shutdown)
     )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app: Application = builder.build()
     app.add_handler(CommandHandler("start", on_start))
     app.add_handler(CommandHandler("commandes", _show_cmds))
     app.add_handler(CommandHandler("help", _show_help))
@@ -863,36 +1291,14 @@ def build_app() -> Application:
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
     app.add_handler(CallbackQueryHandler(on_pong_delete, pattern="^pong:del$"))
     app.add_handler(CallbackQueryHandler(on_panel_click, pattern="^(panel:|show:)"))
+    app.add_handler(CallbackQueryHandler(on_early_click, pattern="^early:w:"))
+    app.add_handler(ChatMemberHandler(on_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER))
     return app
 
-if __name__ == "__main__":
-    app = build_app()
-    if PUBLIC_URL:
-        webhook_path = "/webhook"
-        full_url = f"{PUBLIC_URL.rstrip('/')}{webhook_path}"
-        logger.info("WEBHOOK sur %s (port %s)", full_url, PORT)
-        app.run_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            url_path=webhook_path.strip("/"),
-            webhook_url=full_url,
-            drop_pending_updates=True,
-        )
-    else:
-        logger.info("Polling (LOCAL/DEV)")
-        app.run_polling(drop_pending_updates=True)
-
-
 # =========================
 # TRACKER (Wallet real-time)
 # PID-less, images, launchonly, minSOL, silent, aliases
 # =========================
-import aiohttp
-from telegram import Update
-from telegram.ext import Application, ContextTypes
-
-# Fallbacks if the host bot doesn't define them (won't override if already present)
-
 
 # ── Persistence ───────────────────────────────────────────────────────────────
 TRACKER_STORE = os.getenv("TRACKER_STORE", "./tracker_state.json")
@@ -904,43 +1310,262 @@ def _default_chat_cfg():
         "http_rpc": os.getenv("SOLANA_RPC", "https://api.mainnet-beta.solana.com"),
         "ws_rpc": os.getenv("SOLANA_WS", ""),
         "silent": False,
-        "subs": {}  # addr -> {alias, added_at, launchonly, seen_mints, min_sol}
+        "show_failed": False,
+        "subs": {},  # addr -> {alias, added_at, launchonly, seen_mints, min_sol}
+        "mints": {},  # mint -> {added_at, min_sol}
+        "rules": "",  # règles !filter (texte, compilé à l'usage)
+        "consensus": None,  # {n, minutes, min_sol} pour !consensus
     }
 
+def read_state() -> Dict[int, Dict[str, object]]:
+    """Lit le store (sans toucher TRACKER_STATE) ; lève si le fichier est illisible."""
+    if not os.path.exists(TRACKER_STORE):
+        return {}
+    with open(TRACKER_STORE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    out = {}
+    for chat_id_str, cfg in data.items():
+        cfg = cfg or {}
+        cfg.setdefault("http_rpc", _default_chat_cfg()["http_rpc"])
+        cfg.setdefault("ws_rpc", _default_chat_cfg()["ws_rpc"])
+        cfg.setdefault("silent", False)
+        cfg.setdefault("show_failed", False)
+        subs = cfg.get("subs") or {}
+        for addr, meta in subs.items():
+            meta.setdefault("alias", "")
+            meta.setdefault("added_at", datetime.now(timezone.utc).isoformat())
+            meta.setdefault("launchonly", False)
+            meta.setdefault("seen_mints", [])
+            meta.setdefault("min_sol", 0.0)
+        cfg["subs"] = subs
+        cfg.setdefault("mints", {})  # mint -> {added_at, min_sol}
+        cfg.setdefault("rules", "")
+        cfg.setdefault("consensus", None)
+        out[int(chat_id_str)] = cfg
+    return out
+
 def load_state():
     global TRACKER_STATE
-    if not os.path.exists(TRACKER_STORE):
-        TRACKER_STATE = {}
-        return
     try:
-        with open(TRACKER_STORE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        out = {}
-        for chat_id_str, cfg in data.items():
-            cfg = cfg or {}
-            cfg.setdefault("http_rpc", _default_chat_cfg()["http_rpc"])
-            cfg.setdefault("ws_rpc", _default_chat_cfg()["ws_rpc"])
-            cfg.setdefault("silent", False)
-            subs = cfg.get("subs") or {}
-            for addr, meta in subs.items():
-                meta.setdefault("alias", "")
-                meta.setdefault("added_at", datetime.now(timezone.utc).isoformat())
-                meta.setdefault("launchonly", False)
-                meta.setdefault("seen_mints", [])
-                meta.setdefault("min_sol", 0.0)
-            cfg["subs"] = subs
-            out[int(chat_id_str)] = cfg
-        TRACKER_STATE = out
+        TRACKER_STATE = read_state()
     except Exception as e:
         logger.exception("load_state failed: %s", e)
         TRACKER_STATE = {}
 
+def _write_store(data: str):
+    """(thread) Écriture atomique du store."""
+    tmp = Path(TRACKER_STORE + ".tmp")
+    tmp.write_text(data, encoding="utf-8")
+    tmp.replace(TRACKER_STORE)
+
+def chat_fingerprint(cfg: Dict[str, object]) -> str:
+    """Config d'un chat hors seen_mints (que route_tx modifie sans passer par une commande)."""
+    subs = {addr: {k: v for k, v in meta.items() if k != "seen_mints"} for addr, meta in (cfg.get("subs") or {}).items()}  # type: ignore[union-attr]
+    return json.dumps({**cfg, "subs": subs}, sort_keys=True, default=str)
+
 async def save_state():
+    """
+    Écrit le store et incrémente sa version par compare-and-swap : si une autre
+    machine a écrit entre-temps, on fusionne sa version (nos chats modifiés localement
+    gardent la nôtre) puis on retente.
+    """
+    global _state_version, _state_base
+    async with _state_save_lock:
+        for _attempt in range(STATE_SAVE_RETRIES):
+            # photo et sérialisation sur la boucle : les commandes modifient TRACKER_STATE ici
+            data = json.dumps({str(chat_id): cfg for chat_id, cfg in TRACKER_STATE.items()}, ensure_ascii=False, indent=2)
+            base = {chat_id: chat_fingerprint(cfg) for chat_id, cfg in TRACKER_STATE.items()}
+            try:
+                version = await asyncio.to_thread(LEASE.bump_state_version, _state_version, lambda: _write_store(data))
+            except Exception as e:
+                logger.exception("save_state failed: %s", e)
+                break
+            if version is not None:
+                _state_version, _state_base = version, base
+                break
+            await sync_state_from_store()
+        else:
+            logger.warning("save_state: still conflicting after %d attempts, giving up", STATE_SAVE_RETRIES)
+    notify_tracker_change()
+
+# ── Leader lease (multi-machines) ─────────────────────────────────────────────
+# Plusieurs machines Fly peuvent tourner en même temps : toutes servent les
+# commandes, mais une seule (le détenteur du bail) fait tourner le WS tracker.
+TRACKER_LEASE_DB = os.getenv("TRACKER_LEASE_DB", str(Path(TRACKER_STORE).with_name("tracker_lease.sqlite3")))
+LEASE_TTL        = float(os.getenv("TRACKER_LEASE_TTL", "15"))
+LEASE_RENEW      = float(os.getenv("TRACKER_LEASE_RENEW", "5"))
+INSTANCE_ID      = os.getenv("FLY_MACHINE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+class TrackerLease:
+    """Bail renouvelable stocké dans une ligne SQLite (fichier sur le volume partagé)."""
+
+    def __init__(self, path: str, holder: str, ttl: float):
+        self.path = path
+        self.holder = holder
+        self.ttl = ttl
+        self.held = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        return conn
+
+    def try_acquire(self) -> bool:
+        """Prend ou renouvelle le bail. Retourne True si on est (toujours) leader."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT holder, expires_at FROM lease WHERE name = 'tracker'").fetchone()
+            if row is None or row[0] == self.holder or row[1] < now:
+                conn.execute(
+                    "INSERT INTO lease (name, holder, expires_at) VALUES ('tracker', ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at",
+                    (self.holder, now + self.ttl),
+                )
+                self.held = True
+            else:
+                self.held = False
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.held = False
+            raise
+        finally:
+            conn.close()
+        return self.held
+
+    def release(self):
+        """Libère le bail (arrêt propre) pour qu'une autre machine prenne le relais tout de suite."""
+        if not self.held:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM lease WHERE name = 'tracker' AND holder = ?", (self.holder,))
+        finally:
+            conn.close()
+        self.held = False
+
+    def current_holder(self) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT holder, expires_at FROM lease WHERE name = 'tracker'").fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def state_version(self) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'state_version'").fetchone()
+        finally:
+            conn.close()
+        return int(row[0]) if row else 0
+
+    def bump_state_version(self, expected: int, write: Callable[[], None]) -> Optional[int]:
+        """
+        (thread) Compare-and-swap : si la version vaut toujours `expected`, appelle
+        write() et passe à expected + 1 dans la même transaction. Retourne la
+        nouvelle version, ou None si une autre machine a écrit entre-temps.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('state_version', 0)")
+            cur = conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'state_version' AND value = ?", (expected,))
+            if cur.rowcount != 1:
+                conn.execute("ROLLBACK")
+                return None
+            write()
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return expected + 1
+
+LEASE = TrackerLease(TRACKER_LEASE_DB, INSTANCE_ID, LEASE_TTL)
+STATE_SAVE_RETRIES = 5
+_state_version = 0      # version du store qu'on a en mémoire
+_state_base: Dict[int, str] = {}  # chat_id -> chat_fingerprint à cette version (ce qui diffère est local)
+_leader_task = None     # background lease task handle
+
+_state_sync: Optional[asyncio.Task] = None
+_state_save_lock = asyncio.Lock()
+
+def _read_store_if_newer(known: int) -> Optional[Tuple[int, Dict[int, Dict[str, object]]]]:
+    """(thread) Version du store et son contenu, si une autre écriture a eu lieu depuis `known`."""
+    v = LEASE.state_version()
+    if v == known:
+        return None
+    return v, read_state()
+
+def apply_state(new: Dict[int, Dict[str, object]]):
+    """
+    (boucle) Installe un state relu du store en réutilisant les cfg / metas de
+    wallet déjà en mémoire : route_tx peut en tenir une référence pendant un await,
+    ses écritures (seen_mints…) restent donc visibles et sont fusionnées.
+    """
+    global TRACKER_STATE
+    merged: Dict[int, Dict[str, object]] = {}
+    for chat_id, cfg in new.items():
+        cur = TRACKER_STATE.get(chat_id)
+        if cur is None or cur is cfg:
+            merged[chat_id] = cfg
+            continue
+        old_subs: Dict[str, dict] = cur.get("subs") or {}  # type: ignore[assignment]
+        subs: Dict[str, dict] = cfg.get("subs") or {}  # type: ignore[assignment]
+        for addr, meta in subs.items():
+            old = old_subs.get(addr)
+            if old is None:
+                continue
+            seen = old.setdefault("seen_mints", [])
+            known = set(seen)
+            seen.extend(m for m in meta.get("seen_mints") or [] if m not in known)
+            if len(seen) > SEEN_MINTS_MAX:
+                del seen[:len(seen) - SEEN_MINTS_MAX]
+            meta["seen_mints"] = seen
+            old.clear()
+            old.update(meta)
+            subs[addr] = old
+        old_subs.clear()
+        old_subs.update(subs)
+        cfg["subs"] = old_subs
+        cur.clear()
+        cur.update(cfg)
+        merged[chat_id] = cur
+    TRACKER_STATE = merged
+
+async def _sync_state() -> bool:
+    global _state_version, _state_base
     try:
-        tmp = {str(chat_id): cfg for chat_id, cfg in TRACKER_STATE.items()}
-        Path(TRACKER_STORE).write_text(json.dumps(tmp, ensure_ascii=False, indent=2), encoding="utf-8")
+        res = await asyncio.to_thread(_read_store_if_newer, _state_version)
     except Exception as e:
-        logger.exception("save_state failed: %s", e)
+        logger.warning("state store read failed: %s", e)
+        return False
+    if res is None or res[0] <= _state_version:  # rien de neuf, ou notre propre save_state est passé entre-temps
+        return False
+    version, new = res
+    # chats modifiés ici depuis la dernière version connue (save_state en attente) : on garde les nôtres
+    local = {chat_id: cfg for chat_id, cfg in TRACKER_STATE.items() if chat_fingerprint(cfg) != _state_base.get(chat_id)}
+    base = {chat_id: chat_fingerprint(cfg) for chat_id, cfg in new.items()}
+    apply_state({**new, **local})
+    _state_version, _state_base = version, base
+    notify_tracker_change()
+    return True
+
+async def sync_state_from_store() -> bool:
+    """Recharge TRACKER_STATE si une autre machine a écrit le store. Retourne True si rechargé."""
+    global _state_sync
+    if _state_sync is None or _state_sync.done():
+        _state_sync = asyncio.create_task(_sync_state())  # appels simultanés: une seule lecture
+    return await asyncio.shield(_state_sync)
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 BASE58_RE = re.compile(r"^[1-9A-HJ-NP-Za-km-z]{32,44}$")
@@ -952,6 +1577,26 @@ BADGE_SILENT_OFF = "🔔"
 def is_valid_pubkey(s: str) -> bool:
     return bool(BASE58_RE.match((s or "").strip()))
 
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+
+def b58decode(s: str) -> bytes:
+    n = 0
+    for c in s:
+        n = n * 58 + _B58_INDEX[c]
+    body = n.to_bytes((n.bit_length() + 7) // 8, "big") if n else b""
+    pad = len(s) - len(s.lstrip("1"))
+    return b"\x00" * pad + body
+
+def b58encode(b: bytes) -> str:
+    n = int.from_bytes(b, "big")
+    out = []
+    while n:
+        n, r = divmod(n, 58)
+        out.append(B58_ALPHABET[r])
+    pad = len(b) - len(b.lstrip(b"\x00"))
+    return "1" * pad + "".join(reversed(out))
+
 def short_pk(pk: str) -> str:
     return pk[:4] + "…" + pk[-4:]
 
@@ -977,7 +1622,9 @@ def infer_ws_from_http(http_url: str) -> str:
         return http_url
     return "wss://api.mainnet-beta.solana.com"
 
-def tracker_chat_state(chat_id: int) -> Dict[str, object]:
+async def tracker_chat_state(chat_id: int) -> Dict[str, object]:
+    # une autre machine a pu modifier les subs depuis : on part de la dernière version
+    await sync_state_from_store()
     if chat_id not in TRACKER_STATE:
         TRACKER_STATE[chat_id] = _default_chat_cfg()
     return TRACKER_STATE[chat_id]
@@ -986,8 +1633,56 @@ def tracker_chat_state(chat_id: int) -> Dict[str, object]:
 class TokenMetaCache:
     def __init__(self):
         self.by_mint: Dict[str, dict] = {}
+        self.hot: Dict[str, None] = {}  # mints demandés par les alertes (ordre = récence), pour le snapshot
+        self.hot_max = int(os.getenv("TOKENS_HOT_MAX", "5000"))
         self.ready = False
         self.helius_key = os.getenv("HELIUS_API_KEY", "")
+        self.fetched: "OrderedDict[str, None]" = OrderedDict()  # mints hors liste Jupiter (Helius/snapshot), seuls évinçables
+        self.by_symbol: Dict[str, object] = {}  # ticker minuscule -> mint, ou tuple de mints si plusieurs
+        self.verified: set[str] = set()          # mints taggés verified/strict dans la liste Jupiter
+
+    def put(self, mint: str, md: dict, verified: bool = False):
+        """Range une metadata et tient l'index des tickers à jour (pas de reconstruction)."""
+        old = self.by_mint.get(mint)
+        if old is not None and old.get("symbol") != md.get("symbol"):
+            self._unindex(mint, old)
+        self.by_mint[mint] = md
+        if verified:
+            self.verified.add(mint)
+        sym = (md.get("symbol") or "").lower()
+        if not sym:
+            return
+        cur = self.by_symbol.get(sym)
+        if cur is None:
+            self.by_symbol[sym] = mint
+        elif isinstance(cur, str):
+            if cur != mint:
+                self.by_symbol[sym] = (cur, mint)
+        elif mint not in cur:  # type: ignore[operator]
+            self.by_symbol[sym] = cur + (mint,)  # type: ignore[operator]
+
+    def _unindex(self, mint: str, md: dict):
+        sym = (md.get("symbol") or "").lower()
+        cur = self.by_symbol.get(sym)
+        if cur == mint:
+            del self.by_symbol[sym]
+        elif isinstance(cur, tuple) and mint in cur:
+            rest = tuple(m for m in cur if m != mint)
+            self.by_symbol[sym] = rest[0] if len(rest) == 1 else rest
+
+    def find_symbol(self, sym: str) -> Tuple[Optional[str], List[str]]:
+        """
+        (mint, candidats) d'un ticker. Un seul mint, ou un seul verified/strict
+        parmi plusieurs → résolu ; sinon mint None et la liste des candidats.
+        """
+        cur = self.by_symbol.get(sym.lower().lstrip("$"))
+        if cur is None:
+            return None, []
+        if isinstance(cur, str):
+            return cur, [cur]
+        cands = list(cur)  # type: ignore[call-overload]
+        verified = [m for m in cands if m in self.verified]
+        return (verified[0] if len(verified) == 1 else None), cands
 
     async def warm(self, session: aiohttp.ClientSession):
         if self.ready:
@@ -999,17 +1694,26 @@ class TokenMetaCache:
                     for t in data:
                         mint = t.get("address")
                         if mint:
-                            self.by_mint[mint] = {
+                            self.fetched.pop(mint, None)
+                            tags = t.get("tags") or ()
+                            self.put(mint, {
                                 "symbol": t.get("symbol") or "",
                                 "name": t.get("name") or "",
                                 "logo": t.get("logoURI") or "",
                                 "decimals": t.get("decimals"),
-                            }
+                            }, verified="verified" in tags or "strict" in tags)
         except Exception as e:
             logger.warning("Jupiter list load failed: %s", e)
         self.ready = True
 
+    def touch(self, mint: str):
+        self.hot.pop(mint, None)
+        self.hot[mint] = None
+        if len(self.hot) > self.hot_max:
+            self.hot.pop(next(iter(self.hot)))
+
     async def get(self, session: aiohttp.ClientSession, mint: str) -> dict:
+        self.touch(mint)
         if mint in self.by_mint:
             return self.by_mint[mint]
         if self.helius_key:
@@ -1021,15 +1725,121 @@ class TokenMetaCache:
                         if arr and isinstance(arr, list) and arr[0]:
                             md = arr[0]
                             out = {"symbol": (md.get("symbol") or "")[:16], "name": (md.get("name") or "")[:64], "logo": md.get("logo") or ""}
-                            self.by_mint[mint] = out
+                            self.put(mint, out)
+                            self.fetched[mint] = None
                             return out
             except Exception as e:
                 logger.warning("Helius metadata failed: %s", e)
         out = {"symbol": "", "name": "", "logo": ""}
-        self.by_mint[mint] = out
+        self.put(mint, out)
+        self.fetched[mint] = None
         return out
 
+    def evict_fetched(self, fraction: float) -> int:
+        """Oublie les plus anciennes metadata obtenues à la demande (re-demandées au besoin) ; la liste Jupiter reste."""
+        n = min(len(self.fetched), max(1, int(len(self.fetched) * fraction)))
+        for _ in range(n):
+            mint, _ = self.fetched.popitem(last=False)
+            md = self.by_mint.pop(mint, None)
+            if md is not None:
+                self._unindex(mint, md)
+            self.hot.pop(mint, None)
+        return n
+
 TOKENS = TokenMetaCache()
+LOGO_FILE_IDS: Dict[str, str] = {}  # logo_url -> file_id Telegram (réutilisé pour send_photo)
+
+# ── Cotations DEX (tokens SPL hors CoinGecko, !convert) ───────────────────────
+QUOTE_TTL      = float(os.getenv("QUOTE_TTL", "20"))        # même mint coté dans ce délai = 0 appel
+QUOTE_STALE    = float(os.getenv("QUOTE_STALE", "600"))     # si la source échoue, une cote plus jeune sert encore
+QUOTE_BATCH_MS = float(os.getenv("QUOTE_BATCH_MS", "30"))   # fenêtre de regroupement des mints demandés
+QUOTE_MAX      = 5000
+
+class DexScreenerQuotes:
+    """Prix USD du pair le plus liquide où le mint est le token de base."""
+    name = "dexscreener"
+    max_ids = 30
+
+    async def fetch(self, session: aiohttp.ClientSession, mints: List[str]) -> Dict[str, float]:
+        url = "https://api.dexscreener.com/tokens/v1/solana/" + ",".join(mints)
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as r:
+            r.raise_for_status()
+            pairs = await r.json()
+        best: Dict[str, Tuple[float, float]] = {}  # mint -> (liquidité, prix)
+        for p in pairs or []:
+            mint = (p.get("baseToken") or {}).get("address")
+            try:
+                px = float(p.get("priceUsd") or 0)
+                liq = float((p.get("liquidity") or {}).get("usd") or 0)
+            except (TypeError, ValueError):
+                continue
+            if mint and px > 0 and liq >= best.get(mint, (-1.0, 0.0))[0]:
+                best[mint] = (liq, px)
+        return {m: px for m, (_liq, px) in best.items()}
+
+class QuoteCache:
+    """
+    Prix USD par mint, TTL court. Les mints manquants sont regroupés sur
+    QUOTE_BATCH_MS et cotés en une requête à la source (max_ids par appel) ;
+    un mint déjà demandé partage le fetch en cours. `source` est remplaçable
+    (tests, autre agrégateur) : tout objet avec max_ids et fetch(session, mints).
+    """
+
+    def __init__(self, source, max_size: int):
+        self.source = source
+        self.max_size = max_size
+        self.by_mint: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # mint -> (prix USD, fetched_at)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush: Optional[asyncio.Task] = None
+        self.upstream = 0
+
+    async def _flush_after(self):
+        await asyncio.sleep(QUOTE_BATCH_MS / 1000)
+        pend, self._pending = self._pending, {}
+        self._flush = None  # les demandes arrivées pendant le fetch partent dans le lot suivant
+        mints = list(pend)
+        found: Dict[str, float] = {}
+        try:
+            async with aiohttp.ClientSession() as session:
+                for i in range(0, len(mints), self.source.max_ids):
+                    self.upstream += 1
+                    found.update(await self.source.fetch(session, mints[i:i + self.source.max_ids]))
+        except Exception as e:
+            logger.warning("%s quotes failed (%d mints): %s", getattr(self.source, "name", "dex"), len(mints), e)
+        now = time.time()
+        for mint, fut in pend.items():
+            px = found.get(mint)
+            if px is not None:
+                self.by_mint[mint] = (px, now)
+                self.by_mint.move_to_end(mint)
+            else:
+                old = self.by_mint.get(mint)
+                px = old[0] if old and now - old[1] < QUOTE_STALE else None
+            if not fut.done():
+                fut.set_result(px)
+        while len(self.by_mint) > self.max_size:
+            self.by_mint.popitem(last=False)
+
+    async def get(self, mint: str) -> Optional[float]:
+        hit = self.by_mint.get(mint)
+        if hit is not None and time.time() - hit[1] < QUOTE_TTL:
+            return hit[0]
+        fut = self._pending.get(mint)
+        if fut is None:
+            fut = self._pending[mint] = asyncio.get_running_loop().create_future()
+            if self._flush is None or self._flush.done():
+                self._flush = asyncio.create_task(self._flush_after())
+        return await asyncio.shield(fut)
+
+QUOTES = QuoteCache(DexScreenerQuotes(), QUOTE_MAX)
+
+_first_alert_at: Optional[float] = None
+
+def note_alert_sent():
+    global _first_alert_at
+    if _first_alert_at is None:
+        _first_alert_at = time.monotonic() - PROCESS_T0
+        logger.info("first alert sent at +%.2fs after process start", _first_alert_at)
 
 # ── Delta computation ─────────────────────────────────────────────────────────
 def _ui_to_float(ui_amount: dict) -> float:
@@ -1093,29 +1903,130 @@ def compute_deltas_and_new(tx: dict, owner: str):
 
     return token_deltas, sol_delta, newly_received
 
-async def build_summary_and_media(session: aiohttp.ClientSession, owner: str, tx: dict, st_chat_cfg: dict):
-    token_deltas, sol_delta, newly_received = compute_deltas_and_new(tx, owner)
-    positives = {m: a for m, a in token_deltas.items() if a > 0}
-    negatives = {m: -a for m, a in token_deltas.items() if a < 0}
+# ── Valorisation fiat (jamais bloquante) ──────────────────────────────────────
+ALERT_PRICE_MAX_AGE = float(os.getenv("ALERT_PRICE_MAX_AGE", "300"))  # prix SOL plus vieux → valeur omise
 
-    if not positives and abs(sol_delta) < 1e-12 and not newly_received:
+def sol_fiat_price(fiat: str) -> Optional[float]:
+    """Prix du SOL en mémoire, ou None s'il est absent/trop vieux (on n'attend jamais le réseau)."""
+    hit = PRICES.get(CG_IDS["sol"], fiat)
+    if not hit or hit[1] > ALERT_PRICE_MAX_AGE:
+        return None
+    return hit[0]
+
+def fmt_price(x: float) -> str:
+    """Prix unitaire lisible, y compris pour les memecoins à 0.0000xx."""
+    if x >= 1:
+        return f"{x:,.2f}"
+    if x <= 0:
+        return "0"
+    digits = 2
+    while x < 10 ** -digits and digits < 12:
+        digits += 1
+    return f"{x:.{digits + 2}f}"
+
+def fiat_suffix(sol_amt: float) -> str:
+    usd, eur = sol_fiat_price("usd"), sol_fiat_price("eur")
+    parts = []
+    if usd: parts.append(f"${fmt_amount(sol_amt * usd)}")
+    if eur: parts.append(f"{fmt_amount(sol_amt * eur)} €")
+    return f" (≈ {' / '.join(parts)})" if parts else ""
+
+def unit_price_line(sol_amt: float, token_amt: float, supply: Optional[float] = None) -> str:
+    if sol_amt <= 0 or token_amt <= 0:
+        return ""
+    px_sol = sol_amt / token_amt
+    line = f"Prix/token: <code>{fmt_price(px_sol)} SOL</code>"
+    usd = sol_fiat_price("usd")
+    if usd:
+        line += f" (≈ <code>${fmt_price(px_sol * usd)}</code>)"
+    if supply:
+        # même format que !riskcalc (k/m/b) pour pouvoir copier la MC d'entrée
+        mc_sol = px_sol * supply
+        line += f"\nMC: <code>{fmt_amount(mc_sol * usd)}</code> $ (≈ {fmt_amount(mc_sol)} SOL)" if usd else f"\nMC: <code>{fmt_amount(mc_sol)}</code> SOL"
+    return line
+
+def owner_signed(tx: dict, owner: str) -> bool:
+    """Le wallet a-t-il signé la tx ? (absent des clés = simple destinataire, ex: airdrop sur son ATA)"""
+    message = (tx.get("transaction") or {}).get("message") or {}
+    n_signers = (message.get("header") or {}).get("numRequiredSignatures")
+    for i, k in enumerate(message.get("accountKeys") or []):
+        if isinstance(k, dict):
+            if k.get("pubkey") == owner:
+                return bool(k.get("signer"))
+        elif k == owner:
+            return n_signers is None or i < n_signers
+    return False
+
+class SwapEvent:
+    """Lecture d'une tx pour un wallet, faite une fois et partagée par tous les chats (règles + rendu)."""
+
+    __slots__ = ("owner", "sig", "ts", "failed", "signed", "sol_delta", "newly_received", "bought_mint", "bought_amt",
+                 "sold_mint", "sold_amt", "target_mint", "side", "age", "age_exact")
+
+    def __init__(self, tx: dict, owner: str):
+        self.owner = owner
+        self.sig = (tx.get("transaction", {}).get("signatures") or [None])[0]
+        self.signed = owner_signed(tx, owner)
+        self.ts = float(tx.get("blockTime") or time.time())
+        self.failed = (tx.get("meta") or {}).get("err") is not None
+        self.age: Optional[float] = None  # âge du token (s), résolu seulement si une règle maxage le demande
+        self.age_exact = False            # False: `age` n'est qu'un minimum (historique non parcouru jusqu'au bout)
+        token_deltas: Dict[str, float] = {}
+        self.sol_delta = 0.0
+        self.newly_received: set[str] = set()
+        if not self.failed:
+            token_deltas, self.sol_delta, self.newly_received = compute_deltas_and_new(tx, owner)
+        positives = {m: a for m, a in token_deltas.items() if a > 0}
+        negatives = {m: -a for m, a in token_deltas.items() if a < 0}
+        # plus gros delta positif = acheté, plus gros négatif = vendu
+        self.bought_mint, self.bought_amt = max(positives.items(), key=lambda x: x[1]) if positives else (None, 0.0)
+        self.sold_mint, self.sold_amt = max(negatives.items(), key=lambda x: x[1]) if negatives else (None, 0.0)
+        self.target_mint = self.bought_mint or (next(iter(self.newly_received)) if self.newly_received else None)
+        if self.bought_mint and self.sol_delta < -1e-9:
+            self.side = "buy"
+        elif self.sold_mint and self.sol_delta > 1e-9:
+            self.side = "sell"
+        else:
+            self.side = None
+
+    @property
+    def empty(self) -> bool:
+        return not self.failed and not self.bought_mint and abs(self.sol_delta) < 1e-12 and not self.newly_received
+
+    @property
+    def mint(self) -> Optional[str]:
+        return self.target_mint or self.sold_mint
+
+    def value(self, fiat: str) -> Optional[float]:
+        """SOL échangés en fiat (prix en mémoire), None si pas de jambe SOL ou prix absent."""
+        px = sol_fiat_price(fiat)
+        return abs(self.sol_delta) * px if px and self.side else None
+
+async def build_summary_and_media(session: aiohttp.ClientSession, owner: str, tx: dict, st_chat_cfg: dict,
+                                  ev: Optional[SwapEvent] = None):
+    ev = ev or SwapEvent(tx, owner)
+    sig = ev.sig
+    if ev.failed:
+        lines = ["❌ <b>Tx échouée</b>", f"Wallet: <code>{owner}</code>"]
+        if sig:
+            lines.append(solscan_tx(sig))
+        return "\n".join(lines), None, None, None
+    if ev.empty:
         return None, None, None, None
 
-    # Biggest positive as bought
-    bought_mint, bought_amt = (None, 0.0)
-    if positives:
-        bought_mint, bought_amt = max(positives.items(), key=lambda x: x[1])
+    sol_delta = ev.sol_delta
+    bought_mint, bought_amt = ev.bought_mint, ev.bought_amt
+    s_mint, s_amt = ev.sold_mint, ev.sold_amt
 
     # sold in SOL or token
     sold_desc = None
     if sol_delta < -1e-9:
         sold_desc = f"{abs(sol_delta):.6f} SOL"
-    elif negatives:
-        s_mint, s_amt = max(negatives.items(), key=lambda x: x[1])
+    elif s_mint:
         sold_desc = f"{s_amt:.6f} (mint: {s_mint})"
 
     # choose target mint for metadata & image
-    target_mint = bought_mint or (next(iter(newly_received)) if newly_received else None)
+    target_mint = ev.target_mint
     logo_url = None
     meta_line = ""
     if target_mint:
@@ -1139,15 +2050,26 @@ async def build_summary_and_media(session: aiohttp.ClientSession, owner: str, tx
         title = "🚀 <b>Nouvelle pool détectée</b>"
 
     # build body
+    http_url = str(st_chat_cfg.get("http_rpc") or default_http_rpc())
     lines = [title, f"Wallet: <code>{owner}</code>"]
+    # valeur fiat + prix implicite depuis les deltas SOL/token (prix SOL en mémoire uniquement)
     if bought_mint and sold_desc:
-        lines.append(f"SWAP | Acheté: <code>{bought_amt:.6f}</code> (mint/CA: <code>{bought_mint}</code>) | Vendu: <code>{sold_desc}</code>{meta_line}")
+        value = fiat_suffix(abs(sol_delta)) if sol_delta < -1e-9 else ""
+        lines.append(f"SWAP | Acheté: <code>{bought_amt:.6f}</code> (mint/CA: <code>{bought_mint}</code>) | Vendu: <code>{sold_desc}</code>{value}{meta_line}")
+        if sol_delta < -1e-9:
+            supply = await SUPPLY.get(http_url, bought_mint, SUPPLY_ALERT_WAIT)
+            px = unit_price_line(abs(sol_delta), bought_amt, supply)
+            if px: lines.append(px)
     elif bought_mint:
         lines.append(f"SWAP | Reçu: <code>{bought_amt:.6f}</code> (mint/CA: <code>{bought_mint}</code>){meta_line}")
+    elif s_mint and sol_delta > 1e-9:
+        lines.append(f"SWAP | Vendu: <code>{s_amt:.6f}</code> (mint/CA: <code>{s_mint}</code>) | Reçu: <code>{sol_delta:.6f} SOL</code>{fiat_suffix(sol_delta)}")
+        supply = await SUPPLY.get(http_url, s_mint, SUPPLY_ALERT_WAIT)
+        px = unit_price_line(sol_delta, s_amt, supply)
+        if px: lines.append(px)
     elif is_new_for_wallet and target_mint:
         lines.append(f"NOUVEAU | Reçu: (mint/CA: <code>{target_mint}</code>){meta_line}")
 
-    sig = (tx.get("transaction", {}).get("signatures") or [None])[0]
     if sig:
         lines.append(solscan_tx(sig))
 
@@ -1160,133 +2082,1199 @@ async def rpc_post(session: aiohttp.ClientSession, url: str, method: str, params
         resp.raise_for_status()
         return await resp.json()
 
+# Budget de requêtes par endpoint HTTP, partagé par tout ce qui tape le RPC.
+RPC_RPS   = float(os.getenv("RPC_RPS", "10"))
+RPC_BURST = float(os.getenv("RPC_BURST", "40"))
+_rpc_budgets: Dict[str, TokenBucket] = {}
+
+def rpc_budget(url: str) -> TokenBucket:
+    bucket = _rpc_budgets.get(url)
+    if bucket is None:
+        bucket = _rpc_budgets[url] = TokenBucket(RPC_RPS, RPC_BURST)
+    return bucket
+
+async def rpc_batch(session: aiohttp.ClientSession, url: str, calls: List[Tuple[str, list]]) -> List[Optional[object]]:
+    """Requête JSON-RPC batch ; résultats dans l'ordre des appels (None si erreur)."""
+    if not calls:
+        return []
+    await rpc_budget(url).take(len(calls))
+    payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+    async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    out: List[Optional[object]] = [None] * len(calls)
+    for item in data if isinstance(data, list) else []:
+        idx = item.get("id")
+        if isinstance(idx, int) and 0 <= idx < len(out):
+            out[idx] = item.get("result")
+    return out
+
+TX_OPTS = {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}
+
 async def fetch_tx(session: aiohttp.ClientSession, http_url: str, signature: str):
     try:
-        data = await rpc_post(session, http_url, "getTransaction",
-                              [signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}])
+        await rpc_budget(http_url).take()
+        data = await rpc_post(session, http_url, "getTransaction", [signature, TX_OPTS])
         return data.get("result")
     except Exception:
         return None
 
+async def fetch_txs_batch(session: aiohttp.ClientSession, http_url: str, signatures: List[str]) -> List[Optional[dict]]:
+    return await rpc_batch(session, http_url, [("getTransaction", [sig, TX_OPTS]) for sig in signatures])  # type: ignore[return-value]
+
+# ── Supply des tokens (market cap des alertes) ────────────────────────────────
+SUPPLY_TTL        = float(os.getenv("SUPPLY_TTL", "3600"))     # au-delà: rafraîchi en fond, l'ancienne valeur sert
+SUPPLY_WAIT       = float(os.getenv("SUPPLY_WAIT", "1.5"))     # attente max pour un mint jamais vu (commandes)
+SUPPLY_BATCH_MS   = float(os.getenv("SUPPLY_BATCH_MS", "30"))  # fenêtre de regroupement des mints manquants
+# idem sur une alerte : de quoi laisser partir le lot (SUPPLY_BATCH_MS) et revenir un appel RPC,
+# pas plus ; au-delà la MC est omise et servira aux suivantes. 0 = ne jamais attendre
+SUPPLY_ALERT_WAIT = float(os.getenv("SUPPLY_ALERT_WAIT", "0.4"))
+if 0 < SUPPLY_ALERT_WAIT < SUPPLY_BATCH_MS / 1000:
+    SUPPLY_ALERT_WAIT = SUPPLY_BATCH_MS / 1000 + 0.2  # plus court que la fenêtre : la réponse ne pourrait jamais arriver à temps
+SUPPLY_MAX        = int(os.getenv("SUPPLY_MAX", "20000"))
+
+class SupplyCache:
+    """
+    Supply (décimales appliquées) par mint. Les mints manquants ou périmés sont
+    regroupés sur une courte fenêtre puis lus en un getMultipleAccounts
+    (jsonParsed, 100 comptes/appel), getTokenSupply en batch pour le reste.
+    Un mint déjà en cache ne coûte aucun appel RPC. Les lots partent sur une
+    session propre au cache : celle de l'appelant peut être fermée entre-temps.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.by_mint: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # mint -> (supply, fetched_at)
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}  # url -> mint -> future
+        self._flush: Dict[str, asyncio.Task] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.fetched = 0
+
+    def _http(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def peek(self, mint: str) -> Optional[float]:
+        """Supply en cache et encore fraîche, sans jamais lancer de lecture."""
+        hit = self.by_mint.get(mint)
+        return hit[0] if hit is not None and time.time() - hit[1] <= SUPPLY_TTL else None
+
+    def put(self, mint: str, supply: float):
+        """Supply lue ailleurs (ex. !check) : les alertes suivantes n'auront pas à la redemander."""
+        self.by_mint[mint] = (supply, time.time())
+        self.by_mint.move_to_end(mint)
+        if len(self.by_mint) > self.max_size:
+            self.by_mint.popitem(last=False)
+
+    def _request(self, url: str, mint: str) -> asyncio.Future:
+        pend = self._pending.setdefault(url, {})
+        fut = pend.get(mint)
+        if fut is None:
+            fut = pend[mint] = asyncio.get_running_loop().create_future()
+            task = self._flush.get(url)
+            if task is None or task.done():
+                self._flush[url] = asyncio.create_task(self._flush_after(url))
+        return fut
+
+    async def _flush_after(self, url: str):
+        await asyncio.sleep(SUPPLY_BATCH_MS / 1000)
+        pend = self._pending.pop(url, {})
+        self._flush.pop(url, None)  # les demandes arrivées pendant le fetch partent dans le lot suivant
+        mints = list(pend)
+        found: Dict[str, float] = {}
+        try:
+            session = self._http()
+            for i in range(0, len(mints), 100):
+                chunk = mints[i:i + 100]
+                await rpc_budget(url).take()
+                data = await rpc_post(session, url, "getMultipleAccounts", [chunk, {"encoding": "jsonParsed"}])
+                values = ((data or {}).get("result") or {}).get("value") or []
+                for mint, acc in zip(chunk, values):
+                    raw = (acc or {}).get("data")
+                    info = (raw.get("parsed") or {}).get("info") if isinstance(raw, dict) else None
+                    if info and info.get("supply") is not None:
+                        found[mint] = int(info["supply"]) / (10 ** int(info.get("decimals") or 0))
+            rest = [m for m in mints if m not in found]
+            if rest:
+                for mint, res in zip(rest, await rpc_batch(session, url, [("getTokenSupply", [m]) for m in rest])):
+                    val = (res or {}).get("value") if isinstance(res, dict) else None
+                    if val and val.get("amount") is not None:
+                        found[mint] = int(val["amount"]) / (10 ** int(val.get("decimals") or 0))
+        except Exception as e:
+            logger.warning("supply fetch failed (%d mints): %s", len(mints), e)
+        for mint, fut in pend.items():
+            supply = found.get(mint)
+            if supply is not None:
+                self.put(mint, supply)
+                self.fetched += 1
+            if not fut.done():
+                fut.set_result(supply)
+
+    async def get(self, url: str, mint: str, wait: float = SUPPLY_WAIT) -> Optional[float]:
+        hit = self.by_mint.get(mint)
+        if hit is not None:
+            if time.time() - hit[1] > SUPPLY_TTL:
+                self._request(url, mint)  # stale-while-revalidate
+            return hit[0]
+        fut = self._request(url, mint)
+        if wait <= 0:
+            return None  # lecture lancée, le prochain appel aura la valeur
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), wait)
+        except (asyncio.TimeoutError, Exception):
+            return None
+
+SUPPLY = SupplyCache(SUPPLY_MAX)
+
+# ── WS subscriptions (pipelinées, ack suivis) ─────────────────────────────────
+WS_SUB_RATE    = float(os.getenv("WS_SUB_RATE", "40"))    # (un)subscribe / s envoyés au provider
+WS_SUB_BURST   = int(os.getenv("WS_SUB_BURST", "80"))
+WS_ACK_TIMEOUT = float(os.getenv("WS_ACK_TIMEOUT", "15"))  # pas de réponse → on retente
+WS_RETRY_MAX   = float(os.getenv("WS_RETRY_MAX", "60"))    # backoff max entre deux essais (s)
+
+TRACKER_CHANGED = asyncio.Event()  # set à chaque changement de state (watch/unwatch/reload)
+WS_SUBS: Optional["WsSubscriptions"] = None  # connexion courante (pour !stats)
+
+def notify_tracker_change():
+    TRACKER_CHANGED.set()
+
+def watched_wallets() -> set[str]:
+    out: set[str] = set()
+    for cfg in TRACKER_STATE.values():
+        out |= set((cfg.get("subs") or {}).keys())
+    return out
+
+def watched_mints() -> set[str]:
+    out: set[str] = set()
+    for cfg in TRACKER_STATE.values():
+        out |= set((cfg.get("mints") or {}).keys())
+    return out
+
+def watched_addresses() -> set[str]:
+    """Tout ce qu'on abonne en logsSubscribe (wallets + mints)."""
+    return watched_wallets() | watched_mints()
+
+def default_http_rpc() -> str:
+    return str(next(iter(TRACKER_STATE.values())).get("http_rpc")) if TRACKER_STATE else os.getenv("SOLANA_RPC", "https://api.mainnet-beta.solana.com")
+
+class WsSubscriptions:
+    """
+    Abonnements logsSubscribe d'une connexion WS : ids JSON-RPC stables,
+    envois pipelinés (sans attendre chaque ack) et limités en débit, acks
+    rapprochés des requêtes, échecs retentés avec backoff.
+    """
+
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse, bucket: TokenBucket):
+        self.ws = ws
+        self.bucket = bucket
+        self._next_id = 0
+        self.pending: Dict[int, Tuple[str, str, float]] = {}  # req_id -> (method, addr, sent_at)
+        self.pending_addrs: set[str] = set()
+        self.sub_by_addr: Dict[str, int] = {}
+        self.addr_by_sub: Dict[int, str] = {}
+        self.attempts: Dict[str, int] = {}
+        self.retry_at: Dict[str, float] = {}
+        self.failed = 0
+        self.last_error = ""
+
+    async def _send(self, method: str, addr: str, params: list):
+        await self.bucket.take()
+        self._next_id += 1
+        req_id = self._next_id
+        self.pending[req_id] = (method, addr, time.monotonic())
+        self.pending_addrs.add(addr)
+        await self.ws.send_str(json.dumps({"jsonrpc": "2.0", "id": req_id, "method": method, "params": params}))
+
+    async def reconcile(self):
+        sync_mint_aggregators()
+        want = watched_addresses()
+        now = time.monotonic()
+        for addr in list(self.sub_by_addr):
+            if addr not in want and addr not in self.pending_addrs:
+                await self._send("logsUnsubscribe", addr, [self.sub_by_addr[addr]])
+        for addr in want:
+            if addr in self.sub_by_addr or addr in self.pending_addrs:
+                continue
+            if self.retry_at.get(addr, 0.0) > now:
+                continue
+            await self._send("logsSubscribe", addr, [{"mentions": [addr]}, {"commitment": "confirmed"}])
+
+    def _failed(self, addr: str, reason: str):
+        n = self.attempts.get(addr, 0) + 1
+        self.attempts[addr] = n
+        self.retry_at[addr] = time.monotonic() + min(WS_RETRY_MAX, 2.0 ** n)
+        self.failed += 1
+        self.last_error = reason
+        logger.warning("logsSubscribe %s failed (try %d): %s", short_pk(addr), n, reason)
+
+    def on_reply(self, data: dict) -> bool:
+        """Traite une réponse JSON-RPC (ack). Retourne False si ce n'en est pas une."""
+        req_id = data.get("id")
+        if req_id is None or req_id not in self.pending:
+            return False
+        method, addr, _sent = self.pending.pop(req_id)
+        self.pending_addrs.discard(addr)
+        if "error" in data:
+            if method == "logsSubscribe":
+                self._failed(addr, str((data.get("error") or {}).get("message") or data.get("error")))
+            return True
+        if method == "logsSubscribe":
+            sub_id = data.get("result")
+            self.sub_by_addr[addr] = sub_id
+            self.addr_by_sub[sub_id] = addr
+            self.attempts.pop(addr, None)
+            self.retry_at.pop(addr, None)
+        else:
+            sub_id = self.sub_by_addr.pop(addr, None)
+            self.addr_by_sub.pop(sub_id, None)
+        return True
+
+    def expire_pending(self):
+        limit = time.monotonic() - WS_ACK_TIMEOUT
+        for req_id, (method, addr, sent) in list(self.pending.items()):
+            if sent < limit:
+                self.pending.pop(req_id, None)
+                self.pending_addrs.discard(addr)
+                if method == "logsSubscribe":
+                    self._failed(addr, "ack timeout")
+
+    async def sync_loop(self):
+        """Réagit aux changements de state (et retente les échecs), sans attendre de message WS."""
+        while True:
+            try:
+                await asyncio.wait_for(TRACKER_CHANGED.wait(), timeout=2.0)
+            except asyncio.TimeoutError:
+                pass
+            TRACKER_CHANGED.clear()
+            self.expire_pending()
+            await self.reconcile()
+
+    def refused(self) -> bool:
+        """L'endpoint refuse logsSubscribe (plan HTTP-only, méthode désactivée…)."""
+        return self.failed >= WS_FAILS_BEFORE_POLL and not self.sub_by_addr
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribed": len(self.sub_by_addr), "pending": len(self.pending), "failed": self.failed}
+
+# ── Filtre pré-fetch (sur la notification seule, avant getTransaction) ────────
+# Chaque getTransaction coûte : on jette d'abord ce qu'on peut décider avec
+# `err` + les logs. Règles actives: TX_FILTER_RULES (liste séparée par des virgules).
+TX_FILTER_RULES = {r.strip() for r in os.getenv("TX_FILTER_RULES", "failed,sol_transfer,close_only,vote").split(",") if r.strip()}
+FILTER_STATS: Dict[str, int] = {}  # raison -> nb (+ "passed")
+
+PROGRAM_INVOKE_RE = re.compile(r"^Program (\w+) invoke \[\d+\]")
+INSTRUCTION_RE    = re.compile(r"^Program log: Instruction: (\w+)")
+SYSTEM_PROGRAMS = {
+    "11111111111111111111111111111111",               # System
+    "ComputeBudget111111111111111111111111111111",     # Compute budget
+    "MemoSq4gqABAXKb96qnH8TysNcWxMyWCqXgDLGmfcHr",     # Memo v2
+    "Memo1UhkJRfHyvLMcVucJwxXeuD6YVTCCLfaKTvMsmZz",     # Memo v1
+}
+TOKEN_PROGRAMS = {
+    "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA",     # SPL Token
+    "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb",     # Token-2022
+    "ATokenGPvbdGVxr1b2hv2fuA6zgKyQ6hRAWTp1mNgsHh3cHT", # Associated token account
+}
+VOTE_PROGRAM = "Vote111111111111111111111111111111111111111"
+CLOSE_ONLY_INSTRUCTIONS = {"CloseAccount", "SyncNative", "Burn", "BurnChecked"}
+
+def _count_filter(reason: str):
+    FILTER_STATS[reason] = FILTER_STATS.get(reason, 0) + 1
+
+def chats_want_failed(owners: set[str]) -> bool:
+    for cfg in TRACKER_STATE.values():
+        if cfg.get("show_failed") and owners.intersection((cfg.get("subs") or {}).keys()):
+            return True
+    return False
+
+def prefilter_tx(err: object, logs: Optional[List[str]], owners: set[str]) -> Optional[str]:
+    """Raison de rejet (compte dans FILTER_STATS), ou None si la tx mérite un getTransaction."""
+    reason = None
+    if err is not None and "failed" in TX_FILTER_RULES and not chats_want_failed(owners):
+        reason = "failed"
+    elif logs:
+        programs: set[str] = set()
+        instructions: set[str] = set()
+        for line in logs:
+            m = PROGRAM_INVOKE_RE.match(line)
+            if m:
+                programs.add(m.group(1))
+                continue
+            m = INSTRUCTION_RE.match(line)
+            if m:
+                instructions.add(m.group(1))
+        if "vote" in TX_FILTER_RULES and VOTE_PROGRAM in programs:
+            reason = "vote"
+        elif "sol_transfer" in TX_FILTER_RULES and programs and programs <= SYSTEM_PROGRAMS:
+            reason = "sol_transfer"  # simple transfert SOL / memo, pas un swap
+        elif ("close_only" in TX_FILTER_RULES and programs and programs <= SYSTEM_PROGRAMS | TOKEN_PROGRAMS
+              and instructions and instructions <= CLOSE_ONLY_INSTRUCTIONS):
+            reason = "close_only"  # récupération de rent / burn (incinerator…)
+    _count_filter(reason or "passed")
+    return reason
+
+# ── Règles de filtrage par chat (compilées) ───────────────────────────────────
+# Texte de règles stocké par chat (cfg["rules"]), compilé une fois en une liste
+# de prédicats sur SwapEvent ; recompilé seulement quand le texte change.
+RULES_SYNTAX   = "buys | sells | allow=CA,CA | deny=CA,CA | maxage=30m | minusd=50 | mineur=50"
+MINT_AGE_PAGES = int(os.getenv("MINT_AGE_PAGES", "3"))  # pages de 1000 signatures max pour dater un mint
+MINT_AGE_MAX   = int(os.getenv("MINT_AGE_MAX", "20000"))
+
+class ChatRules:
+    """Prédicats compilés d'un chat (les moins chers d'abord) + compteurs par règle."""
+
+    __slots__ = ("src", "checks", "needs_age", "passed", "rejected")
+
+    def __init__(self, src: str, checks: List[Tuple[str, Callable[[SwapEvent], bool]]]):
+        self.src = src
+        self.checks = checks
+        self.needs_age = any(name == "maxage" for name, _pred in checks)
+        self.passed: Dict[str, int] = {name: 0 for name, _pred in checks}
+        self.rejected: Dict[str, int] = {name: 0 for name, _pred in checks}
+
+    def check(self, ev: SwapEvent) -> bool:
+        for name, pred in self.checks:
+            if not pred(ev):
+                self.rejected[name] += 1
+                return False
+            self.passed[name] += 1
+        return True
+
+_RULE_ORDER = {"buys": 0, "sells": 0, "allow": 1, "deny": 1, "minusd": 2, "mineur": 2, "maxage": 3}
+
+def compile_rules(src: str) -> ChatRules:
+    """Compile `buys minusd=50 deny=CA,...` ; ValueError (message affichable) si invalide."""
+    checks: List[Tuple[str, Callable[[SwapEvent], bool]]] = []
+    for tok in src.split():
+        key, _, val = tok.partition("=")
+        key = key.lower()
+        if key == "buys" and not val:
+            checks.append(("buys", lambda ev: ev.side == "buy"))
+        elif key == "sells" and not val:
+            checks.append(("sells", lambda ev: ev.side == "sell"))
+        elif key in ("allow", "deny") and val:
+            mints = frozenset(m for m in val.split(",") if m)
+            bad = [m for m in mints if not is_valid_pubkey(m)]
+            if bad:
+                raise ValueError(f"CA invalide: {bad[0]}")
+            if key == "allow":
+                checks.append(("allow", lambda ev, ms=mints: ev.mint in ms))
+            else:
+                checks.append(("deny", lambda ev, ms=mints: ev.mint not in ms))
+        elif key in ("minusd", "mineur") and val:
+            try:
+                floor = parse_amount(val)
+            except ValueError:
+                raise ValueError(f"montant invalide: {val}")
+            fiat = "usd" if key == "minusd" else "eur"
+            checks.append((key, lambda ev, f=fiat, lo=floor: (ev.value(f) or 0.0) >= lo))
+        elif key == "maxage" and val:
+            limit = parse_duration(val)
+            if limit is None:
+                raise ValueError(f"durée invalide: {val} (ex: 30m, 2h, 1d)")
+            checks.append(("maxage", lambda ev, lim=limit: ev.age is not None and ev.age_exact and ev.age <= lim))
+        else:
+            raise ValueError(f"règle inconnue: {tok}")
+    names = [name for name, _pred in checks]
+    if "buys" in names and "sells" in names:
+        raise ValueError("buys et sells s'excluent")
+    checks.sort(key=lambda c: _RULE_ORDER[c[0]])
+    return ChatRules(" ".join(src.split()), checks)
+
+_compiled_rules: Dict[int, ChatRules] = {}
+
+def chat_rules(chat_id: int, cfg: dict) -> Optional[ChatRules]:
+    src = cfg.get("rules") or ""
+    if not src:
+        return None
+    cr = _compiled_rules.get(chat_id)
+    if cr is None or cr.src != src:
+        try:
+            cr = _compiled_rules[chat_id] = compile_rules(src)
+        except ValueError as e:
+            logger.warning("rules for chat %s ignored: %s", chat_id, e)
+            return None
+    return cr
+
+class MintAgeCache:
+    """
+    Date de naissance d'un mint = plus ancienne signature du compte mint
+    (getSignaturesForAddress). Si MINT_AGE_PAGES pages pleines ne suffisent pas
+    à remonter jusqu'à la création, la plus ancienne vue n'est qu'un minimum :
+    on la garde marquée inexacte (le token a au moins cet âge).
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.birth: "OrderedDict[str, Tuple[float, bool]]" = OrderedDict()  # mint -> (blockTime, exact)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def store(self, mint: str, born: float, exact: bool):
+        self.birth[mint] = (born, exact)
+        self.birth.move_to_end(mint)
+        if len(self.birth) > self.max_size:
+            self.birth.popitem(last=False)
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, mint: str) -> Optional[Tuple[float, bool]]:
+        before = None
+        oldest = None
+        exact = False
+        try:
+            for _ in range(MINT_AGE_PAGES):
+                await rpc_budget(url).take()
+                opts: dict = {"limit": 1000}
+                if before:
+                    opts["before"] = before
+                data = await rpc_post(session, url, "getSignaturesForAddress", [mint, opts])
+                sigs = (data or {}).get("result") or []
+                if not sigs:
+                    break
+                before = sigs[-1].get("signature")
+                oldest = sigs[-1].get("blockTime") or oldest
+                if len(sigs) < 1000:
+                    exact = True
+                    break
+        except Exception as e:
+            logger.warning("mint age lookup failed for %s: %s", mint, e)
+            return None  # parcours interrompu : ni date ni minimum fiables
+        if not oldest:
+            return None
+        self.store(mint, float(oldest), exact)
+        return float(oldest), exact
+
+    async def age(self, session: aiohttp.ClientSession, url: str, mint: str) -> Optional[Tuple[float, bool]]:
+        """(âge en s, exact) ; exact=False → l'âge réel est au moins celui-ci."""
+        hit = self.birth.get(mint)
+        if hit is None:
+            task = self._inflight.get(mint)
+            if task is None:
+                task = self._inflight[mint] = asyncio.create_task(self._fetch(session, url, mint))
+                task.add_done_callback(lambda _t, m=mint: self._inflight.pop(m, None))
+            hit = await asyncio.shield(task)
+            if hit is None:
+                return None
+        born, exact = hit
+        return max(0.0, time.time() - born), exact
+
+MINT_AGES = MintAgeCache(MINT_AGE_MAX)
+
+# ── Index des mints spam / dust ───────────────────────────────────────────────
+SPAM_STORE        = os.getenv("SPAM_STORE", str(Path(TRACKER_STORE).with_name("spam_mints.bin")))
+SPAM_DUST_WALLETS = int(os.getenv("SPAM_DUST_WALLETS", "3"))     # wallets suivis dustés par le même mint…
+SPAM_DUST_WINDOW  = float(os.getenv("SPAM_DUST_WINDOW", "600"))  # … dans cette fenêtre (s) → mint marqué spam
+SPAM_DUST_TRACK   = 5000                                         # mints candidats suivis au plus
+
+class SpamIndex:
+    """
+    Mints à ignorer (airdrops de dust, faux « Nouvelle pool »), vérifiés en O(1)
+    avant metadata et envoi. auto = heuristiques, manual = ajoutés par un admin,
+    allow = faux positifs retirés par un admin (prioritaire sur auto).
+    auto vient du leader (fichier binaire : u32 + clés de 32 octets) ; manual et
+    allow vivent dans la base partagée du bail, versionnés comme l'état tracker,
+    pour qu'un `!spam` tapé sur n'importe quelle machine atteigne le leader.
+    """
+
+    def __init__(self, path: str, rules_db: str):
+        self.path = path
+        self.rules_db = rules_db
+        self.auto: set[str] = set()
+        self.manual: set[str] = set()
+        self.allow: set[str] = set()
+        self.version = 0  # version des règles admin qu'on a en mémoire
+        self.dust: Dict[str, Dict[str, float]] = {}  # mint -> wallet -> dernier reçu non sollicité
+        self.dirty = False
+        self.suppressed = 0
+        self.unsolicited = 0
+
+    def is_spam(self, mint: Optional[str]) -> bool:
+        return mint is not None and (mint in self.manual or (mint in self.auto and mint not in self.allow))
+
+    def judge(self, ev: SwapEvent) -> bool:
+        """True si l'alerte doit être supprimée ; nourrit au passage les heuristiques."""
+        mint = ev.target_mint
+        if self.is_spam(mint):
+            self.suppressed += 1
+            return True
+        if mint and not ev.signed and ev.side is None and abs(ev.sol_delta) < 1e-9 and mint in ev.newly_received:
+            # token reçu sans avoir signé ni échangé de SOL : transfert non sollicité
+            self.unsolicited += 1
+            self.suppressed += 1
+            self._note_dust(mint, ev.owner)
+            return True
+        return False
+
+    def _note_dust(self, mint: str, owner: str):
+        now = time.time()
+        wallets = self.dust.setdefault(mint, {})
+        wallets[owner] = now
+        for w in [w for w, t in wallets.items() if now - t > SPAM_DUST_WINDOW]:
+            del wallets[w]
+        if len(wallets) >= SPAM_DUST_WALLETS and mint not in self.allow:
+            self.auto.add(mint)
+            del self.dust[mint]
+            self.dirty = True
+            logger.info("spam mint flagged: %s (%d wallets dusted)", mint, len(wallets))
+        if len(self.dust) > SPAM_DUST_TRACK:
+            self.dust = {m: ws for m, ws in self.dust.items() if any(now - t <= SPAM_DUST_WINDOW for t in ws.values())}
+
+    # ── règles admin (base partagée) ──
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.rules_db, timeout=5.0, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS spam_rules (mint TEXT PRIMARY KEY, kind TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        return conn
+
+    def write_rules(self, rules: Dict[str, Optional[str]]) -> int:
+        """(thread) Applique {mint: 'manual' | 'allow' | None} et incrémente la version, en une transaction."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for mint, kind in rules.items():
+                if kind is None:
+                    conn.execute("DELETE FROM spam_rules WHERE mint = ?", (mint,))
+                else:
+                    conn.execute("INSERT INTO spam_rules (mint, kind) VALUES (?, ?) "
+                                 "ON CONFLICT(mint) DO UPDATE SET kind = excluded.kind", (mint, kind))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('spam_version', 1) "
+                         "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+            (version,) = conn.execute("SELECT value FROM meta WHERE key = 'spam_version'").fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return int(version)
+
+    def read_rules_if_newer(self, known: int) -> Optional[Tuple[int, set, set]]:
+        """(thread) (version, manual, allow) si les règles ont changé depuis `known`."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'spam_version'").fetchone()
+            version = int(row[0]) if row else 0
+            if version == known:
+                return None
+            rows = conn.execute("SELECT mint, kind FROM spam_rules").fetchall()
+        finally:
+            conn.close()
+        return (version,
+                {m for m, k in rows if k == "manual"},
+                {m for m, k in rows if k == "allow"})
+
+    def apply_rules(self, res: Optional[Tuple[int, set, set]]):
+        """(boucle) Remplace manual/allow par la photo lue dans la base."""
+        if res is None or res[0] <= self.version:
+            return
+        self.version, self.manual, self.allow = res
+
+    async def sync(self):
+        """Recharge les règles admin si une machine les a modifiées."""
+        try:
+            self.apply_rules(await asyncio.to_thread(self.read_rules_if_newer, self.version))
+        except Exception as e:
+            logger.warning("spam rules sync failed: %s", e)
+
+    async def edit(self, rules: Dict[str, Optional[str]]):
+        await asyncio.to_thread(self.write_rules, rules)
+        await self.sync()
+
+    # ── auto (fichier du leader) ──
+    def encode(self) -> bytes:
+        """(boucle) Photo de auto ; dirty retombe ici, un changement pendant l'écriture le relèvera."""
+        buf = bytearray()
+        for group in (self.auto, (), ()):  # manual/allow : vides, ils sont dans la base partagée
+            keys = [k for k in (b58decode(m) for m in group) if len(k) == 32]
+            buf += struct.pack("<I", len(keys))
+            buf += b"".join(keys)
+        self.dirty = False
+        return bytes(buf)
+
+    def write(self, data: bytes) -> bool:
+        """(thread) Écriture atomique du fichier."""
+        try:
+            tmp = Path(self.path + ".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(self.path)
+            return True
+        except Exception as e:
+            logger.warning("spam index save failed: %s", e)
+            return False
+
+    async def save(self):
+        if not await asyncio.to_thread(self.write, self.encode()):
+            self.dirty = True  # on retentera au prochain passage
+
+    def read_file(self) -> Tuple[set, set, set]:
+        """(thread) (auto, manual, allow) du fichier ; manual/allow ne servent qu'aux anciens fichiers."""
+        groups: Tuple[set, set, set] = (set(), set(), set())
+        if not os.path.exists(self.path):
+            return groups
+        raw = Path(self.path).read_bytes()
+        pos = 0
+        for group in groups:
+            (n,) = struct.unpack_from("<I", raw, pos)
+            pos += 4
+            group.update(b58encode(raw[pos + 32 * i:pos + 32 * (i + 1)]) for i in range(n))
+            pos += 32 * n
+        return groups
+
+    def load(self):
+        """(thread, démarrage) auto depuis le fichier, règles admin depuis la base partagée."""
+        try:
+            auto, manual, allow = self.read_file()
+            self.auto.update(auto)
+            if manual or allow:
+                # ancien format : les règles admin étaient dans le fichier, on les migre
+                rules: Dict[str, Optional[str]] = {m: "allow" for m in allow}
+                rules.update({m: "manual" for m in manual})
+                self.write_rules(rules)
+                self.dirty = True
+            self.apply_rules(self.read_rules_if_newer(-1))
+            logger.info("spam index restored: %d auto, %d manual, %d allowed", len(self.auto), len(self.manual), len(self.allow))
+        except Exception as e:
+            logger.warning("spam index load failed: %s", e)
+
+SPAM = SpamIndex(SPAM_STORE, TRACKER_LEASE_DB)
+
+# ── Écouteurs de swaps ────────────────────────────────────────────────────────
+# Même principe que register_command : chaque module (historique, PnL…) s'abonne
+# aux swaps analysés. Appelés une fois par (tx, wallet), hors spam et tx échouées ;
+# synchrones, ils doivent rester en mémoire (les I/O partent dans leurs boucles).
+SWAP_LISTENERS: List[Tuple[str, Callable[[SwapEvent], None]]] = []
+
+def register_swap_listener(name: str):
+    def deco(func: Callable[[SwapEvent], None]):
+        SWAP_LISTENERS.append((name, func))
+        return func
+    return deco
+
+def emit_swap(ev: SwapEvent):
+    for name, func in SWAP_LISTENERS:
+        try:
+            func(ev)
+        except Exception:
+            logger.exception("swap listener %s failed", name)
+
+# ── Analyse + dispatch (commun à toutes les sources) ──────────────────────────
+RECENT_SIGS_MAX = 512
+SEEN_MINTS_MAX  = int(os.getenv("SEEN_MINTS_MAX", "2000"))  # par wallet (launchonly), les plus anciens sortent
+_recent_sigs: Dict[str, Tuple[dict, set[str]]] = {}  # sig -> (tx, owners déjà traités)
+
+async def process_signature(app: Application, session: aiohttp.ClientSession, sig: str, owners: set[str],
+                            tx: Optional[dict] = None):
+    """getTransaction (une fois par signature, sauf si `tx` est fourni) puis alerte pour chaque wallet suivi concerné."""
+    if not sig or not owners:
+        return
+    hit = _recent_sigs.get(sig)
+    if hit:
+        tx, done = hit
+        owners = owners - done
+        if not owners:
+            return
+    else:
+        if tx is None:
+            tx = await fetch_tx(session, default_http_rpc(), sig)
+        if not tx:
+            return
+        done = set()
+        _recent_sigs[sig] = (tx, done)
+        if len(_recent_sigs) > RECENT_SIGS_MAX:
+            _recent_sigs.pop(next(iter(_recent_sigs)))
+    done |= owners
+    await route_tx(app, session, tx, owners)
+
+async def route_tx(app: Application, session: aiohttp.ClientSession, tx: dict, owners: set[str]):
+    # route to each chat
+    failed = (tx.get("meta") or {}).get("err") is not None
+    events: Dict[str, Optional[SwapEvent]] = {}  # une lecture de la tx par wallet, partagée entre chats (None = spam)
+    for chat_id, cfg in list(TRACKER_STATE.items()):  # des commandes peuvent ajouter un chat pendant nos await
+        subs = cfg.get("subs") or {}
+        owners_hit = owners.intersection(subs.keys())
+        if not owners_hit:
+            continue
+        if failed and not cfg.get("show_failed"):
+            continue
+        rules = chat_rules(chat_id, cfg)
+        for owner in owners_hit:
+            if owner in events:
+                ev = events[owner]
+            else:
+                ev = events[owner] = SwapEvent(tx, owner)
+                if not ev.empty and SPAM.judge(ev):
+                    ev = events[owner] = None  # dust / spam : ni metadata ni envoi, pour aucun chat
+                elif not ev.empty and not ev.failed:
+                    emit_swap(ev)
+            if ev is None or ev.empty:
+                continue
+
+            # filters: launchonly & min_sol (per wallet), avant metadata/rendu
+            wmeta = subs.get(owner, {})
+            target_mint = ev.target_mint
+            is_new = False
+            if target_mint:
+                seen = wmeta.get("seen_mints", [])
+                is_new = target_mint not in seen
+            if wmeta.get("launchonly") and not is_new:
+                continue
+            min_sol = float(wmeta.get("min_sol", 0.0) or 0.0)
+            if not ev.failed and ev.sol_delta < 0 and min_sol > 0 and abs(ev.sol_delta) < min_sol:
+                continue
+            if rules is not None:
+                if rules.needs_age and ev.age is None and ev.mint:
+                    found = await MINT_AGES.age(session, str(cfg.get("http_rpc") or default_http_rpc()), ev.mint)
+                    if found is not None:
+                        ev.age, ev.age_exact = found
+                if not rules.check(ev):
+                    continue
+
+            text, logo_url, target_mint, sol_delta = await build_summary_and_media(session, owner, tx, cfg, ev)
+            if not text:
+                continue
+
+            disable_notif = bool(cfg.get("silent", False))
+            try:
+                if logo_url:
+                    # file_id Telegram déjà connu → pas de re-téléchargement du logo
+                    sent = await app.bot.send_photo(chat_id=chat_id, photo=LOGO_FILE_IDS.get(logo_url, logo_url),
+                                                    caption=text, parse_mode="HTML", disable_notification=disable_notif)
+                    if sent.photo and logo_url not in LOGO_FILE_IDS:
+                        LOGO_FILE_IDS[logo_url] = sent.photo[-1].file_id
+                else:
+                    await app.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
+                                               disable_web_page_preview=True, disable_notification=disable_notif)
+                note_alert_sent()
+                # mark seen if new
+                if target_mint and is_new:
+                    seen.append(target_mint)
+                    if len(seen) > SEEN_MINTS_MAX:
+                        del seen[:len(seen) - SEEN_MINTS_MAX]
+                    wmeta["seen_mints"] = seen
+                    await save_state()
+            except Exception as e:
+                logger.warning("send notif failed: %s", e)
+    if SPAM.dirty:
+        await SPAM.save()
+
+# ── Polling (fallback sans WS) ────────────────────────────────────────────────
+# Plans RPC HTTP-only / endpoints qui refusent logsSubscribe : on suit les
+# wallets et les mints via getSignaturesForAddress, avec un intervalle adaptatif
+# par adresse. Pour un mint très actif, au plus 25 trades par passage sont vus.
+POLL_MIN_INTERVAL    = float(os.getenv("POLL_MIN_INTERVAL", "3"))     # wallet actif
+POLL_MAX_INTERVAL    = float(os.getenv("POLL_MAX_INTERVAL", "120"))   # wallet dormant
+POLL_BACKOFF         = float(os.getenv("POLL_BACKOFF", "1.5"))        # x intervalle à chaque poll vide
+POLL_TX_BATCH        = int(os.getenv("POLL_TX_BATCH", "20"))          # getTransaction par requête batch
+POLL_WS_RETRY        = float(os.getenv("POLL_WS_RETRY", "600"))       # en fallback, on retente le WS après ça
+WS_FAILS_BEFORE_POLL = int(os.getenv("WS_FAILS_BEFORE_POLL", "3"))
+POLL_MODES           = ("poll", "off")                                # valeurs de !setws qui forcent le polling
+POLLER: Optional["WalletPoller"] = None  # poller courant (pour !stats)
+
+class WalletPoller:
+    """Planning des getSignaturesForAddress : tas de priorité (échéance, wallet)."""
+
+    def __init__(self):
+        self.heap: List[Tuple[float, str]] = []
+        self.due: Dict[str, float] = {}       # échéance courante (les entrées périmées du tas sont ignorées)
+        self.interval: Dict[str, float] = {}
+        self.last_sig: Dict[str, Optional[str]] = {}
+        self.polls = 0
+        self.found = 0
+
+    def _schedule(self, addr: str, at: float):
+        self.due[addr] = at
+        heapq.heappush(self.heap, (at, addr))
+
+    def sync(self, want: set[str]):
+        now = time.monotonic()
+        for addr in want:
+            if addr not in self.interval:
+                self.interval[addr] = POLL_MIN_INTERVAL
+                self.last_sig[addr] = None
+                self._schedule(addr, now)
+        for addr in [a for a in self.interval if a not in want]:
+            self.interval.pop(addr, None)
+            self.last_sig.pop(addr, None)
+            self.due.pop(addr, None)
+
+    def pop_due(self, limit: int) -> List[str]:
+        now = time.monotonic()
+        out: List[str] = []
+        while self.heap and self.heap[0][0] <= now and len(out) < limit:
+            at, addr = heapq.heappop(self.heap)
+            if self.due.get(addr) == at:
+                out.append(addr)
+        return out
+
+    def next_due_in(self) -> float:
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return POLL_MAX_INTERVAL
+        return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def reschedule(self, addr: str, active: bool):
+        if addr not in self.interval:
+            return
+        iv = POLL_MIN_INTERVAL if active else min(POLL_MAX_INTERVAL, self.interval[addr] * POLL_BACKOFF)
+        self.interval[addr] = iv
+        self._schedule(addr, time.monotonic() + iv)
+
+    async def poll_one(self, session: aiohttp.ClientSession, url: str, addr: str) -> List[dict]:
+        """Nouvelles signatures (plus ancienne d'abord) depuis le dernier passage."""
+        await rpc_budget(url).take()
+        opts: dict = {"limit": 25, "commitment": "confirmed"}
+        last = self.last_sig.get(addr)
+        if last:
+            opts["until"] = last
+        data = await rpc_post(session, url, "getSignaturesForAddress", [addr, opts])
+        rows = data.get("result") or []
+        self.polls += 1
+        if rows:
+            self.last_sig[addr] = rows[0].get("signature")
+        if last is None:
+            return []  # 1er passage: point de départ, pas d'alerte sur l'historique
+        self.found += len(rows)
+        return list(reversed(rows))
+
+    def stats(self) -> Dict[str, int]:
+        hot = sum(1 for iv in self.interval.values() if iv <= POLL_MIN_INTERVAL)
+        return {"wallets": len(self.interval), "hot": hot, "polls": self.polls, "found": self.found}
+
+async def tracker_poll_loop(app: Application, until: Optional[float]):
+    """Polling jusqu'à `until` (fallback) ou tant que le mode poll est forcé (until=None)."""
+    global POLLER
+    poller = WalletPoller()
+    POLLER = poller
+    try:
+        async with aiohttp.ClientSession() as session:
+            while True:
+                if until is not None and time.monotonic() >= until:
+                    return
+                if until is None and tracker_ws_url() not in POLL_MODES:
+                    return
+                mints = watched_mints()
+                sync_mint_aggregators()
+                poller.sync(watched_wallets() | mints)
+                url = default_http_rpc()
+                due = poller.pop_due(POLL_TX_BATCH)
+                if not due:
+                    try:
+                        await asyncio.wait_for(TRACKER_CHANGED.wait(), timeout=min(poller.next_due_in(), 5.0))
+                    except asyncio.TimeoutError:
+                        pass
+                    TRACKER_CHANGED.clear()
+                    continue
+                results = await asyncio.gather(*(poller.poll_one(session, url, a) for a in due), return_exceptions=True)
+                found: Dict[str, set[str]] = {}       # sig -> wallets (ordre d'arrivée)
+                mint_found: Dict[str, set[str]] = {}  # sig -> mints suivis (!watchmint)
+                for addr, res in zip(due, results):
+                    if isinstance(res, BaseException):
+                        logger.debug("poll %s failed: %s", short_pk(addr), res)
+                        poller.reschedule(addr, False)
+                        continue
+                    poller.reschedule(addr, bool(res))
+                    for row in res:
+                        if addr in mints:
+                            if row.get("err") is None and row.get("signature"):
+                                mint_found.setdefault(row["signature"], set()).add(addr)
+                            continue
+                        # getSignaturesForAddress donne `err` mais pas les logs
+                        if prefilter_tx(row.get("err"), None, {addr}):
+                            continue
+                        found.setdefault(row.get("signature"), set()).add(addr)
+                sigs = [s for s in found if s] + [s for s in mint_found if s not in found]
+                for i in range(0, len(sigs), POLL_TX_BATCH):
+                    chunk = sigs[i:i + POLL_TX_BATCH]
+                    try:
+                        txs = await fetch_txs_batch(session, url, chunk)
+                    except Exception as e:
+                        logger.warning("poll tx batch failed: %s", e)
+                        continue
+                    for sig, tx in zip(chunk, txs):
+                        if not tx:
+                            continue
+                        for mint in mint_found.get(sig, ()):
+                            agg = MINT_AGGS.get(mint)
+                            if agg is not None:  # mêmes TradeEvent que via logsSubscribe
+                                agg.feed(int(tx.get("slot") or 0), (tx.get("meta") or {}).get("logMessages") or [], time.monotonic())
+                        if sig in found:
+                            await process_signature(app, session, sig, found[sig], tx=tx)
+    finally:
+        POLLER = None
+
+# ── Mint tracking (flux d'achats/ventes d'un token) ───────────────────────────
+# !watchmint : beaucoup plus d'événements qu'un wallet. Pas de getTransaction :
+# on décode les TradeEvent pump.fun directement depuis les logs ("Program data:"),
+# on agrège par slot sur une fenêtre glissante et on envoie des résumés throttlés.
+PUMP_PROGRAM       = "6EF8rrecthR5Dkzon8Nwu78hRvfCKubJ14M5uBEwF6P"
+PUMP_TRADE_EVENT   = hashlib.sha256(b"event:TradeEvent").digest()[:8]
+PUMP_TRADE_PREFIX  = "Program data: " + base64.b64encode(PUMP_TRADE_EVENT[:6]).decode()  # rejet sans décoder
+_TRADE_HEAD        = struct.Struct("<8s32sQQ?32s")  # disc, mint, sol_amount, token_amount, is_buy, user
+MINT_WINDOW        = float(os.getenv("MINT_WINDOW", "300"))         # fenêtre glissante des stats (s)
+MINT_SUMMARY_EVERY = float(os.getenv("MINT_SUMMARY_EVERY", "60"))   # au plus un résumé par mint et par période
+MINT_BIG_MAX       = int(os.getenv("MINT_BIG_MAX", "20"))           # gros trades gardés entre deux résumés
+
+class MintActivity:
+    """Stats glissantes d'un mint : buckets par slot, totaux incrémentaux, acheteurs uniques."""
+
+    __slots__ = ("mint", "key", "slots", "buys", "sells", "buy_sol", "sell_sol", "buyers",
+                 "big", "seq", "pending", "trades")
+
+    def __init__(self, mint: str):
+        self.mint = mint
+        self.key = b58decode(mint)
+        self.slots: deque = deque()  # [slot, t, buyers(list)] + compteurs par slot
+        self.buys = 0
+        self.sells = 0
+        self.buy_sol = 0.0
+        self.sell_sol = 0.0
+        self.buyers: Dict[bytes, int] = {}  # acheteur -> nb d'achats dans la fenêtre
+        self.big: List[Tuple[float, int, bool, bytes]] = []  # tas min (sol, seq, is_buy, user)
+        self.seq = 0
+        self.pending = 0  # trades depuis le dernier résumé
+        self.trades = 0
+
+    def expire(self, now: float):
+        limit = now - MINT_WINDOW
+        slots = self.slots
+        while slots and slots[0][1] < limit:
+            _slot, _t, buys, sells, buy_sol, sell_sol, buyers = slots.popleft()
+            self.buys -= buys
+            self.sells -= sells
+            self.buy_sol -= buy_sol
+            self.sell_sol -= sell_sol
+            for u in buyers:
+                n = self.buyers[u] - 1
+                if n:
+                    self.buyers[u] = n
+                else:
+                    del self.buyers[u]
+
+    def feed(self, slot: int, logs: List[str], now: float):
+        for line in logs:
+            if not line.startswith(PUMP_TRADE_PREFIX):
+                continue
+            try:
+                raw = base64.b64decode(line[14:])
+            except Exception:
+                continue
+            if len(raw) < _TRADE_HEAD.size:
+                continue
+            _disc, mint, lamports, tokens, is_buy, user = _TRADE_HEAD.unpack_from(raw)
+            if mint != self.key:
+                continue
+            if tokens:
+                MARKS.note(self.mint, (lamports / 1_000_000_000) / (tokens / 1_000_000), time.time())  # pump: 6 décimales
+            self.add(slot, lamports / 1_000_000_000, is_buy, user, now)
+
+    def add(self, slot: int, sol: float, is_buy: bool, user: bytes, now: float):
+        slots = self.slots
+        if slots and slots[-1][0] == slot:
+            b = slots[-1]
+        else:
+            b = [slot, now, 0, 0, 0.0, 0.0, []]
+            slots.append(b)
+            self.expire(now)
+        if is_buy:
+            b[2] += 1; b[4] += sol; b[6].append(user)
+            self.buys += 1; self.buy_sol += sol
+            self.buyers[user] = self.buyers.get(user, 0) + 1
+        else:
+            b[3] += 1; b[5] += sol
+            self.sells += 1; self.sell_sol += sol
+        self.pending += 1
+        self.trades += 1
+        self.seq += 1
+        if len(self.big) < MINT_BIG_MAX:
+            heapq.heappush(self.big, (sol, self.seq, is_buy, user))
+        elif sol > self.big[0][0]:
+            heapq.heapreplace(self.big, (sol, self.seq, is_buy, user))
+
+    def take_big(self) -> List[Tuple[float, int, bool, bytes]]:
+        out = sorted(self.big, reverse=True)
+        self.big.clear()
+        self.pending = 0
+        return out
+
+MINT_AGGS: Dict[str, MintActivity] = {}
+
+def sync_mint_aggregators():
+    want = watched_mints()
+    for mint in want:
+        if mint not in MINT_AGGS:
+            MINT_AGGS[mint] = MintActivity(mint)
+    for mint in [m for m in MINT_AGGS if m not in want]:
+        del MINT_AGGS[mint]
+
+def render_mint_summary(agg: MintActivity, big: List[Tuple[float, int, bool, bytes]], min_sol: float) -> str:
+    md = TOKENS.by_mint.get(agg.mint) or {}
+    label = f"${md['symbol']}" if md.get("symbol") else short_pk(agg.mint)
+    net = agg.buy_sol - agg.sell_sol
+    lines = [
+        f"📊 <b>{label}</b> — activité ({int(MINT_WINDOW // 60)} min)",
+        f"Achats: <code>{agg.buys}</code> (<code>{agg.buy_sol:.2f} SOL</code>){fiat_suffix(agg.buy_sol)} • "
+        f"Ventes: <code>{agg.sells}</code> (<code>{agg.sell_sol:.2f} SOL</code>)",
+        f"Net: <code>{net:+.2f} SOL</code> • Acheteurs uniques: <code>{len(agg.buyers)}</code>",
+    ]
+    shown = [t for t in big if t[0] >= min_sol][:5]
+    if shown:
+        lines.append(f"Gros trades (≥ {min_sol:g} SOL):" if min_sol > 0 else "Plus gros trades:")
+        for sol, _seq, is_buy, user in shown:
+            lines.append(f"{'🟢' if is_buy else '🔴'} <code>{sol:.2f} SOL</code> — {short_pk(b58encode(user))}")
+    lines.append(f"CA: <code>{agg.mint}</code>")
+    return "\n".join(lines)
+
+async def mint_summary_loop(app: Application):
+    while True:
+        await asyncio.sleep(MINT_SUMMARY_EVERY)
+        now = time.monotonic()
+        for mint, agg in list(MINT_AGGS.items()):
+            if not agg.pending:
+                continue
+            agg.expire(now)
+            big = agg.take_big()
+            for chat_id, cfg in TRACKER_STATE.items():
+                m = (cfg.get("mints") or {}).get(mint)
+                if m is None:
+                    continue
+                text = render_mint_summary(agg, big, float(m.get("min_sol", 0.0) or 0.0))
+                try:
+                    await app.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
+                                               disable_web_page_preview=True, disable_notification=bool(cfg.get("silent", False)))
+                except Exception as e:
+                    logger.warning("mint summary failed: %s", e)
+
 # ── WS loop ───────────────────────────────────────────────────────────────────
+WS_SUB_BUCKET = TokenBucket(WS_SUB_RATE, WS_SUB_BURST)
+
+def tracker_ws_url() -> str:
+    # pick a WS endpoint
+    for cfg in TRACKER_STATE.values():
+        ws = (cfg.get("ws_rpc") or "") if isinstance(cfg, dict) else ""
+        if ws:
+            return ws
+    return infer_ws_from_http(default_http_rpc())
+
 async def tracker_ws_loop(app: Application):
-    await asyncio.sleep(1.0)
+    global WS_SUBS
+    ws_fails = 0
     while True:
-        # pick a WS endpoint
-        ws_url = None
-        for cfg in TRACKER_STATE.values():
-            ws = (cfg.get("ws_rpc") or "") if isinstance(cfg, dict) else ""
-            if ws:
-                ws_url = ws; break
-        if ws_url is None:
-            any_http = next(iter(TRACKER_STATE.values())).get("http_rpc") if TRACKER_STATE else os.getenv("SOLANA_RPC", "https://api.mainnet-beta.solana.com")
-            ws_url = infer_ws_from_http(str(any_http))
+        ws_url = tracker_ws_url()
+        PRICES.start()  # prix SOL pour la valorisation des alertes, hors chemin critique
+        if ws_url in POLL_MODES:
+            await tracker_poll_loop(app, None)
+            continue
+        if ws_fails >= WS_FAILS_BEFORE_POLL:
+            logger.warning("WS indisponible (%d échecs) → polling pendant %.0fs", ws_fails, POLL_WS_RETRY)
+            await tracker_poll_loop(app, time.monotonic() + POLL_WS_RETRY)
+            ws_fails = 0
+            continue
 
+        sync_task = None
         try:
             async with aiohttp.ClientSession() as session:
-                await TOKENS.warm(session)
+                # la liste de tokens se charge en fond (post_init), on ne l'attend pas
                 async with session.ws_connect(ws_url, heartbeat=20, autoping=True) as ws:
-                    # subscribe all current
-                    watched_all: set[str] = set()
-                    for cfg in TRACKER_STATE.values():
-                        subs = (cfg.get("subs") or {})
-                        watched_all |= set(subs.keys())
-                    for addr in watched_all:
-                        await ws.send_json({"jsonrpc":"2.0","id":id(("logsSubscribe",addr)) & 0x7fffffff,
-                                            "method":"logsSubscribe","params":[{"mentions":addr},{"commitment":"confirmed"}]})
-
-                    last_sync = asyncio.get_running_loop().time()
+                    subs_mgr = WsSubscriptions(ws, WS_SUB_BUCKET)
+                    WS_SUBS = subs_mgr
+                    TRACKER_CHANGED.set()  # (re)abonne tout de suite tous les wallets
+                    sync_task = asyncio.create_task(subs_mgr.sync_loop())
 
                     async for msg in ws:
                         if msg.type == aiohttp.WSMsgType.TEXT:
                             data = json.loads(msg.data)
+                            if subs_mgr.on_reply(data):
+                                if subs_mgr.sub_by_addr:
+                                    ws_fails = 0
+                                elif subs_mgr.refused():
+                                    raise RuntimeError(f"logsSubscribe refusé: {subs_mgr.last_error}")
+                                continue
                             if data.get("method") == "logsNotification":
                                 params = data.get("params", {})
-                                result = params.get("result", {})
-                                sig = result.get("signature")
-                                # get any HTTP endpoint
-                                any_http = next(iter(TRACKER_STATE.values())).get("http_rpc") if TRACKER_STATE else os.getenv("SOLANA_RPC", "https://api.mainnet-beta.solana.com")
-                                tx = await fetch_tx(session, str(any_http), sig)
-                                if not tx:
+                                result = params.get("result") or {}
+                                value = result.get("value") or {}
+                                owner = subs_mgr.addr_by_sub.get(params.get("subscription"))
+                                agg = MINT_AGGS.get(owner) if owner else None
+                                if agg is not None:
+                                    # chemin mint: décodage des logs, pas de getTransaction
+                                    if value.get("err") is None:
+                                        agg.feed((result.get("context") or {}).get("slot", 0), value.get("logs") or [], time.monotonic())
                                     continue
+                                owners: set[str] = set()
+                                if owner:
+                                    owners.add(owner)
                                 # mentioned pubkeys from logs
-                                logs = result.get("value", {}).get("logs", []) or []
-                                mentioned = set()
+                                logs = value.get("logs") or []
                                 for line in logs:
                                     for tok in line.split():
-                                        if is_valid_pubkey(tok): mentioned.add(tok)
-
-                                # route to each chat
-                                for chat_id, cfg in TRACKER_STATE.items():
-                                    subs = cfg.get("subs") or {}
-                                    owners_hit = set(subs.keys()).intersection(mentioned)
-                                    if not owners_hit:
-                                        continue
-                                    for owner in owners_hit:
-                                        text, logo_url, target_mint, sol_delta = await build_summary_and_media(session, owner, tx, cfg)
-                                        if not text:
-                                            continue
-
-                                        # filters: launchonly & min_sol (per wallet)
-                                        wmeta = subs.get(owner, {})
-                                        is_new = False
-                                        if target_mint:
-                                            seen = wmeta.get("seen_mints", [])
-                                            is_new = target_mint not in seen
-                                        if wmeta.get("launchonly") and not is_new:
-                                            continue
-                                        min_sol = float(wmeta.get("min_sol", 0.0) or 0.0)
-                                        if sol_delta is not None and sol_delta < 0 and min_sol > 0 and abs(sol_delta) < min_sol:
-                                            continue
-
-                                        disable_notif = bool(cfg.get("silent", False))
-                                        try:
-                                            if logo_url:
-                                                await app.bot.send_photo(chat_id=chat_id, photo=logo_url, caption=text,
-                                                                         parse_mode="HTML", disable_notification=disable_notif)
-                                            else:
-                                                await app.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
-                                                                           disable_web_page_preview=True, disable_notification=disable_notif)
-                                            # mark seen if new
-                                            if target_mint and is_new:
-                                                seen.append(target_mint)
-                                                wmeta["seen_mints"] = seen
-                                                await save_state()
-                                        except Exception as e:
-                                            logger.warning("send notif failed: %s", e)
-
-                            # resubscribe for new watches every ~20s
-                            now = asyncio.get_running_loop().time()
-                            if now - last_sync > 20:
-                                last_sync = now
-                                current: set[str] = set()
-                                for cfg in TRACKER_STATE.values():
-                                    subs = (cfg.get("subs") or {})
-                                    current |= set(subs.keys())
-                                new_to_sub = current - watched_all
-                                if new_to_sub:
-                                    for a in new_to_sub:
-                                        await ws.send_json({"jsonrpc":"2.0","id":id(("logsSubscribe",a)) & 0x7fffffff,
-                                                            "method":"logsSubscribe","params":[{"mentions":a},{"commitment":"confirmed"}]})
-                                    watched_all |= new_to_sub
+                                        if tok in subs_mgr.sub_by_addr: owners.add(tok)
+                                if prefilter_tx(value.get("err"), logs, owners):
+                                    continue
+                                await process_signature(app, session, value.get("signature"), owners)
                         elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
                             break
         except Exception as e:
+            ws_fails += 1
             logger.warning("WS loop error: %s", e)
             await asyncio.sleep(3.0)
             continue
+        finally:
+            if sync_task is not None:
+                sync_task.cancel()
+            WS_SUBS = None
         await asyncio.sleep(1.0)
 
-def ensure_ws_loop(app: Application):
+async def tracker_main(app: Application):
+    """Tout ce que fait le leader : flux WS/polling + résumés des mints + alertes consensus."""
+    await asyncio.gather(tracker_ws_loop(app), mint_summary_loop(app), consensus_loop(app))
+
+async def tracker_leader_loop(app: Application):
+    """Renouvelle le bail ; démarre le WS tracker quand on est leader, l'arrête sinon."""
     global _ws_task
-    if _ws_task is None:
-        _ws_task = asyncio.create_task(tracker_ws_loop(app))
-        logger.info("Tracker WS loop started.")
+    try:
+        while True:
+            try:
+                held = await asyncio.to_thread(LEASE.try_acquire)
+            except Exception as e:
+                logger.warning("lease renew failed: %s", e)
+                held = False
+            if held:
+                await sync_state_from_store()
+                await SPAM.sync()
+                if _ws_task is None or _ws_task.done():
+                    LEDGER.evict(1.0, set())  # un autre leader a pu écrire depuis : on relira la base
+                    _ws_task = asyncio.create_task(tracker_main(app))
+                    logger.info("Tracker leader (%s): WS loop started.", INSTANCE_ID)
+            elif _ws_task is not None:
+                _ws_task.cancel()
+                _ws_task = None
+                logger.info("Tracker lease lost (%s): WS loop stopped.", INSTANCE_ID)
+            await asyncio.sleep(LEASE_RENEW)
+    finally:
+        if _ws_task is not None:
+            _ws_task.cancel()
+            _ws_task = None
+        try:
+            LEASE.release()
+        except Exception as e:
+            logger.warning("lease release failed: %s", e)
+
+def ensure_ws_loop(app: Application):
+    global _leader_task
+    if _leader_task is None or _leader_task.done():
+        _leader_task = asyncio.create_task(tracker_leader_loop(app))
+        logger.info("Tracker lease loop started (%s).", INSTANCE_ID)
 
 # ── Commands (all with "!") ───────────────────────────────────────────────────
-@register_command(name="watch", help_text="!watch <adresse> [alias] — suivre un wallet (temps réel)", aliases=["wallet"])
+@register_command(name="watch", help_text="!watch <adresse> [alias] — suivre un wallet (temps réel)", aliases=["wallet"], cost="write")
 async def cmd_watch(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if not args:
         await reply(update, "Usage: <code>!watch &lt;adresse&gt; [alias]</code>"); return
     addr = args[0].strip()
@@ -1306,9 +3294,49 @@ async def cmd_watch(update: Update, context: ContextTypes.DEFAULT_TYPE, args: Li
     sbadge = BADGE_SILENT_ON if st.get("silent") else BADGE_SILENT_OFF
     await reply(update, f"📡 <b>Watch activé</b>\n{sbadge} {lbadge}  <b>{name}</b>\nAdresse : <code>{addr}</code>\n{solscan_addr(addr)}")
 
-@register_command(name="unwatch", help_text="!unwatch <adresse> — arrêter de suivre")
+@register_command(name="watchmint", help_text="!watchmint <CA> [min_SOL] — flux achats/ventes d'un token (résumés)", cost="write")
+async def cmd_watchmint(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    mints: Dict[str, dict] = st.setdefault("mints", {})  # type: ignore
+    if not args:
+        if not mints:
+            await reply(update, "Usage: <code>!watchmint &lt;CA&gt; [min_SOL]</code>"); return
+        lines = ["📊 <b>Tokens suivis</b>"]
+        for mint, meta in mints.items():
+            minsol = float(meta.get("min_sol", 0.0) or 0.0)
+            lines.append(f"• <code>{mint}</code>" + (f" — minSOL: <code>{minsol}</code>" if minsol > 0 else ""))
+        await reply(update, "\n".join(lines)); return
+    mint = args[0].strip()
+    if not is_valid_pubkey(mint):
+        await reply(update, "❌ Adresse de token invalide."); return
+    try:
+        min_sol = float(args[1].replace(",", ".")) if len(args) > 1 else 0.0
+        if min_sol < 0: raise ValueError()
+    except Exception:
+        await reply(update, "❌ Montant invalide. Exemple: <code>!watchmint &lt;CA&gt; 0.5</code>"); return
+    mints[mint] = {"added_at": datetime.now(timezone.utc).isoformat(), "min_sol": min_sol}
+    await save_state()
+    ensure_ws_loop(context.application)
+    note = (f"\n<i>Mode poll :</i> trades vus avec <code>{POLL_MIN_INTERVAL:g}</code>–<code>{POLL_MAX_INTERVAL:g} s</code> de retard "
+            f"selon l'activité, au plus 25 par passage (un token très actif est sous-compté)."
+            if tracker_ws_url() in POLL_MODES else "")
+    await reply(update, f"📊 <b>Token suivi</b>\nCA: <code>{mint}</code>\nRésumé toutes les <code>{int(MINT_SUMMARY_EVERY)} s</code> s'il y a de l'activité"
+                        + (f" • gros trades ≥ <code>{min_sol:g} SOL</code>" if min_sol > 0 else "") + note)
+
+@register_command(name="unwatchmint", help_text="!unwatchmint <CA> — arrêter le suivi d'un token", cost="write")
+async def cmd_unwatchmint(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    mints: Dict[str, dict] = st.setdefault("mints", {})  # type: ignore
+    if not args:
+        await reply(update, "Usage: <code>!unwatchmint &lt;CA&gt;</code>"); return
+    if mints.pop(args[0].strip(), None) is None:
+        await reply(update, "Ce token n'était pas suivi."); return
+    await save_state()
+    await reply(update, "🛑 Suivi du token arrêté.")
+
+@register_command(name="unwatch", help_text="!unwatch <adresse> — arrêter de suivre", cost="write")
 async def cmd_unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if not args:
         await reply(update, "Usage: <code>!unwatch &lt;adresse&gt;</code>"); return
     addr = args[0].strip()
@@ -1320,9 +3348,9 @@ async def cmd_unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE, args:
     else:
         await reply(update, "Cette adresse n'était pas suivie.")
 
-@register_command(name="unwatchall", help_text="!unwatchall — vider tous les wallets suivis")
+@register_command(name="unwatchall", help_text="!unwatchall — vider tous les wallets suivis", admin=True, cost="write")
 async def cmd_unwatchall(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     subs: Dict[str, dict] = st["subs"]  # type: ignore
     count = len(subs)
     subs.clear(); await save_state()
@@ -1330,7 +3358,7 @@ async def cmd_unwatchall(update: Update, context: ContextTypes.DEFAULT_TYPE, arg
 
 @register_command(name="list", help_text="!list — liste compacte des wallets suivis (liens)")
 async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     subs: Dict[str, dict] = st["subs"]  # type: ignore
     if not subs:
         await reply(update, "Aucune adresse suivie. <code>!watch &lt;adresse&gt; [alias]</code> pour commencer."); return
@@ -1342,7 +3370,7 @@ async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE, args: Lis
 
 @register_command(name="listdetail", help_text="!listdetail — liste détaillée (alias, date, launchonly, minSOL)")
 async def cmd_listdetail(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     subs: Dict[str, dict] = st["subs"]  # type: ignore
     if not subs:
         await reply(update, "Aucune adresse suivie. <code>!watch &lt;adresse&gt; [alias]</code> pour commencer."); return
@@ -1358,18 +3386,18 @@ async def cmd_listdetail(update: Update, context: ContextTypes.DEFAULT_TYPE, arg
         out.append(f"{i}️⃣ {lbadge} <a href=\"{solscan_addr(addr)}\">{name}</a> — ajouté le <i>{added}</i> — <b>launchonly</b>: <code>{'ON' if meta.get('launchonly') else 'OFF'}</code>{extra}")
     await reply(update, "\n".join(out))
 
-@register_command(name="setrpc", help_text="!setrpc <http_url> — définit l'endpoint HTTP RPC")
+@register_command(name="setrpc", help_text="!setrpc <http_url> — définit l'endpoint HTTP RPC", admin=True, cost="write")
 async def cmd_setrpc(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if not args:
         await reply(update, f"HTTP RPC actuel: <code>{st['http_rpc']}</code>"); return
     st["http_rpc"] = args[0].strip()
     await save_state()
     await reply(update, f"✅ HTTP RPC mis à jour:\n<code>{st['http_rpc']}</code>")
 
-@register_command(name="setws", help_text="!setws <wss_url> — définit l'endpoint WebSocket RPC (sinon auto)")
+@register_command(name="setws", help_text="!setws <wss_url>|poll — définit l'endpoint WebSocket RPC (sinon auto, poll = sans WS)", admin=True, cost="write")
 async def cmd_setws(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if not args:
         ws_url = st["ws_rpc"] or infer_ws_from_http(st["http_rpc"])  # type: ignore
         await reply(update, f"WS actuel: <code>{ws_url}</code>"); return
@@ -1378,9 +3406,9 @@ async def cmd_setws(update: Update, context: ContextTypes.DEFAULT_TYPE, args: Li
     ensure_ws_loop(context.application)
     await reply(update, f"✅ WebSocket RPC mis à jour:\n<code>{st['ws_rpc']}</code>")
 
-@register_command(name="launchonly", help_text="!launchonly <adresse> on|off — ne notifier que la 1ère fois par token (wallet)")
+@register_command(name="launchonly", help_text="!launchonly <adresse> on|off — ne notifier que la 1ère fois par token (wallet)", cost="write")
 async def cmd_launchonly(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if len(args) != 2 or args[1].lower() not in ("on","off"):
         await reply(update, "Usage: <code>!launchonly &lt;adresse&gt; on|off</code>"); return
     addr = args[0].strip()
@@ -1394,9 +3422,9 @@ async def cmd_launchonly(update: Update, context: ContextTypes.DEFAULT_TYPE, arg
     name = display_name(addr, subs[addr])
     await reply(update, f"⚙️ <b>launchonly</b> pour <b>{name}</b> → <code>{args[1].upper()}</code>")
 
-@register_command(name="silent", help_text="!silent on|off — envoyer les notifs en silencieux (par chat)")
+@register_command(name="silent", help_text="!silent on|off — envoyer les notifs en silencieux (par chat)", cost="write")
 async def cmd_silent(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if len(args) != 1 or args[0].lower() not in ("on","off"):
         await reply(update, "Usage: <code>!silent on|off</code>"); return
     st["silent"] = (args[0].lower() == "on")
@@ -1404,9 +3432,18 @@ async def cmd_silent(update: Update, context: ContextTypes.DEFAULT_TYPE, args: L
     bad = BADGE_SILENT_ON if st["silent"] else BADGE_SILENT_OFF
     await reply(update, f"{bad} <b>Silent</b> → <code>{args[0].upper()}</code>")
 
-@register_command(name="minsol", help_text="!minsol <adresse> <montant_SOL> — seuil min de SOL dépensé pour notifier (par wallet)")
+@register_command(name="showfailed", help_text="!showfailed on|off — notifier aussi les tx échouées (par chat)", cost="write")
+async def cmd_showfailed(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    if len(args) != 1 or args[0].lower() not in ("on","off"):
+        await reply(update, "Usage: <code>!showfailed on|off</code>"); return
+    st["show_failed"] = (args[0].lower() == "on")
+    await save_state()
+    await reply(update, f"⚙️ <b>Tx échouées</b> → <code>{args[0].upper()}</code>")
+
+@register_command(name="minsol", help_text="!minsol <adresse> <montant_SOL> — seuil min de SOL dépensé pour notifier (par wallet)", cost="write")
 async def cmd_minsol(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
-    st = tracker_chat_state(update.effective_chat.id)
+    st = await tracker_chat_state(update.effective_chat.id)
     if len(args) != 2:
         await reply(update, "Usage: <code>!minsol &lt;adresse&gt; &lt;montant_SOL&gt;</code>"); return
     addr = args[0].strip()
@@ -1425,6 +3462,1350 @@ async def cmd_minsol(update: Update, context: ContextTypes.DEFAULT_TYPE, args: L
     name = display_name(addr, subs[addr])
     await reply(update, f"⚙️ <b>Filtre minimum SOL</b> pour <b>{name}</b> → <code>≥ {val} SOL</code>")
 
+@register_command(name="filter", help_text="!filter <règles>|off — filtres du chat: buys/sells, allow/deny, maxage, minusd/mineur", cost="write")
+async def cmd_filter(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    chat_id = update.effective_chat.id
+    st = await tracker_chat_state(chat_id)
+    if not args:
+        src = str(st.get("rules") or "")
+        if not src:
+            await reply(update, f"Aucun filtre. Usage: <code>!filter {RULES_SYNTAX}</code> (plusieurs règles = toutes requises) • <code>!filter off</code>"); return
+        cr = chat_rules(chat_id, st)
+        lines = [f"🧮 <b>Filtres</b>: <code>{src}</code>"]
+        if cr is not None:
+            for name, _pred in cr.checks:
+                lines.append(f"• {name}: ✅ <code>{cr.passed[name]}</code> • ⛔ <code>{cr.rejected[name]}</code>")
+        await reply(update, "\n".join(lines)); return
+    if len(args) == 1 and args[0].lower() == "off":
+        st["rules"] = ""
+        _compiled_rules.pop(chat_id, None)
+        await save_state()
+        await reply(update, "⚙️ <b>Filtres</b> → <code>OFF</code>"); return
+    try:
+        cr = compile_rules(" ".join(args))
+    except ValueError as e:
+        await reply(update, f"❌ {e}\nSyntaxe: <code>{RULES_SYNTAX}</code>"); return
+    st["rules"] = cr.src
+    _compiled_rules[chat_id] = cr
+    await save_state()
+    await reply(update, f"⚙️ <b>Filtres</b> → <code>{cr.src}</code>")
+
+@register_command(name="spam", help_text="(Admin) !spam add|del <CA> • !spam list — mints ignorés (airdrops de dust)", admin=True, cost="write")
+async def cmd_spam(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    if len(args) == 2 and args[0].lower() in ("add", "del"):
+        mint = args[1].strip()
+        if not is_valid_pubkey(mint) or len(b58decode(mint)) != 32:
+            await reply(update, "❌ CA invalide."); return
+        if args[0].lower() == "add":
+            kind = "manual"
+            msg = f"🚫 Mint ignoré: <code>{mint}</code>"
+        else:
+            kind = "allow"  # faux positif : les heuristiques du leader ne le remarqueront plus
+            msg = f"✅ Mint à nouveau notifié: <code>{mint}</code>"
+        try:
+            await SPAM.edit({mint: kind})
+        except Exception as e:
+            logger.warning("spam rules write failed: %s", e)
+            await reply(update, "⚠️ Base partagée indisponible, réessaie."); return
+        await reply(update, msg); return
+    if args and args[0].lower() == "list":
+        await SPAM.sync()
+        # auto est tenu par le leader : ailleurs, on relit son fichier
+        auto_all = SPAM.auto if LEASE.held else (await asyncio.to_thread(SPAM.read_file))[0]
+        auto_all = auto_all - SPAM.allow
+        manual = sorted(SPAM.manual)[:30]
+        auto = sorted(auto_all)[-30:]
+        lines = [f"🚫 <b>Mints spam</b> — manuels: <code>{len(SPAM.manual)}</code> • auto: <code>{len(auto_all)}</code> • autorisés: <code>{len(SPAM.allow)}</code>"]
+        lines += [f"• <code>{m}</code> (admin)" for m in manual]
+        lines += [f"• <code>{m}</code> (auto)" for m in auto]
+        await reply(update, "\n".join(lines)); return
+    await reply(update, f"Usage: <code>!spam add|del &lt;CA&gt;</code> • <code>!spam list</code>\n"
+                        f"Alertes supprimées: <code>{SPAM.suppressed}</code> (dont transferts non sollicités: <code>{SPAM.unsolicited}</code>)")
+
+# ── Historique local des swaps (SQLite WAL) ───────────────────────────────────
+EVENTS_DB             = os.getenv("EVENTS_DB", str(Path(TRACKER_STORE).with_name("events.sqlite3")))
+EVENTS_RETENTION_DAYS = float(os.getenv("EVENTS_RETENTION_DAYS", "30"))
+EVENTS_FLUSH_EVERY    = float(os.getenv("EVENTS_FLUSH_EVERY", "2"))    # écriture groupée des swaps en attente
+EVENTS_PRUNE_EVERY    = float(os.getenv("EVENTS_PRUNE_EVERY", "3600"))  # rétention + compaction
+EVENTS_BUFFER_MAX     = 20000                                           # au-delà (disque bloqué) on jette les plus vieux
+
+class EventStore:
+    """
+    Swaps analysés, indexés par (wallet, ts), (mint, ts) et ts. Une seule
+    connexion (WAL, autocommit) utilisée hors de la boucle via asyncio.to_thread,
+    sérialisée par un verrou. Les écritures sont bufferisées puis groupées.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.buffer: List[tuple] = []
+        self.dropped = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # effectif seulement à la création du fichier
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS swaps (ts INTEGER NOT NULL, sig TEXT NOT NULL, wallet TEXT NOT NULL, "
+                "mint TEXT NOT NULL, side TEXT NOT NULL, token_amt REAL NOT NULL, sol REAL NOT NULL, "
+                "PRIMARY KEY (sig, wallet))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS swaps_wallet_ts ON swaps (wallet, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS swaps_mint_ts ON swaps (mint, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS swaps_ts ON swaps (ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS positions (wallet TEXT NOT NULL, mint TEXT NOT NULL, qty REAL NOT NULL, "
+                "cost REAL NOT NULL, realized REAL NOT NULL, buys INTEGER NOT NULL, sells INTEGER NOT NULL, "
+                "last_ts INTEGER NOT NULL, PRIMARY KEY (wallet, mint)) WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def append(self, row: tuple):
+        self.buffer.append(row)
+        if len(self.buffer) > EVENTS_BUFFER_MAX:
+            del self.buffer[:len(self.buffer) - EVENTS_BUFFER_MAX]
+            self.dropped += 1
+
+    def take(self) -> List[tuple]:
+        rows, self.buffer = self.buffer, []
+        return rows
+
+    def requeue(self, rows: List[tuple]):
+        """Remet en tête des lignes prises mais pas écrites ; au-delà du plafond, les plus vieilles sautent."""
+        self.buffer[:0] = rows
+        excess = len(self.buffer) - EVENTS_BUFFER_MAX
+        if excess > 0:
+            del self.buffer[:excess]
+            self.dropped += excess
+
+    async def flush(self) -> bool:
+        """Écrit le buffer ; en cas d'échec les lignes y retournent pour le prochain passage."""
+        rows = self.take()
+        try:
+            await asyncio.to_thread(self.write, rows)
+            return True
+        except Exception as e:
+            self.requeue(rows)
+            logger.warning("event store write failed (%d swaps kept in buffer): %s", len(rows), e)
+            return False
+
+    def write(self, rows: List[tuple]):
+        if not rows:
+            return
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR IGNORE INTO swaps VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def save_positions(self, rows: List[tuple]):
+        if not rows:
+            return
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def positions_of(self, wallets: List[str]) -> List[tuple]:
+        marks = ",".join("?" * len(wallets))
+        return self.query("SELECT wallet, mint, qty, cost, realized, buys, sells, last_ts FROM positions "
+                          f"WHERE wallet IN ({marks})", tuple(wallets)) if wallets else []
+
+    def query(self, sql: str, params: tuple) -> List[tuple]:
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def history(self, wallet: str, since: float, limit: int = 25) -> List[tuple]:
+        return self.query("SELECT ts, sig, mint, side, token_amt, sol FROM swaps WHERE wallet = ? AND ts >= ? "
+                          "ORDER BY ts DESC LIMIT ?", (wallet, int(since), limit))
+
+    def who(self, mint: str, since: float, wallets: List[str]) -> List[tuple]:
+        if not wallets:
+            return []
+        marks = ",".join("?" * len(wallets))
+        return self.query("SELECT wallet, SUM(side = 'buy'), SUM(side = 'sell'), SUM(sol), MIN(ts), MAX(ts) FROM swaps "
+                          f"WHERE mint = ? AND ts >= ? AND wallet IN ({marks}) GROUP BY wallet ORDER BY MIN(ts)",
+                          (mint, int(since), *wallets))
+
+    def top_bought(self, since: float, n: int, wallets: Optional[List[str]] = None) -> List[tuple]:
+        """(mint, achats, SOL) les plus achetés depuis `since`, éventuellement limités à ces wallets."""
+        sql = "SELECT mint, COUNT(*), -SUM(sol) FROM swaps WHERE side = 'buy' AND ts >= ?"
+        params: tuple = (int(since),)
+        if wallets is not None:
+            if not wallets:
+                return []
+            sql += f" AND wallet IN ({','.join('?' * len(wallets))})"
+            params += tuple(wallets)
+        return self.query(sql + " GROUP BY mint ORDER BY 2 DESC, 3 DESC LIMIT ?", params + (n,))
+
+    def prune(self, cutoff: float) -> int:
+        with self._lock:
+            conn = self._db()
+            n = conn.execute("DELETE FROM swaps WHERE ts < ?", (int(cutoff),)).rowcount
+            if n:
+                conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return n
+
+    def export_csv(self, since: float, wallets: List[str]) -> bytes:
+        """CSV gzippé (ts ISO, sig, wallet, mint, side, token_amt, sol) de ces wallets, pour l'analyse hors ligne."""
+        sql = f"SELECT ts, sig, wallet, mint, side, token_amt, sol FROM swaps WHERE ts >= ? AND wallet IN ({','.join('?' * len(wallets))})"
+        params: tuple = (int(since), *wallets)
+        out = io.StringIO()
+        w = csv.writer(out)
+        w.writerow(["time", "signature", "wallet", "mint", "side", "token_amount", "sol_delta"])
+        with self._lock:
+            for ts, *rest in self._db().execute(sql + " ORDER BY ts", params):
+                w.writerow([datetime.fromtimestamp(ts, timezone.utc).isoformat(), *rest])
+        return gzip.compress(out.getvalue().encode("utf-8"))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+EVENTS = EventStore(EVENTS_DB)
+
+@register_swap_listener("history")
+def _record_swap(ev: SwapEvent):
+    mint = ev.mint
+    if not mint or not ev.sig:
+        return
+    token_amt = ev.bought_amt if mint == ev.bought_mint else -ev.sold_amt
+    EVENTS.append((int(ev.ts), ev.sig, ev.owner, mint, ev.side or "recv", token_amt, ev.sol_delta))
+
+def _cold_positions(keys: List[Tuple[str, str]]) -> List[tuple]:
+    """(thread) Lignes en base des wallets concernés par des positions à réchauffer."""
+    return EVENTS.positions_of(sorted({wallet for wallet, _mint in keys}))
+
+async def events_loop():
+    last_prune = 0.0
+    while True:
+        await asyncio.sleep(EVENTS_FLUSH_EVERY)
+        try:
+            await EVENTS.flush()
+            keys = list(LEDGER.cold)
+            if keys:
+                LEDGER.warm(keys, await asyncio.to_thread(_cold_positions, keys))
+            rows = LEDGER.take_dirty()
+            try:
+                await asyncio.to_thread(EVENTS.save_positions, rows)
+            except Exception:
+                LEDGER.dirty.update((wallet, mint) for wallet, mint, *_vals in rows)  # pas évinçables avant écriture
+                raise
+            if time.monotonic() - last_prune > EVENTS_PRUNE_EVERY:
+                last_prune = time.monotonic()
+                n = await asyncio.to_thread(EVENTS.prune, time.time() - EVENTS_RETENTION_DAYS * 86400)
+                if n:
+                    logger.info("event store: pruned %d swaps older than %g days", n, EVENTS_RETENTION_DAYS)
+        except Exception as e:
+            logger.warning("event store flush failed: %s", e)
+
+def resolve_wallet(st: dict, arg: str) -> Optional[str]:
+    """Adresse depuis un alias du chat ou une adresse brute."""
+    arg = arg.strip()
+    for addr, meta in (st.get("subs") or {}).items():
+        if arg.lower() == ((meta or {}).get("alias") or "").lower():
+            return addr
+    return arg if is_valid_pubkey(arg) else None
+
+SIDE_LABELS = {"buy": "🟢 achat", "sell": "🔴 vente", "recv": "📥 reçu"}
+
+def _fmt_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%d/%m %H:%M")
+
+def _token_label(mint: str) -> str:
+    sym = (TOKENS.by_mint.get(mint) or {}).get("symbol")  # mémoire seulement
+    return f"${sym}" if sym else short_pk(mint)
+
+@register_command(name="history", help_text="!history <adresse|alias> [24h] — swaps récents d'un wallet (historique local)", aliases=["hist"])
+async def cmd_history(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    if not args:
+        await reply(update, "Usage: <code>!history &lt;adresse|alias&gt; [24h|7d]</code>"); return
+    wallet = resolve_wallet(st, args[0])
+    window = parse_duration(args[1]) if len(args) > 1 else 86400.0
+    if not wallet or not window:
+        await reply(update, "❌ Adresse/alias ou durée invalide. Ex: <code>!history 3jxZ... 24h</code>"); return
+    if wallet not in (st.get("subs") or {}):  # l'historique est commun à tous les chats : on s'en tient aux wallets suivis ici
+        await reply(update, "❌ Ce wallet n'est pas suivi dans ce chat (<code>!track</code> d'abord)."); return
+    t0 = time.perf_counter()
+    await EVENTS.flush()
+    rows = await asyncio.to_thread(EVENTS.history, wallet, time.time() - window)
+    ms = (time.perf_counter() - t0) * 1000
+    name = display_name(wallet, (st.get("subs") or {}).get(wallet, {}))  # type: ignore[union-attr]
+    span = args[1] if len(args) > 1 else "24h"
+    if not rows:
+        await reply(update, f"📜 Aucun swap enregistré pour <b>{name}</b> sur {span}."); return
+    spent = sum(-sol for *_x, sol in rows if sol < 0)
+    got = sum(sol for *_x, sol in rows if sol > 0)
+    lines = [f"📜 <b>{name}</b> — {len(rows)} derniers swaps ({span})"]
+    for ts, sig, mint, side, token_amt, sol in rows:
+        lines.append(f"<code>{_fmt_ts(ts)}</code> {SIDE_LABELS.get(side, side)} <code>{fmt_amount(abs(token_amt))}</code> "
+                     f"<a href=\"{solscan_tx(sig)}\">{_token_label(mint)}</a> — <code>{sol:+.3f} SOL</code>")
+    lines.append(f"Dépensé: <code>{spent:.3f} SOL</code> • Reçu: <code>{got:.3f} SOL</code> <i>({ms:.0f} ms)</i>")
+    await reply(update, "\n".join(lines))
+
+@register_command(name="who", help_text="!who <CA> [24h] — quels wallets suivis ici ont tradé ce token")
+async def cmd_who(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    if not args or not is_valid_pubkey(args[0]):
+        await reply(update, "Usage: <code>!who &lt;CA&gt; [24h|7d]</code>"); return
+    mint = args[0].strip()
+    window = parse_duration(args[1]) if len(args) > 1 else 86400.0
+    if not window:
+        await reply(update, "❌ Durée invalide. Ex: <code>24h</code>, <code>7d</code>"); return
+    subs: Dict[str, dict] = st.get("subs") or {}  # type: ignore[assignment]
+    await EVENTS.flush()
+    rows = await asyncio.to_thread(EVENTS.who, mint, time.time() - window, list(subs))
+    span = args[1] if len(args) > 1 else "24h"
+    if not rows:
+        await reply(update, f"👀 Aucun wallet suivi ici n'a tradé <code>{short_pk(mint)}</code> sur {span}."); return
+    lines = [f"👀 <b>{_token_label(mint)}</b> — {len(rows)} wallets ({span})"]
+    for wallet, buys, sells, sol, first, last in rows[:30]:
+        name = display_name(wallet, subs.get(wallet, {}))  # type: ignore[union-attr]
+        lines.append(f"• <a href=\"{solscan_addr(wallet)}\">{name}</a> — {buys} achats / {sells} ventes, "
+                     f"<code>{sol:+.3f} SOL</code> (1er: <code>{_fmt_ts(first)}</code>)")
+    await reply(update, "\n".join(lines))
+
+@register_command(name="export", help_text="(Admin) !export [7d] [adresse] — CSV des swaps des wallets suivis ici", admin=True, cost="net")
+async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    window = parse_duration(args[0]) if args else 7 * 86400.0
+    wallet = resolve_wallet(st, args[1]) if len(args) > 1 else None
+    subs: Dict[str, dict] = st.get("subs") or {}  # type: ignore[assignment]
+    if not window or (len(args) > 1 and wallet not in subs):
+        await reply(update, "Usage: <code>!export [7d] [adresse|alias]</code> (wallets suivis dans ce chat)"); return
+    await EVENTS.flush()
+    data = await asyncio.to_thread(EVENTS.export_csv, time.time() - window, [wallet] if wallet else list(subs))
+    msg = update.effective_message
+    if msg:
+        await msg.reply_document(document=data, filename=f"swaps-{args[0] if args else '7d'}.csv.gz")
+
+# ── Positions par wallet (PnL réel) ───────────────────────────────────────────
+# Mis à jour à chaque swap (coût moyen, en SOL, frais compris), sans relire
+# l'historique. Les prix de marque viennent des derniers trades observés
+# (swaps des wallets suivis + flux pump.fun des mints suivis).
+MARKS_MAX       = int(os.getenv("MARKS_MAX", "20000"))
+MARK_MAX_AGE    = float(os.getenv("MARK_MAX_AGE", "3600"))  # prix de marque plus vieux → latent non calculé
+LEADERBOARD_TOP = 15
+
+class MarkPrices:
+    """Dernier prix observé (SOL/token) par mint."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.by_mint: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # mint -> (px_sol, ts)
+
+    def note(self, mint: str, px_sol: float, ts: float):
+        if px_sol <= 0:
+            return
+        self.by_mint[mint] = (px_sol, ts)
+        self.by_mint.move_to_end(mint)
+        if len(self.by_mint) > self.max_size:
+            self.by_mint.popitem(last=False)
+
+    def get(self, mint: str) -> Optional[float]:
+        hit = self.by_mint.get(mint)
+        if not hit or time.time() - hit[1] > MARK_MAX_AGE:
+            return None
+        return hit[0]
+
+MARKS = MarkPrices(MARKS_MAX)
+
+class Position:
+    __slots__ = ("qty", "cost", "realized", "buys", "sells", "last_ts")
+
+    def __init__(self, qty: float = 0.0, cost: float = 0.0, realized: float = 0.0,
+                 buys: int = 0, sells: int = 0, last_ts: float = 0.0):
+        self.qty = qty            # tokens détenus
+        self.cost = cost          # coût (SOL) des tokens détenus
+        self.realized = realized  # PnL réalisé (SOL)
+        self.buys = buys
+        self.sells = sells
+        self.last_ts = last_ts
+
+    def unrealized(self, px_sol: Optional[float]) -> Optional[float]:
+        if self.qty <= 0:
+            return 0.0
+        return self.qty * px_sol - self.cost if px_sol else None
+
+class PositionLedger:
+    """
+    Positions tenues par le leader, écrites dans la table positions par events_loop.
+    Un (wallet, mint) absent de la mémoire peut exister en base (évincé, ou écrit
+    par un autre leader) : ses swaps attendent dans `cold` que events_loop l'ait
+    relu, puis y sont rejoués dans l'ordre.
+    """
+
+    def __init__(self):
+        self.by_wallet: Dict[str, Dict[str, Position]] = {}
+        self.dirty: set[Tuple[str, str]] = set()
+        self.cold: Dict[Tuple[str, str], List[tuple]] = {}  # (wallet, mint) -> jambes (sens, qté, side, SOL, ts)
+
+    def apply(self, ev: SwapEvent):
+        if ev.bought_mint:
+            self._leg(ev.owner, ev.bought_mint, (True, ev.bought_amt, ev.side, ev.sol_delta, ev.ts))
+        if ev.sold_mint:
+            self._leg(ev.owner, ev.sold_mint, (False, ev.sold_amt, ev.side, ev.sol_delta, ev.ts))
+
+    def _leg(self, wallet: str, mint: str, leg: tuple):
+        p = (self.by_wallet.get(wallet) or {}).get(mint)
+        if p is None:
+            self.cold.setdefault((wallet, mint), []).append(leg)
+            return
+        self._replay(p, leg)
+        self.dirty.add((wallet, mint))
+
+    @staticmethod
+    def _replay(p: Position, leg: tuple):
+        received, amt, side, sol_delta, ts = leg
+        if received:
+            p.qty += amt
+            if side == "buy":
+                p.cost += -sol_delta
+                p.buys += 1
+        else:
+            basis = p.cost * min(1.0, amt / p.qty) if p.qty > 0 else 0.0
+            p.cost -= basis
+            p.qty = max(0.0, p.qty - amt)
+            if side == "sell":
+                p.realized += sol_delta - basis
+                p.sells += 1
+            if p.qty <= 1e-9:
+                p.qty, p.cost = 0.0, 0.0
+        p.last_ts = ts
+
+    def warm(self, keys: List[Tuple[str, str]], rows: List[tuple]):
+        """(boucle) Installe les positions relues en base (ou neuves) et rejoue les swaps en attente."""
+        stored = {(wallet, mint): vals for wallet, mint, *vals in rows}
+        for key in keys:
+            legs = self.cold.pop(key, None)
+            if legs is None:
+                continue
+            p = Position(*stored[key]) if key in stored else Position()
+            for leg in legs:
+                self._replay(p, leg)
+            self.by_wallet.setdefault(key[0], {})[key[1]] = p
+            self.dirty.add(key)
+
+    def evict(self, fraction: float, watched: set[str]) -> int:
+        """Oublie positions fermées et wallets plus suivis, les moins récents (last_ts) d'abord ; tout est en base."""
+        stale = sorted((p.last_ts, wallet, mint) for wallet, book in self.by_wallet.items() for mint, p in book.items()
+                       if (wallet, mint) not in self.dirty and (p.qty <= 0 or wallet not in watched))
+        n = min(len(stale), max(1, int(len(stale) * fraction)))
+        for _ts, wallet, mint in stale[:n]:
+            book = self.by_wallet[wallet]
+            del book[mint]
+            if not book:
+                del self.by_wallet[wallet]
+        return n
+
+    def take_dirty(self) -> List[tuple]:
+        rows = []
+        for wallet, mint in self.dirty:
+            p = (self.by_wallet.get(wallet) or {}).get(mint)
+            if p is not None:
+                rows.append((wallet, mint, p.qty, p.cost, p.realized, p.buys, p.sells, int(p.last_ts)))
+        self.dirty.clear()
+        return rows
+
+LEDGER = PositionLedger()
+
+def position_summary(book: Dict[str, Position]) -> Tuple[float, float, int]:
+    """(réalisé, latent connu, positions ouvertes sans prix de marque)."""
+    realized = unrealized = 0.0
+    unpriced = 0
+    for mint, p in book.items():
+        realized += p.realized
+        u = p.unrealized(MARKS.get(mint))
+        if u is None:
+            unpriced += 1
+        else:
+            unrealized += u
+    return realized, unrealized, unpriced
+
+async def position_books(wallets: List[str]) -> Dict[str, Dict[str, Position]]:
+    """
+    Positions lues dans la base partagée, donc les mêmes sur toutes les machines ;
+    le leader y superpose ses positions en mémoire, pas encore écrites (≤ EVENTS_FLUSH_EVERY).
+    """
+    books: Dict[str, Dict[str, Position]] = {}
+    for wallet, mint, *vals in await asyncio.to_thread(EVENTS.positions_of, wallets):
+        books.setdefault(wallet, {})[mint] = Position(*vals)
+    if LEASE.held:
+        for wallet in wallets:
+            if wallet in LEDGER.by_wallet:
+                books.setdefault(wallet, {}).update(LEDGER.by_wallet[wallet])
+    return books
+
+@register_swap_listener("ledger")
+def _ledger_swap(ev: SwapEvent):
+    if ev.side == "buy" and ev.bought_amt > 0:
+        MARKS.note(ev.bought_mint, -ev.sol_delta / ev.bought_amt, ev.ts)  # type: ignore[arg-type]
+    elif ev.side == "sell" and ev.sold_amt > 0:
+        MARKS.note(ev.sold_mint, ev.sol_delta / ev.sold_amt, ev.ts)  # type: ignore[arg-type]
+    LEDGER.apply(ev)
+
+def _fmt_sol_pnl(sol: float) -> str:
+    usd = sol_fiat_price("usd")
+    return f"<code>{sol:+.3f} SOL</code>" + (f" (≈ ${fmt_amount(sol * usd)})" if usd else "")
+
+@register_command(name="wpnl", help_text="!wpnl <adresse|alias> — PnL réel d'un wallet suivi (réalisé + latent)")
+async def cmd_wpnl(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    if not args:
+        await reply(update, "Usage: <code>!wpnl &lt;adresse|alias&gt;</code>"); return
+    wallet = resolve_wallet(st, args[0])
+    book = (await position_books([wallet])).get(wallet) if wallet else None
+    if not wallet or not book:
+        await reply(update, "Aucune position connue pour ce wallet (elles se construisent à partir des swaps suivis)."); return
+    name = display_name(wallet, (st.get("subs") or {}).get(wallet, {}))  # type: ignore[union-attr]
+    realized, unrealized, unpriced = position_summary(book)
+    lines = [f"📊 <b>PnL {name}</b>",
+             f"Réalisé: {_fmt_sol_pnl(realized)}",
+             f"Latent: {_fmt_sol_pnl(unrealized)}" + (f" <i>({unpriced} sans prix récent)</i>" if unpriced else "")]
+    items = sorted(book.items(), key=lambda kv: -kv[1].last_ts)[:12]
+    for mint, p in items:
+        u = p.unrealized(MARKS.get(mint))
+        state = f"ouvert <code>{fmt_amount(p.qty)}</code>" if p.qty > 0 else "fermé"
+        lat = f" • latent <code>{u:+.3f}</code>" if p.qty > 0 and u is not None else ""
+        lines.append(f"• {_token_label(mint)} — {state}, coût <code>{p.cost:.3f}</code> • réalisé <code>{p.realized:+.3f}</code>{lat} "
+                     f"({p.buys}A/{p.sells}V)")
+    await reply(update, "\n".join(lines))
+
+@register_command(name="leaderboard", help_text="!leaderboard — classement PnL (SOL) des wallets suivis du chat", aliases=["lb"])
+async def cmd_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    st = await tracker_chat_state(update.effective_chat.id)
+    subs: Dict[str, dict] = st["subs"]  # type: ignore
+    board = []
+    for addr, book in (await position_books(list(subs))).items():
+        realized, unrealized, _unpriced = position_summary(book)
+        board.append((realized + unrealized, realized, unrealized, addr))
+    if not board:
+        await reply(update, "Pas encore de positions pour les wallets suivis ici."); return
+    board.sort(reverse=True)
+    lines = ["🏆 <b>Leaderboard PnL</b> (réalisé + latent, SOL)"]
+    for i, (total, realized, unrealized, addr) in enumerate(board[:LEADERBOARD_TOP], 1):
+        lines.append(f"{i}. <a href=\"{solscan_addr(addr)}\">{display_name(addr, subs[addr])}</a> — <code>{total:+.3f}</code> "
+                     f"(réalisé <code>{realized:+.3f}</code> • latent <code>{unrealized:+.3f}</code>)")
+    await reply(update, "\n".join(lines))
+
+# ── Consensus : co-achats des wallets suivis ──────────────────────────────────
+CONSENSUS_MAX_MINUTES = 120
+CONSENSUS_MINTS_MAX   = int(os.getenv("CONSENSUS_MINTS_MAX", "5000"))  # mints en fenêtre gardés par chat
+
+class CoBuyWindow:
+    """
+    Acheteurs distincts par mint sur la fenêtre d'un chat : dict ordonné par
+    dernier achat (wallet -> (ts, SOL)) + file (ts, mint) qui fait expirer en
+    O(1) amorti. Une seule alerte par vague, réarmée quand elle retombe.
+    """
+
+    __slots__ = ("n", "window", "min_sol", "mints", "order", "alerted")
+
+    def __init__(self, n: int, window: float, min_sol: float):
+        self.n = n
+        self.window = window
+        self.min_sol = min_sol
+        self.mints: Dict[str, "OrderedDict[str, Tuple[float, float]]"] = {}
+        self.order: deque = deque()
+        self.alerted: set[str] = set()
+
+    def _expire(self, now: float):
+        limit = now - self.window
+        order = self.order
+        while order and order[0][0] < limit:
+            _ts, mint = order.popleft()
+            buyers = self.mints.get(mint)
+            if buyers is None:
+                continue
+            while buyers and next(iter(buyers.values()))[0] < limit:
+                buyers.popitem(last=False)
+            if not buyers:
+                del self.mints[mint]
+                self.alerted.discard(mint)
+            elif len(buyers) < self.n:
+                self.alerted.discard(mint)
+
+    def add(self, mint: str, wallet: str, sol: float, ts: float) -> Optional[List[Tuple[str, float, float]]]:
+        """Acheteurs (wallet, ts, SOL) si ce buy fait franchir le seuil, sinon None."""
+        self._expire(ts)
+        if sol < self.min_sol:
+            return None
+        buyers = self.mints.get(mint)
+        if buyers is None:
+            if len(self.mints) >= CONSENSUS_MINTS_MAX:
+                old = next(iter(self.mints))
+                del self.mints[old]
+                self.alerted.discard(old)
+            buyers = self.mints[mint] = OrderedDict()
+        prev = buyers.pop(wallet, None)
+        buyers[wallet] = (ts, sol + (prev[1] if prev else 0.0))
+        self.order.append((ts, mint))
+        if len(buyers) >= self.n and mint not in self.alerted:
+            self.alerted.add(mint)
+            return [(w, t, s) for w, (t, s) in buyers.items()]
+        return None
+
+_cobuy: Dict[int, CoBuyWindow] = {}
+CONSENSUS_OUTBOX: deque = deque()  # (chat_id, mint, acheteurs) en attente d'envoi
+CONSENSUS_READY = asyncio.Event()
+
+def _cobuy_window(chat_id: int, conf: dict) -> CoBuyWindow:
+    n, window, min_sol = int(conf["n"]), float(conf["minutes"]) * 60, float(conf.get("min_sol") or 0.0)
+    win = _cobuy.get(chat_id)
+    if win is None or (win.n, win.window, win.min_sol) != (n, window, min_sol):
+        win = _cobuy[chat_id] = CoBuyWindow(n, window, min_sol)
+    return win
+
+@register_swap_listener("consensus")
+def _consensus_swap(ev: SwapEvent):
+    if ev.side != "buy" or not ev.bought_mint:
+        return
+    for chat_id, cfg in TRACKER_STATE.items():
+        conf = cfg.get("consensus")
+        if not conf:
+            _cobuy.pop(chat_id, None)  # coupé, peut-être depuis une autre machine : fenêtre oubliée ici
+            continue
+        if ev.owner not in (cfg.get("subs") or {}):
+            continue
+        hit = _cobuy_window(chat_id, conf).add(ev.bought_mint, ev.owner, -ev.sol_delta, ev.ts)  # type: ignore[arg-type]
+        if hit:
+            CONSENSUS_OUTBOX.append((chat_id, ev.bought_mint, hit))
+            CONSENSUS_READY.set()
+
+def render_consensus(mint: str, md: dict, buyers: List[Tuple[str, float, float]], subs: dict) -> str:
+    label = f"${md['symbol']}" if md.get("symbol") else short_pk(mint)
+    span = max(t for _w, t, _s in buyers) - min(t for _w, t, _s in buyers)
+    total = sum(s for _w, _t, s in buyers)
+    lines = [f"🧠 <b>Consensus</b> — {len(buyers)} wallets suivis ont acheté <b>{label}</b> en {max(1, round(span / 60))} min"]
+    for wallet, ts, sol in sorted(buyers, key=lambda b: b[1]):
+        lines.append(f"• <a href=\"{solscan_addr(wallet)}\">{display_name(wallet, subs.get(wallet, {}))}</a> — "
+                     f"<code>{sol:.2f} SOL</code> ({_fmt_ts(ts)})")
+    lines.append(f"Total: <code>{total:.2f} SOL</code>{fiat_suffix(total)}")
+    lines.append(f"CA: <code>{mint}</code>")
+    return "\n".join(lines)
+
+async def consensus_loop(app: Application):
+    async with aiohttp.ClientSession() as session:
+        while True:
+            await CONSENSUS_READY.wait()
+            CONSENSUS_READY.clear()
+            while CONSENSUS_OUTBOX:
+                chat_id, mint, buyers = CONSENSUS_OUTBOX.popleft()
+                cfg = TRACKER_STATE.get(chat_id)
+                if not cfg:
+                    continue
+                try:
+                    md = await TOKENS.get(session, mint)
+                    await app.bot.send_message(chat_id=chat_id, text=render_consensus(mint, md, buyers, cfg.get("subs") or {}),
+                                               parse_mode="HTML", disable_web_page_preview=True,
+                                               disable_notification=bool(cfg.get("silent", False)))
+                except Exception as e:
+                    logger.warning("consensus alert failed: %s", e)
+
+@register_command(name="consensus", help_text="!consensus <N> <minutes> [min_SOL] | off — alerte quand N wallets suivis achètent le même token", cost="write")
+async def cmd_consensus(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    chat_id = update.effective_chat.id
+    st = await tracker_chat_state(chat_id)
+    usage = "Usage: <code>!consensus 3 5 [0.5]</code> (N wallets, en X minutes, achat min en SOL) • <code>!consensus off</code>"
+    if not args:
+        conf = st.get("consensus")
+        if not conf:
+            await reply(update, f"Consensus désactivé. {usage}"); return
+        await reply(update, f"🧠 <b>Consensus</b>: <code>{conf['n']}</code> wallets en <code>{conf['minutes']:g} min</code>"
+                            + (f", achat ≥ <code>{conf['min_sol']:g} SOL</code>" if conf.get("min_sol") else "")); return
+    if len(args) == 1 and args[0].lower() == "off":
+        st["consensus"] = None
+        _cobuy.pop(chat_id, None)  # sur le leader ; ailleurs il l'oublie au prochain achat suivi
+        await save_state()
+        await reply(update, "⚙️ <b>Consensus</b> → <code>OFF</code>"); return
+    try:
+        n = int(args[0])
+        minutes = float(args[1].replace(",", "."))
+        min_sol = float(args[2].replace(",", ".")) if len(args) > 2 else 0.0
+        if n < 2 or not 0 < minutes <= CONSENSUS_MAX_MINUTES or min_sol < 0:
+            raise ValueError()
+    except (ValueError, IndexError):
+        await reply(update, f"❌ Paramètres invalides (N ≥ 2, 0 &lt; minutes ≤ {CONSENSUS_MAX_MINUTES}).\n{usage}"); return
+    st["consensus"] = {"n": n, "minutes": minutes, "min_sol": min_sol}
+    await save_state()
+    await reply(update, f"⚙️ <b>Consensus</b> → <code>{n}</code> wallets en <code>{minutes:g} min</code>"
+                        + (f", achat ≥ <code>{min_sol:g} SOL</code>" if min_sol else ""))
+
+# ── Tendances : top-K des mints achetés (Space-Saving par tranche de temps) ────
+TREND_BUCKET  = float(os.getenv("TREND_BUCKET", "900"))   # tranche (s) ; 1h = 4 tranches, 24h = 96
+TREND_HORIZON = float(os.getenv("TREND_HORIZON", "86400"))
+TREND_K       = int(os.getenv("TREND_K", "32"))           # compteurs par tranche et par portée
+TREND_SHOW    = 10
+
+class SpaceSaving:
+    """Heavy hitters à mémoire bornée : k compteurs [achats, erreur max, SOL]."""
+
+    __slots__ = ("k", "items")
+
+    def __init__(self, k: int, items: Optional[Dict[str, List[float]]] = None):
+        self.k = k
+        self.items: Dict[str, List[float]] = items or {}
+
+    def add(self, key: str, sol: float):
+        it = self.items.get(key)
+        if it is not None:
+            it[0] += 1
+            it[2] += sol
+        elif len(self.items) < self.k:
+            self.items[key] = [1, 0, sol]
+        else:
+            victim = min(self.items, key=lambda m: self.items[m][0])
+            floor = self.items.pop(victim)[0]
+            self.items[key] = [floor + 1, floor, sol]
+
+class TrendIndex:
+    """Un sketch par (portée, tranche) ; portée = "global" ou chat_id. Fusion à la requête."""
+
+    def __init__(self, bucket: float, horizon: float, k: int):
+        self.bucket = bucket
+        self.n_buckets = int(horizon // bucket) + 1
+        self.k = k
+        self.scopes: Dict[str, Dict[int, SpaceSaving]] = {}
+
+    def add(self, scope: str, mint: str, sol: float, ts: float):
+        b = int(ts // self.bucket)
+        buckets = self.scopes.setdefault(scope, {})
+        sk = buckets.get(b)
+        if sk is None:
+            sk = buckets[b] = SpaceSaving(self.k)
+            for old in [x for x in buckets if x <= b - self.n_buckets]:
+                del buckets[old]
+        sk.add(mint, sol)
+
+    def top(self, scope: str, window: float, n: int) -> List[Tuple[str, List[float]]]:
+        lo = int((time.time() - window) // self.bucket)
+        merged: Dict[str, List[float]] = {}
+        for b, sk in (self.scopes.get(scope) or {}).items():
+            if b <= lo:
+                continue
+            for mint, (cnt, err, sol) in sk.items.items():
+                acc = merged.get(mint)
+                if acc is None:
+                    merged[mint] = [cnt, err, sol]
+                else:
+                    acc[0] += cnt; acc[1] += err; acc[2] += sol
+        return sorted(merged.items(), key=lambda kv: (-kv[1][0], -kv[1][2]))[:n]
+
+    def dump(self) -> dict:
+        """Copie JSON-able (indépendante des sketches vivants, sérialisable hors de la boucle)."""
+        return {scope: {str(b): {m: list(c) for m, c in sk.items.items()} for b, sk in buckets.items()}
+                for scope, buckets in self.scopes.items()}
+
+    def load(self, data: dict):
+        floor = int(time.time() // self.bucket) - self.n_buckets
+        for scope, buckets in (data or {}).items():
+            for b, items in buckets.items():
+                if int(b) > floor:
+                    self.scopes.setdefault(scope, {})[int(b)] = SpaceSaving(self.k, items)
+
+TRENDS = TrendIndex(TREND_BUCKET, TREND_HORIZON, TREND_K)
+
+@register_swap_listener("trending")
+def _trend_swap(ev: SwapEvent):
+    if ev.side != "buy" or not ev.bought_mint:
+        return
+    sol = -ev.sol_delta
+    TRENDS.add("global", ev.bought_mint, sol, ev.ts)
+    for chat_id, cfg in TRACKER_STATE.items():
+        if ev.owner in (cfg.get("subs") or {}):
+            TRENDS.add(str(chat_id), ev.bought_mint, sol, ev.ts)
+
+@register_command(name="trending", help_text="!trending [1h|24h] [global] — tokens les plus achetés par les wallets suivis", aliases=["trend"])
+async def cmd_trending(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    window = 3600.0
+    scope = str(update.effective_chat.id)
+    for a in args:
+        if a.lower() == "global":
+            scope = "global"
+        elif parse_duration(a):
+            window = min(parse_duration(a) or window, TREND_HORIZON)
+        else:
+            await reply(update, "Usage: <code>!trending [1h|24h] [global]</code>"); return
+    t0 = time.perf_counter()
+    if LEASE.held:
+        top = TRENDS.top(scope, window, TREND_SHOW)
+    else:
+        # les sketches ne sont nourris que chez le leader : ici, comptes exacts depuis l'historique partagé
+        wallets = None if scope == "global" else list((await tracker_chat_state(update.effective_chat.id))["subs"])  # type: ignore[arg-type]
+        rows = await asyncio.to_thread(EVENTS.top_bought, time.time() - window, TREND_SHOW, wallets)
+        top = [(mint, [cnt, 0, sol]) for mint, cnt, sol in rows]
+    ms = (time.perf_counter() - t0) * 1000
+    where = "tous les chats" if scope == "global" else "wallets suivis ici"
+    span = f"{window / 3600:g}h" if window >= 3600 else f"{window / 60:g} min"
+    if not top:
+        await reply(update, f"📈 Aucun achat des {where} sur {span}."); return
+    lines = [f"📈 <b>Trending</b> — {where}, {span}"]
+    for i, (mint, (cnt, err, sol)) in enumerate(top, 1):
+        approx = "~" if err else ""
+        lines.append(f"{i}. <b>{_token_label(mint)}</b> — {approx}<code>{int(cnt)}</code> achats • <code>{sol:.2f} SOL</code> "
+                     f"• <code>{short_pk(mint)}</code>")
+    lines.append(f"<i>({ms:.1f} ms)</i>")
+    await reply(update, "\n".join(lines))
+
+# ── Priority fees en direct (échantillonnage en fond) ─────────────────────────
+# getRecentPrioritizationFees ne compte que les tx qui verrouillent ces comptes en
+# écriture : jamais un program id. Vide = frais globaux ; sinon des comptes
+# écrits à chaque swap (fee recipient pump.fun, pool chaude…), séparés par des virgules.
+FEE_ACCOUNTS     = [a for a in os.getenv("FEE_ACCOUNTS", "").split(",") if a]
+FEE_WINDOW_SLOTS = int(os.getenv("FEE_WINDOW_SLOTS", "900"))     # ~6 min de slots gardés
+FEE_IDLE_EVERY   = float(os.getenv("FEE_IDLE_EVERY", "60"))      # période quand personne ne demande
+FEE_ACTIVE_EVERY = float(os.getenv("FEE_ACTIVE_EVERY", "10"))    # période quand !fees est utilisé
+FEE_ACTIVE_FOR   = float(os.getenv("FEE_ACTIVE_FOR", "300"))     # "utilisé" = demandé dans cette fenêtre
+FEE_CU           = int(os.getenv("FEE_CU", "200000"))            # compute units d'un swap type (conversion en SOL)
+FEE_LEVELS       = (("Low", 0.25), ("Medium", 0.50), ("High", 0.75), ("Turbo", 0.95))
+
+class FeeSampler:
+    """Fenêtre glissante de getRecentPrioritizationFees (µlamports/CU par slot), percentiles précalculés."""
+
+    def __init__(self):
+        self.samples: Dict[int, int] = {}  # slot -> fee
+        self.levels: Dict[str, int] = {}
+        self.updated_at = 0.0
+        self.asked_at = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def ingest(self, rows: List[dict]):
+        for r in rows:
+            slot, fee = r.get("slot"), r.get("prioritizationFee")
+            if isinstance(slot, int) and isinstance(fee, int):
+                self.samples[slot] = fee
+        if not self.samples:
+            return
+        top = max(self.samples)
+        self.samples = {s: f for s, f in self.samples.items() if s > top - FEE_WINDOW_SLOTS}
+        fees = sorted(self.samples.values())
+        self.levels = {name: fees[min(len(fees) - 1, int(q * len(fees)))] for name, q in FEE_LEVELS}
+        self.updated_at = time.time()
+
+    def snapshot(self) -> Tuple[Dict[str, int], float]:
+        """(niveaux, âge en s) depuis la mémoire ; accélère l'échantillonnage si c'est périmé."""
+        self.asked_at = time.monotonic()
+        age = time.time() - self.updated_at
+        if age > FEE_ACTIVE_EVERY:
+            self._wake.set()
+        return self.levels, age
+
+    async def _sample(self, session: aiohttp.ClientSession):
+        url = default_http_rpc()
+        await rpc_budget(url).take()
+        data = await rpc_post(session, url, "getRecentPrioritizationFees", [FEE_ACCOUNTS] if FEE_ACCOUNTS else [])
+        self.ingest((data or {}).get("result") or [])
+
+    async def _loop(self):
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await self._sample(session)
+                except Exception as e:
+                    logger.warning("priority fee sample failed: %s", e)
+                active = time.monotonic() - self.asked_at < FEE_ACTIVE_FOR
+                try:
+                    await asyncio.wait_for(self._wake.wait(), FEE_ACTIVE_EVERY if active else FEE_IDLE_EVERY)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+FEES = FeeSampler()
+
+def fee_sol(micro_lamports_per_cu: int) -> float:
+    return micro_lamports_per_cu * FEE_CU / 1e15
+
+# ── Bonding curve pump.fun en direct (!bond <mint>) ───────────────────────────
+BOND_TTL        = float(os.getenv("BOND_TTL", "10"))         # un !bond sur le même mint dans ce délai = 0 appel RPC
+BOND_BATCH_MS   = float(os.getenv("BOND_BATCH_MS", "50"))    # fenêtre de regroupement des lectures
+BOND_CACHE_MAX  = 5000
+PUMP_REAL_TOKENS_INIT = 793_100_000 * 10 ** 6                # tokens vendables sur la courbe (6 décimales)
+_BOND_LAYOUT    = struct.Struct("<8sQQQQQ?")                 # disc, virt_tok, virt_sol, real_tok, real_sol, supply, complete
+
+# PDA Solana : sha256(seeds | bump | program | "ProgramDerivedAddress") hors de la courbe ed25519
+_ED_P = 2 ** 255 - 19
+_ED_D = (-121665 * pow(121666, _ED_P - 2, _ED_P)) % _ED_P
+
+def is_on_curve(key: bytes) -> bool:
+    """La clé (32 octets) se décompresse-t-elle en point ed25519 ? (critère d'Euler sur x²)"""
+    y = int.from_bytes(key, "little") & ((1 << 255) - 1)
+    if y >= _ED_P:
+        return False
+    yy = y * y % _ED_P
+    x2 = (yy - 1) * pow((_ED_D * yy + 1) % _ED_P, _ED_P - 2, _ED_P) % _ED_P
+    return x2 == 0 or pow(x2, (_ED_P - 1) // 2, _ED_P) == 1
+
+def find_program_address(seeds: List[bytes], program: bytes) -> bytes:
+    for bump in range(255, -1, -1):
+        h = hashlib.sha256(b"".join(seeds) + bytes([bump]) + program + b"ProgramDerivedAddress").digest()
+        if not is_on_curve(h):
+            return h
+    raise ValueError("no viable bump")
+
+_PUMP_KEY = b58decode(PUMP_PROGRAM)
+_curve_pdas: Dict[str, str] = {}
+
+def bonding_curve_address(mint: str) -> str:
+    pda = _curve_pdas.get(mint)
+    if pda is None:
+        if len(_curve_pdas) > BOND_CACHE_MAX:
+            _curve_pdas.clear()
+        pda = _curve_pdas[mint] = b58encode(find_program_address([b"bonding-curve", b58decode(mint)], _PUMP_KEY))
+    return pda
+
+class BondingCurve:
+    __slots__ = ("virt_tok", "virt_sol", "real_tok", "real_sol", "supply", "complete")
+
+    def __init__(self, raw: bytes):
+        (_disc, self.virt_tok, self.virt_sol, self.real_tok, self.real_sol,
+         self.supply, self.complete) = _BOND_LAYOUT.unpack_from(raw)
+
+    @property
+    def progress(self) -> float:
+        if self.complete:
+            return 1.0
+        return max(0.0, min(1.0, 1 - self.real_tok / PUMP_REAL_TOKENS_INIT))
+
+    def _mc_sol(self, virt_sol: float, virt_tok: float) -> float:
+        # prix (SOL/token, 6 décimales) × supply
+        return (virt_sol / 1e9) / (virt_tok / 1e6) * (self.supply / 1e6) if virt_tok else 0.0
+
+    @property
+    def mc_sol(self) -> float:
+        return self._mc_sol(self.virt_sol, self.virt_tok)
+
+    @property
+    def bond_mc_sol(self) -> float:
+        """MC quand la courbe est vidée (produit constant des réserves virtuelles)."""
+        end_tok = self.virt_tok - self.real_tok
+        if end_tok <= 0:
+            return self.mc_sol
+        return self._mc_sol(self.virt_sol * self.virt_tok / end_tok, end_tok)
+
+    @property
+    def sol_to_bond(self) -> float:
+        end_tok = self.virt_tok - self.real_tok
+        if end_tok <= 0 or self.complete:
+            return 0.0
+        return (self.virt_sol * self.virt_tok / end_tok - self.virt_sol) / 1e9
+
+class BondCache:
+    """
+    Courbes décodées par mint, TTL court. Les lectures manquantes sont regroupées
+    sur BOND_BATCH_MS puis lues en un getMultipleAccounts (100 comptes/appel) ;
+    un mint déjà en vol est partagé (single-flight).
+    """
+
+    def __init__(self):
+        self.by_mint: "OrderedDict[str, Tuple[Optional[BondingCurve], float]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush: Optional[asyncio.Task] = None
+        self.rpc_calls = 0
+
+    async def get(self, url: str, mint: str) -> Optional[BondingCurve]:
+        hit = self.by_mint.get(mint)
+        if hit is not None and time.time() - hit[1] < BOND_TTL:
+            return hit[0]
+        fut = self._pending.get(mint)
+        if fut is None:
+            fut = self._pending[mint] = asyncio.get_running_loop().create_future()
+            if self._flush is None or self._flush.done():
+                self._flush = asyncio.create_task(self._flush_after(url))
+        return await asyncio.shield(fut)
+
+    async def _flush_after(self, url: str):
+        await asyncio.sleep(BOND_BATCH_MS / 1000)
+        pend, self._pending = self._pending, {}
+        self._flush = None  # les demandes arrivées pendant le fetch partent dans le lot suivant
+        mints = list(pend)
+        found: Dict[str, Optional[BondingCurve]] = {}
+        try:
+            async with aiohttp.ClientSession() as session:
+                for i in range(0, len(mints), 100):
+                    chunk = mints[i:i + 100]
+                    await rpc_budget(url).take()
+                    self.rpc_calls += 1
+                    data = await rpc_post(session, url, "getMultipleAccounts",
+                                          [[bonding_curve_address(m) for m in chunk], {"encoding": "base64"}])
+                    values = ((data or {}).get("result") or {}).get("value") or []
+                    for mint, acc in zip(chunk, values):
+                        raw = base64.b64decode(((acc or {}).get("data") or [""])[0] or "")
+                        found[mint] = BondingCurve(raw) if len(raw) >= _BOND_LAYOUT.size else None
+            now = time.time()
+            for mint, curve in found.items():
+                self.by_mint[mint] = (curve, now)
+                self.by_mint.move_to_end(mint)
+            while len(self.by_mint) > BOND_CACHE_MAX:
+                self.by_mint.popitem(last=False)
+        except Exception as e:
+            logger.warning("bonding curve fetch failed (%d mints): %s", len(mints), e)
+        for mint, fut in pend.items():
+            if not fut.done():
+                fut.set_result(found.get(mint))
+
+BONDS = BondCache()
+
+def render_bond(mint: str, curve: BondingCurve) -> str:
+    label = _token_label(mint)
+    usd = sol_fiat_price("usd")
+
+    def mc(sol: float) -> str:
+        return f"<code>{fmt_amount(sol * usd)}</code> $ (≈ {fmt_amount(sol)} SOL)" if usd else f"<code>{fmt_amount(sol)}</code> SOL"
+
+    pct = curve.progress * 100
+    bar = "█" * int(pct // 10) + "░" * (10 - int(pct // 10))
+    lines = [f"<b>🔄 Bonding curve {label}</b>"]
+    if curve.complete:
+        lines.append("✅ <b>Bondé</b> — courbe terminée, liquidité migrée vers le DEX.")
+    else:
+        lines.append(f"<code>{bar}</code> <b>{pct:.1f}%</b>")
+        lines.append(f"SOL dans la courbe: <code>{curve.real_sol / 1e9:.2f} SOL</code> • reste ≈ <code>{curve.sol_to_bond:.2f} SOL</code>")
+    lines.append(f"MC actuelle: {mc(curve.mc_sol)}")
+    if not curve.complete:
+        lines.append(f"MC estimée au bond: {mc(curve.bond_mc_sol)}")
+    lines.append(f"CA: <code>{mint}</code>")
+    return "\n".join(lines)
+
+async def reply_bond(update: Update, mint: str):
+    if not is_valid_pubkey(mint) or len(b58decode(mint)) != 32:
+        await reply(update, "❌ CA invalide. Ex: <code>!bond &lt;CA&gt;</code>"); return
+    curve = await BONDS.get(default_http_rpc(), mint)
+    if curve is None:
+        await reply(update, f"Pas de bonding curve pump.fun pour <code>{short_pk(mint)}</code> (token hors pump.fun ou RPC indisponible).")
+        return
+    await reply(update, render_bond(mint, curve))
+
+# ── Rapport de risque d'un token (!check <mint>) ──────────────────────────────
+CHECK_TTL       = float(os.getenv("CHECK_TTL", "30"))   # même mint re-vérifié dans ce délai = réponse du cache
+CHECK_MAX       = 2000
+CHECK_TOP       = 20                                    # comptes renvoyés par getTokenLargestAccounts
+RAYDIUM_AUTHORITY = "5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1"  # détient les vaults des pools AMM v4
+
+class TokenRisk:
+    __slots__ = ("mint", "supply", "decimals", "mint_auth", "freeze_auth", "holders", "pool", "pool_pct", "curve", "at")
+
+    def __init__(self, mint: str):
+        self.mint = mint
+        self.supply = 0.0
+        self.decimals = 0
+        self.mint_auth: Optional[str] = None
+        self.freeze_auth: Optional[str] = None
+        self.holders: List[Tuple[str, float]] = []  # (owner, montant), pools/courbe exclus
+        self.pool: Optional[str] = None             # "curve" | "raydium" | None
+        self.pool_pct = 0.0
+        self.curve: Optional[BondingCurve] = None
+        self.at = time.time()
+
+    def top_pct(self, n: int) -> float:
+        return sum(a for _, a in self.holders[:n]) / self.supply * 100 if self.supply else 0.0
+
+class RiskCache:
+    """
+    Un rapport par mint, TTL court. Calcul à froid : un batch JSON-RPC
+    (getTokenLargestAccounts + getAccountInfo + getTokenSupply) en parallèle de
+    la lecture de la bonding curve, puis un getMultipleAccounts pour résoudre les
+    propriétaires des gros comptes. Les demandes simultanées partagent le calcul.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.by_mint: "OrderedDict[str, TokenRisk]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.computed = 0
+
+    async def _compute(self, url: str, mint: str) -> Optional[TokenRisk]:
+        risk = TokenRisk(mint)
+        try:
+            async with aiohttp.ClientSession() as session:
+                cached = SUPPLY.peek(mint)  # déjà lue pour une alerte : pas de getTokenSupply
+                calls = [("getTokenLargestAccounts", [mint]), ("getAccountInfo", [mint, {"encoding": "jsonParsed"}])]
+                if cached is None:
+                    calls.append(("getTokenSupply", [mint]))
+                (largest, info, *supply), curve, _meta = await asyncio.gather(
+                    rpc_batch(session, url, calls),
+                    BONDS.get(url, mint),
+                    TOKENS.get(session, mint),
+                )
+                parsed = (((info or {}).get("value") or {}).get("data") or {}) if isinstance(info, dict) else {}
+                minfo = (parsed.get("parsed") or {}).get("info") or {} if isinstance(parsed, dict) else {}
+                if cached is not None and minfo.get("decimals") is not None:
+                    risk.decimals = int(minfo["decimals"])
+                    risk.supply = cached
+                else:
+                    val = (supply[0] or {}).get("value") if supply and isinstance(supply[0], dict) else None
+                    if not val or val.get("amount") is None:
+                        return None
+                    risk.decimals = int(val.get("decimals") or 0)
+                    risk.supply = int(val["amount"]) / 10 ** risk.decimals
+                    SUPPLY.put(mint, risk.supply)
+                risk.mint_auth = minfo.get("mintAuthority")
+                risk.freeze_auth = minfo.get("freezeAuthority")
+                risk.curve = curve
+                accounts = [(a.get("address"), float(a.get("uiAmount") or 0))
+                            for a in ((largest or {}).get("value") or [] if isinstance(largest, dict) else [])[:CHECK_TOP]]
+                owners: List[Optional[str]] = [None] * len(accounts)
+                if accounts:
+                    await rpc_budget(url).take()
+                    data = await rpc_post(session, url, "getMultipleAccounts",
+                                          [[a for a, _ in accounts], {"encoding": "jsonParsed"}])
+                    for i, acc in enumerate(((data or {}).get("result") or {}).get("value") or []):
+                        raw = (acc or {}).get("data")
+                        if isinstance(raw, dict):
+                            owners[i] = ((raw.get("parsed") or {}).get("info") or {}).get("owner")
+            curve_pda = bonding_curve_address(mint) if curve is not None else None
+            for (addr, amount), owner in zip(accounts, owners):
+                owner = owner or addr
+                if curve_pda and owner == curve_pda:
+                    risk.pool, risk.pool_pct = "curve", risk.pool_pct + amount
+                elif owner == RAYDIUM_AUTHORITY:
+                    risk.pool, risk.pool_pct = "raydium", risk.pool_pct + amount
+                else:
+                    risk.holders.append((owner, amount))
+            if risk.supply:
+                risk.pool_pct = risk.pool_pct / risk.supply * 100
+        except Exception as e:
+            logger.warning("token check failed for %s: %s", mint, e)
+            return None
+        self.by_mint[mint] = risk
+        self.by_mint.move_to_end(mint)
+        if len(self.by_mint) > self.max_size:
+            self.by_mint.popitem(last=False)
+        self.computed += 1
+        return risk
+
+    async def get(self, url: str, mint: str) -> Optional[TokenRisk]:
+        hit = self.by_mint.get(mint)
+        if hit is not None and time.time() - hit.at < CHECK_TTL:
+            return hit
+        task = self._inflight.get(mint)
+        if task is None:
+            task = self._inflight[mint] = asyncio.create_task(self._compute(url, mint))
+            task.add_done_callback(lambda _t, m=mint: self._inflight.pop(m, None))
+        return await asyncio.shield(task)
+
+RISKS = RiskCache(CHECK_MAX)
+
+def render_risk(risk: TokenRisk) -> str:
+    flags: List[str] = []
+    lines = [f"<b>🔎 Check {_token_label(risk.mint)}</b>",
+             f"Supply: <code>{fmt_amount(risk.supply)}</code> ({risk.decimals} déc.)"]
+    if risk.mint_auth:
+        lines.append(f"Mint authority: ⚠️ active (<code>{short_pk(risk.mint_auth)}</code>)")
+        flags.append("mint")
+    else:
+        lines.append("Mint authority: ✅ révoquée")
+    if risk.freeze_auth:
+        lines.append(f"Freeze authority: ⚠️ active (<code>{short_pk(risk.freeze_auth)}</code>)")
+        flags.append("freeze")
+    else:
+        lines.append("Freeze authority: ✅ révoquée")
+    if risk.curve is not None and not risk.curve.complete:
+        lines.append(f"LP: bonding curve pump.fun ({risk.curve.progress * 100:.1f}%, {risk.pool_pct:.1f}% de la supply) — pas encore de pool")
+    elif risk.pool == "raydium":
+        lines.append(f"LP: pool Raydium, {risk.pool_pct:.1f}% de la supply")
+    elif risk.curve is not None:
+        lines.append("LP: bondé (migré vers le DEX)")
+    else:
+        lines.append("LP: pool non détectée dans les plus gros holders")
+    top1, top10 = risk.top_pct(1), risk.top_pct(10)
+    lines.append(f"Top 1: <b>{top1:.1f}%</b> • Top 10: <b>{top10:.1f}%</b> (hors pool/courbe)")
+    if top1 > 10 or top10 > 40:
+        flags.append("concentration")
+    for owner, amount in risk.holders[:5]:
+        pct = amount / risk.supply * 100 if risk.supply else 0.0
+        lines.append(f"• <code>{short_pk(owner)}</code> {pct:.2f}%")
+    lines.append(("⚠️ Points d'attention: " + ", ".join(flags)) if flags else "✅ Rien d'anormal sur ces critères (DYOR).")
+    lines.append(f"<i>données de {_fmt_ts(risk.at)} UTC</i>")
+    return "\n".join(lines)
+
+@register_command(name="check", help_text="!check <CA> — concentration des holders, authorities, supply, LP", aliases=["rugcheck"], cost="net")
+async def cmd_check(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    mint = args[0].strip() if args else ""
+    if not is_valid_pubkey(mint):
+        await reply(update, "Usage: <code>!check &lt;CA&gt;</code>"); return
+    risk = await RISKS.get(default_http_rpc(), mint)
+    if risk is None:
+        await reply(update, f"❌ Impossible de lire le mint <code>{short_pk(mint)}</code> (pas un token SPL ou RPC indisponible)."); return
+    await reply(update, render_risk(risk))
+
+# ── Premiers acheteurs d'un token (!early <mint> [N]) ─────────────────────────
+EARLY_DEFAULT   = 10
+EARLY_MAX       = 30                                      # N max (et boutons !watch affichés)
+EARLY_PAGES     = int(os.getenv("EARLY_PAGES", "100"))    # pages de 1000 signatures remontées au plus
+EARLY_BATCH     = int(os.getenv("EARLY_BATCH", "20"))     # getTransaction par requête batch
+EARLY_PARALLEL  = int(os.getenv("EARLY_PARALLEL", "3"))   # requêtes batch en vol (le budget RPC s'applique en plus)
+EARLY_TTL       = float(os.getenv("EARLY_TTL", "21600"))  # les premiers acheteurs ne changent pas
+EARLY_CACHE_MAX = 500
+
+class EarlyBuyers:
+    __slots__ = ("mint", "n", "buyers", "scanned", "total", "complete", "at")
+
+    def __init__(self, mint: str, n: int):
+        self.mint = mint
+        self.n = n
+        self.buyers: List[Tuple[str, float, Optional[int], str]] = []  # (wallet, SOL dépensés, blockTime, signature)
+        self.scanned = 0   # transactions décodées
+        self.total = 0     # signatures remontées
+        self.complete = False  # remonté jusqu'à la création (sinon EARLY_PAGES atteint)
+        self.at = time.time()
+
+class EarlyCache:
+    """
+    Remonte getSignaturesForAddress(mint) jusqu'aux premières transactions, puis
+    les charge de la plus ancienne à la plus récente par vagues de
+    EARLY_PARALLEL batchs de EARLY_BATCH, jusqu'à N acheteurs distincts.
+    Acheteur = signataire dont compute_deltas_and_new donne +mint et −SOL.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.by_mint: "OrderedDict[str, EarlyBuyers]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def _oldest_signatures(self, session: aiohttp.ClientSession, url: str, mint: str, res: EarlyBuyers) -> List[dict]:
+        pages: "deque[List[dict]]" = deque(maxlen=2)  # les premières transactions sont dans les deux dernières pages
+        before = None
+        for _ in range(EARLY_PAGES):
+            await rpc_budget(url).take()
+            opts: dict = {"limit": 1000}
+            if before:
+                opts["before"] = before
+            data = await rpc_post(session, url, "getSignaturesForAddress", [mint, opts])
+            sigs = (data or {}).get("result") or []
+            if not sigs:
+                break
+            pages.append(sigs)
+            res.total += len(sigs)
+            before = sigs[-1].get("signature")
+            if len(sigs) < 1000:
+                res.complete = True
+                oldest = sigs[-1].get("blockTime")
+                if oldest:
+                    MINT_AGES.store(mint, float(oldest), True)  # profite du parcours pour la date de naissance
+                break
+        rows = [r for page in pages for r in page]
+        rows.reverse()
+        return rows
+
+    async def _compute(self, url: str, mint: str, n: int) -> Optional[EarlyBuyers]:
+        res = EarlyBuyers(mint, n)
+        seen: set[str] = set()
+        try:
+            async with aiohttp.ClientSession() as session:
+                rows = await self._oldest_signatures(session, url, mint, res)
+                sigs = [r["signature"] for r in rows if r.get("signature") and not r.get("err")]
+                wave = EARLY_BATCH * EARLY_PARALLEL
+                for i in range(0, len(sigs), wave):
+                    chunk = sigs[i:i + wave]
+                    parts = [chunk[j:j + EARLY_BATCH] for j in range(0, len(chunk), EARLY_BATCH)]
+                    fetched = await asyncio.gather(*(fetch_txs_batch(session, url, p) for p in parts), return_exceptions=True)
+                    for part, txs in zip(parts, fetched):
+                        if isinstance(txs, BaseException):
+                            logger.debug("early tx batch failed: %s", txs)
+                            continue
+                        for sig, tx in zip(part, txs):
+                            if not tx:
+                                continue
+                            res.scanned += 1
+                            keys = ((tx.get("transaction") or {}).get("message") or {}).get("accountKeys") or []
+                            if not keys:
+                                continue
+                            payer = keys[0] if isinstance(keys[0], str) else keys[0].get("pubkey")
+                            if not payer or payer in seen:
+                                continue
+                            deltas, sol_delta, _new = compute_deltas_and_new(tx, payer)
+                            if deltas.get(mint, 0.0) > 0 and sol_delta < 0:
+                                seen.add(payer)
+                                res.buyers.append((payer, -sol_delta, tx.get("blockTime"), sig))
+                    if len(res.buyers) >= n:
+                        break
+        except Exception as e:
+            logger.warning("early buyers scan failed for %s: %s", mint, e)
+            return None
+        del res.buyers[n:]
+        self.by_mint[mint] = res
+        self.by_mint.move_to_end(mint)
+        if len(self.by_mint) > self.max_size:
+            self.by_mint.popitem(last=False)
+        return res
+
+    async def get(self, url: str, mint: str, n: int) -> Optional[EarlyBuyers]:
+        hit = self.by_mint.get(mint)
+        if hit is not None and hit.n >= n and time.time() - hit.at < EARLY_TTL:
+            return hit
+        task = self._inflight.get(mint)
+        if task is None:
+            task = self._inflight[mint] = asyncio.create_task(self._compute(url, mint, max(n, EARLY_DEFAULT)))
+            task.add_done_callback(lambda _t, m=mint: self._inflight.pop(m, None))
+        res = await asyncio.shield(task)
+        if res is not None and res.n < n:  # calcul partagé lancé pour un N plus petit
+            return await self.get(url, mint, n)
+        return res
+
+EARLY = EarlyCache(EARLY_CACHE_MAX)
+
+@register_command(name="early", help_text="!early <CA> [N] — premiers acheteurs d'un token (+ boutons watch)", aliases=["first"], cost="net")
+async def cmd_early(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    mint = args[0].strip() if args else ""
+    try:
+        n = int(args[1]) if len(args) > 1 else EARLY_DEFAULT
+    except ValueError:
+        n = 0
+    if not is_valid_pubkey(mint) or not 1 <= n <= EARLY_MAX:
+        await reply(update, f"Usage: <code>!early &lt;CA&gt; [N]</code> (N ≤ {EARLY_MAX})"); return
+    res = await EARLY.get(default_http_rpc(), mint, n)
+    if res is None:
+        await reply(update, "❌ Lecture des transactions impossible (RPC indisponible ?)."); return
+    if not res.buyers:
+        await reply(update, f"Aucun acheteur trouvé pour <code>{short_pk(mint)}</code>."); return
+    t0 = res.buyers[0][2]
+    lines = [f"<b>🐣 {min(n, len(res.buyers))} premiers acheteurs {_token_label(mint)}</b>"]
+    for i, (wallet, sol, ts, _sig) in enumerate(res.buyers[:n], 1):
+        when = f" • +{int(ts - t0)}s" if ts and t0 else ""
+        dev = " 👑 dev" if i == 1 and res.complete else ""
+        lines.append(f"{i}. <code>{short_pk(wallet)}</code> — <b>{sol:.3f} SOL</b>{when}{dev}")
+    more = "" if res.complete else "+"
+    lines.append(f"<i>{res.scanned} tx lues sur {res.total}{more} signatures</i>")
+    buttons = [InlineKeyboardButton(f"👁 {i}. {short_pk(w)}", callback_data=f"early:w:{w}")
+               for i, (w, _s, _t, _sig) in enumerate(res.buyers[:n], 1)]
+    markup = Kb(*[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+    await reply(update, "\n".join(lines), reply_markup=markup)
+
+async def on_early_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cq = update.callback_query
+    if not cq:
+        return
+    wallet = (cq.data or "").split(":", 2)[-1]
+    user_id = update.effective_user.id if update.effective_user else 0
+    chat_id = update.effective_chat.id if update.effective_chat else 0
+    if not is_valid_pubkey(wallet) or not LIMITER.allow(user_id, chat_id, COMMAND_COSTS.get("watch", "write")):
+        await cq.answer("⏳ Trop rapide, réessaie.", show_alert=False); return
+    await cq.answer()
+    await cmd_watch(update, context, [wallet])
+
 # ── Menu !commandes (inclut catégorie Tracker) ────────────────────────────────
 @register_command(
     name="commandes",
@@ -1441,7 +4822,7 @@ async def cmd_commandes(update: Update, context: ContextTypes.DEFAULT_TYPE, args
         "\n<b>🔗 Liens</b>",
         "• <code>!links</code> + raccourcis <code>!axiom</code>, <code>!bloom</code>, <code>!uxento</code>, <code>!raycyan</code>, <code>!mockape</code>, <code>!solincinerator</code>",
         "\n<b>📈 Marché</b>",
-        "• <code>!dex</code>, <code>!fees</code>, <code>!bond</code>, <code>!convert</code>",
+        "• <code>!dex</code>, <code>!fees</code>, <code>!bond [CA]</code>, <code>!check &lt;CA&gt;</code>, <code>!early &lt;CA&gt; [N]</code>, <code>!convert</code>",
         "\n<b>⚠️ Warning</b>",
         "• <code>!pnl</code> — mise en garde sur les cartes PnL",
         "\n<b>📒 Tutos</b>",
@@ -1449,18 +4830,282 @@ async def cmd_commandes(update: Update, context: ContextTypes.DEFAULT_TYPE, args
         "\n<b>🛰️ Tracker (Wallet temps réel)</b>",
         "• <code>!watch &lt;adresse&gt; [alias]</code> (alias <code>!wallet</code>) — suivre un wallet (image en haut, CA copiable, ticker/nom)",
         "• <code>!unwatch &lt;adresse&gt;</code> — arrêter le suivi",
-        "• <code>!unwatchall</code> — vider tout",
+        "• <code>!unwatchall</code> — vider tout (admin)",
+        "• <code>!watchmint &lt;CA&gt; [min_SOL]</code> — flux achats/ventes d'un token (résumés) | <code>!unwatchmint &lt;CA&gt;</code>",
         "• <code>!list</code> — liste compacte | <code>!listdetail</code> — alias, date, launchonly, minSOL",
-        "• <code>!setrpc &lt;http_url&gt;</code> — endpoint HTTP (pour <i>getTransaction</i>)",
-        "• <code>!setws &lt;wss_url&gt;</code> — endpoint WebSocket (sinon auto à partir du HTTP)",
+        "• <code>!setrpc &lt;http_url&gt;</code> — endpoint HTTP (pour <i>getTransaction</i>, admin)",
+        "• <code>!setws &lt;wss_url&gt;</code> — endpoint WebSocket (sinon auto à partir du HTTP, admin) • <code>!setws poll</code> — mode polling (RPC HTTP seul)",
         "• <code>!launchonly &lt;adresse&gt; on|off</code> — notifier seulement la <u>première</u> fois par token",
         "• <code>!minsol &lt;adresse&gt; &lt;montant_SOL&gt;</code> — filtrer les achats &lt; seuil de SOL",
         "• <code>!silent on/off</code> — notifications silencieuses (par chat)",
+        "• <code>!showfailed on/off</code> — voir aussi les tx échouées (par chat)",
+        "• <code>!filter buys minusd=50 maxage=1h</code> — règles du chat (<code>sells</code>, <code>allow=</code>/<code>deny=</code> CA, <code>mineur=</code>) | <code>!filter off</code>",
+        "• <code>!history &lt;adresse|alias&gt; [24h]</code> — swaps récents d'un wallet | <code>!who &lt;CA&gt; [24h]</code> — wallets suivis sur un token",
+        "• <code>!wpnl &lt;adresse|alias&gt;</code> — PnL réel (réalisé + latent) | <code>!leaderboard</code> (alias <code>!lb</code>) — classement des wallets",
+        "• <code>!consensus &lt;N&gt; &lt;minutes&gt; [min_SOL]</code> — alerte quand N wallets suivis achètent le même token | <code>!consensus off</code>",
+        "• <code>!trending [1h|24h] [global]</code> (alias <code>!trend</code>) — tokens les plus achetés par les wallets suivis",
+        "\n<b>🛡️ Admin</b>",
+        "• <code>!setrules</code>, <code>!stats</code> (charge du bot), <code>!mem</code> (mémoire), <code>!spam add|del|list</code> (mints dust ignorés), <code>!export [7d]</code> (CSV des swaps)",
         "\n<i>Bio rapide</i> : <u>launchonly</u> coupe le spam — tu ne vois que la <b>première entrée</b> du wallet sur chaque token. "
         "<u>minSOL</u> n’applique un filtre que si tu mets une valeur &gt; 0. "
         "Les données sont <b>persistées</b> en JSON (variable <code>TRACKER_STORE</code>).",
     ]
     await reply(update, "\n".join(lines))
 
-# Auto-load state at import
-load_state()
+# ── Budget mémoire (VM 512 Mo) ────────────────────────────────────────────────
+# Chaque cache déclare une estimation de sa taille et, s'il peut, une fonction
+# d'éviction. Au-delà du budget, on vide d'abord les caches de moindre valeur.
+MEM_BUDGET_MB   = float(os.getenv("MEM_BUDGET_MB", "192"))
+MEM_CHECK_EVERY = float(os.getenv("MEM_CHECK_EVERY", "60"))
+
+def approx_size(obj: object, depth: int = 4) -> int:
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_size(k, depth - 1) + approx_size(v, depth - 1)
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        for v in obj:
+            size += approx_size(v, depth - 1)
+    return size
+
+def sampled_size(items: Iterable, count: int, sample: int = 32) -> int:
+    """Taille moyenne sur un échantillon × nombre d'entrées (pas de parcours complet)."""
+    n = total = 0
+    for it in itertools.islice(items, sample):
+        total += approx_size(it)
+        n += 1
+    return int(total / n * count) if n else 0
+
+def process_rss() -> int:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def _drop_oldest(d: dict, fraction: float) -> int:
+    n = int(len(d) * fraction) or min(1, len(d))
+    for k in list(itertools.islice(iter(d), n)):
+        del d[k]
+    return n
+
+class MemoryBudget:
+    def __init__(self, budget_bytes: int):
+        self.budget = budget_bytes
+        # (priorité: plus petit = évincé en premier, nom, taille, éviction(fraction) -> nb d'entrées retirées)
+        self.caches: List[Tuple[int, str, Callable[[], int], Optional[Callable[[float], int]]]] = []
+        self.evicted: Dict[str, int] = {}
+
+    def register(self, name: str, priority: int, size_fn: Callable[[], int],
+                 evict_fn: Optional[Callable[[float], int]] = None):
+        self.caches.append((priority, name, size_fn, evict_fn))
+        self.caches.sort(key=lambda c: c[0])
+
+    def breakdown(self) -> List[Tuple[str, int]]:
+        return [(name, size_fn()) for _prio, name, size_fn, _evict in self.caches]
+
+    def enforce(self) -> int:
+        """Évince jusqu'à repasser sous le budget. Retourne le nb d'entrées retirées."""
+        removed = 0
+        sizes = {name: size for name, size in self.breakdown()}
+        total = sum(sizes.values())
+        for _prio, name, size_fn, evict_fn in self.caches:
+            while total > self.budget and evict_fn is not None and sizes[name] > 0:
+                n = evict_fn(0.5)
+                if not n:
+                    break
+                removed += n
+                self.evicted[name] = self.evicted.get(name, 0) + n
+                new = size_fn()
+                total -= sizes[name] - new
+                sizes[name] = new
+            if total <= self.budget:
+                break
+        if removed:
+            logger.warning("memory budget: evicted %d entries (now ~%d MB)", removed, total // (1024 * 1024))
+        return removed
+
+def _all_seen_lists() -> List[list]:
+    return [meta.get("seen_mints") for cfg in TRACKER_STATE.values() for meta in (cfg.get("subs") or {}).values()
+            if meta.get("seen_mints")]
+
+MEMORY = MemoryBudget(int(MEM_BUDGET_MB * 1024 * 1024))
+MEMORY.register("tx récentes", 10, lambda: sampled_size(_recent_sigs.values(), len(_recent_sigs)),
+                lambda f: _drop_oldest(_recent_sigs, f))
+MEMORY.register("tokens (à la demande)", 20, lambda: sampled_size(((m, TOKENS.by_mint.get(m)) for m in TOKENS.fetched), len(TOKENS.fetched)),
+                TOKENS.evict_fetched)
+MEMORY.register("tokens (liste Jupiter)", 90, lambda: sampled_size(TOKENS.by_mint.items(), len(TOKENS.by_mint) - len(TOKENS.fetched))
+                + sampled_size(TOKENS.by_symbol.items(), len(TOKENS.by_symbol)))
+MEMORY.register("anti-spam", 30, lambda: sampled_size(LIMITER.buckets.keys(), len(LIMITER.buckets)) + 120 * len(LIMITER.buckets),
+                LIMITER.drop_idle)
+MEMORY.register("admins", 40, lambda: sampled_size(_admin_cache.items(), len(_admin_cache)),
+                lambda f: _drop_oldest(_admin_cache, f))
+MEMORY.register("logos file_id", 50, lambda: sampled_size(LOGO_FILE_IDS.items(), len(LOGO_FILE_IDS)),
+                lambda f: _drop_oldest(LOGO_FILE_IDS, f))
+MEMORY.register("seen_mints", 60, lambda: sum(approx_size(s, 1) for s in _all_seen_lists()))  # déjà bornés (SEEN_MINTS_MAX), persistés
+MEMORY.register("supply", 25, lambda: sampled_size(SUPPLY.by_mint.items(), len(SUPPLY.by_mint)),
+                lambda f: _drop_oldest(SUPPLY.by_mint, f))
+MEMORY.register("âge des mints", 27, lambda: sampled_size(MINT_AGES.birth.items(), len(MINT_AGES.birth)),
+                lambda f: _drop_oldest(MINT_AGES.birth, f))
+MEMORY.register("mints spam", 90, lambda: approx_size(SPAM.auto, 1) + approx_size(SPAM.manual, 1) + approx_size(SPAM.dust, 2))
+MEMORY.register("prix de marque", 35, lambda: sampled_size(MARKS.by_mint.items(), len(MARKS.by_mint)),
+                lambda f: _drop_oldest(MARKS.by_mint, f))
+MEMORY.register("positions", 45, lambda: sum(sampled_size(book.items(), len(book), 8) for book in LEDGER.by_wallet.values()),
+                lambda f: LEDGER.evict(f, watched_wallets()))
+MEMORY.register("consensus", 90, lambda: sum(approx_size(w.mints, 3) + approx_size(w.order, 2) for w in _cobuy.values()))
+MEMORY.register("tendances", 90, lambda: sum(len(sk.items) for bs in TRENDS.scopes.values() for sk in bs.values()) * 200)
+MEMORY.register("bonding curves", 15, lambda: len(BONDS.by_mint) * 250 + sampled_size(_curve_pdas.items(), len(_curve_pdas)),
+                lambda f: _drop_oldest(BONDS.by_mint, f) + _drop_oldest(_curve_pdas, f))
+MEMORY.register("checks", 15, lambda: len(RISKS.by_mint) * 1500, lambda f: _drop_oldest(RISKS.by_mint, f))
+MEMORY.register("early", 10, lambda: len(EARLY.by_mint) * 4000, lambda f: _drop_oldest(EARLY.by_mint, f))
+MEMORY.register("cotations dex", 40, lambda: len(QUOTES.by_mint) * 150, lambda f: _drop_oldest(QUOTES.by_mint, f))
+MEMORY.register("prix", 90, lambda: approx_size(PRICES.prices))
+MEMORY.register("mints suivis", 90, lambda: sum(approx_size(a.buyers, 1) + approx_size(a.slots, 2) for a in MINT_AGGS.values()))
+MEMORY.register("tracker state", 100, lambda: approx_size(TRACKER_STATE, 3) - sum(approx_size(s, 1) for s in _all_seen_lists()))
+
+async def memory_guard_loop():
+    while True:
+        await asyncio.sleep(MEM_CHECK_EVERY)
+        try:
+            MEMORY.enforce()
+        except Exception as e:
+            logger.warning("memory guard failed: %s", e)
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} Mo"
+
+@register_command(name="mem", help_text="(Admin) Mémoire: taille des caches et budget", admin=True)
+async def cmd_mem(update: Update, context: ContextTypes.DEFAULT_TYPE, args: List[str]):
+    parts = MEMORY.breakdown()
+    total = sum(size for _name, size in parts)
+    lines = [f"<b>🧠 Mémoire</b> — RSS <code>{_mb(process_rss())}</code> • caches ~<code>{_mb(total)}</code> / budget <code>{_mb(MEMORY.budget)}</code>"]
+    for name, size in sorted(parts, key=lambda p: -p[1]):
+        ev = MEMORY.evicted.get(name)
+        lines.append(f"• {name}: <code>{_mb(size)}</code>" + (f" (évincés: {ev})" if ev else ""))
+    await reply(update, "\n".join(lines))
+
+# ── Démarrage (post_init) + snapshot des caches chauds ────────────────────────
+# min_machines_running = 0 : chaque requête peut réveiller une machine froide.
+# On relance le tracker tout seul et on restaure les caches chauds au boot.
+HOT_CACHE_STORE    = os.getenv("HOT_CACHE_STORE", str(Path(TRACKER_STORE).with_name("hot_cache.json")))
+HOT_SNAPSHOT_EVERY = float(os.getenv("HOT_SNAPSHOT_EVERY", "300"))
+_boot_tasks: List[asyncio.Task] = []
+
+def hot_snapshot_data() -> dict:
+    """Copie des caches chauds, prise sur la boucle (les dicts vivants n'en sortent pas)."""
+    return {
+        "tokens": {m: dict(TOKENS.by_mint[m]) for m in TOKENS.hot if m in TOKENS.by_mint},
+        "logos": dict(LOGO_FILE_IDS),
+        "prices": [[cid, fiat, px, t] for (cid, fiat), (px, t) in PRICES.prices.items()],
+        "supply": {m: SUPPLY.by_mint[m] for m in TOKENS.hot if m in SUPPLY.by_mint},
+        "trends": TRENDS.dump(),
+    }
+
+def write_hot_snapshot(data: dict):
+    try:
+        tmp = Path(HOT_CACHE_STORE + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(HOT_CACHE_STORE)
+    except Exception as e:
+        logger.warning("hot snapshot save failed: %s", e)
+
+def save_hot_snapshot():
+    write_hot_snapshot(hot_snapshot_data())
+
+def load_hot_snapshot():
+    if not os.path.exists(HOT_CACHE_STORE):
+        return
+    try:
+        data = json.loads(Path(HOT_CACHE_STORE).read_text(encoding="utf-8"))
+        for mint, md in (data.get("tokens") or {}).items():
+            if mint not in TOKENS.by_mint:
+                TOKENS.put(mint, md)
+                TOKENS.fetched[mint] = None
+            TOKENS.hot[mint] = None
+        LOGO_FILE_IDS.update(data.get("logos") or {})
+        for cid, fiat, px, t in data.get("prices") or []:
+            PRICES.prices.setdefault((cid, fiat), (float(px), float(t)))
+        for mint, (supply, t) in (data.get("supply") or {}).items():
+            SUPPLY.by_mint.setdefault(mint, (float(supply), float(t)))
+        TRENDS.load(data.get("trends") or {})
+        logger.info("hot snapshot restored: %d tokens, %d logos, %d prices",
+                    len(data.get("tokens") or {}), len(data.get("logos") or {}), len(data.get("prices") or []))
+    except Exception as e:
+        logger.warning("hot snapshot load failed: %s", e)
+
+def boot_state():
+    global _state_version, _state_base
+    try:
+        _state_version = LEASE.state_version()  # avant la lecture : au pire, le store est plus neuf et on le relira
+    except Exception as e:
+        logger.warning("lease db read failed: %s", e)
+    load_state()
+    _state_base = {chat_id: chat_fingerprint(cfg) for chat_id, cfg in TRACKER_STATE.items()}
+
+async def _warm_tokens_bg():
+    async with aiohttp.ClientSession() as session:
+        await TOKENS.warm(session)
+    logger.info("token list warmed (%d mints) at +%.2fs", len(TOKENS.by_mint), time.monotonic() - PROCESS_T0)
+
+async def _hot_snapshot_loop():
+    while True:
+        await asyncio.sleep(HOT_SNAPSHOT_EVERY)
+        await asyncio.to_thread(write_hot_snapshot, hot_snapshot_data())
+
+async def on_post_init(app: Application):
+    await asyncio.gather(asyncio.to_thread(boot_state), asyncio.to_thread(load_hot_snapshot), asyncio.to_thread(SPAM.load))
+    PRICES.start()
+    FEES.start()
+    _boot_tasks.append(asyncio.create_task(_warm_tokens_bg()))
+    _boot_tasks.append(asyncio.create_task(_hot_snapshot_loop()))
+    _boot_tasks.append(asyncio.create_task(memory_guard_loop()))
+    _boot_tasks.append(asyncio.create_task(events_loop()))
+    if watched_addresses():
+        ensure_ws_loop(app)
+    logger.info("post_init done at +%.2fs (%d chats)", time.monotonic() - PROCESS_T0, len(TRACKER_STATE))
+
+async def on_post_shutdown(app: Application):
+    for t in _boot_tasks:
+        t.cancel()
+    if FEES._task is not None:
+        FEES._task.cancel()
+    if _leader_task is not None:
+        _leader_task.cancel()
+        try:
+            await _leader_task
+        except (asyncio.CancelledError, Exception):
+            pass
+    save_hot_snapshot()
+    await SUPPLY.close()
+    try:
+        EVENTS.write(EVENTS.take())
+        keys = list(LEDGER.cold)
+        if keys:
+            LEDGER.warm(keys, _cold_positions(keys))
+        EVENTS.save_positions(LEDGER.take_dirty())
+        EVENTS.close()
+    except Exception as e:
+        logger.warning("event store final flush failed: %s", e)
+
+if __name__ == "__main__":
+    app = build_app()
+    if PUBLIC_URL:
+        webhook_path = "/webhook"
+        full_url = f"{PUBLIC_URL.rstrip('/')}{webhook_path}"
+        logger.info("WEBHOOK sur %s (port %s)", full_url, PORT)
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=webhook_path.strip("/"),
+            webhook_url=full_url,
+            drop_pending_updates=True,
+            allowed_updates=Update.ALL_TYPES,  # chat_member: invalide le cache admins
+        )
+    else:
+        logger.info("Polling (LOCAL/DEV)")
+        app.run_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Générateur de charge pour le routeur du bot (on_text, alias, on_panel_click, handlers).
+
+Les updates sont construits comme ceux de Telegram (Update.de_json) et passent par
+la vraie Application (processeur d'updates, handlers, filtres). Seuls les backends
+sont simulés : Bot API (BaseRequest local), CoinGecko et RPC Solana.
+
+    python loadgen.py --updates 20000 --rate 2000 --chats 50 --users 500
+    python loadgen.py --alloc            # + allocations (tracemalloc, plus lent)
+    python loadgen.py --api-latency 0.05 # Bot API lente (50 ms / appel)
+"""
+
+from __future__ import annotations
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# Config avant l'import du bot : faux token, state jetable.
+_TMP = tempfile.mkdtemp(prefix="loadgen-")
+atexit.register(shutil.rmtree, _TMP, True)
+os.environ.setdefault("BOT_TOKEN", "123456:LOADGEN")
+os.environ["TRACKER_STORE"] = os.path.join(_TMP, "tracker_state.json")
+os.environ["TRACKER_LEASE_DB"] = os.path.join(_TMP, "tracker_lease.sqlite3")
+os.environ["HOT_CACHE_STORE"] = os.path.join(_TMP, "hot_cache.json")
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+import bot
+
+BOT_ID   = 777000001
+ADMIN_ID = 1  # user 1 est admin de tous les chats
+
+# Trafic mixte: (poids, générateur de texte ou de callback_data)
+COMMAND_MIX: List[Tuple[int, str]] = [
+    (20, "!convert 100 usd-sol"),
+    (8,  "!convert 2.5 sol-eur"),
+    (4,  "!convert 50 eur-usd"),
+    (6,  "!convert 1m DezXAZ8z7PnrnRJjz3wXBoRgixCa6xjnB7YaB1pPB263-usd"),
+    (10, "!cmd"),
+    (6,  "!help"),
+    (8,  "!listdetail"),
+    (6,  "!list"),
+    (6,  "!riskcalc 1.2m 10 25"),
+    (6,  "!gm"),
+    (4,  "!p"),
+    (4,  "!links"),
+    (3,  "!fees"),
+    (3,  "!inconnue"),
+    (2,  "!stats"),
+]
+CALLBACK_MIX: List[Tuple[int, str]] = [
+    (4, "panel:links"),
+    (4, "panel:tutos"),
+    (3, "panel:cmds"),
+    (2, "show:mev"),
+    (2, "show:tracker"),
+]
+CHATTER = [
+    "gm les gars",
+    "quelqu'un a vu le dernier launch ?",
+    "ça dump sévère là",
+    "lfg 🚀🚀",
+    "je suis sorti à x3, gg",
+]
+
+# ── Bot API simulée ───────────────────────────────────────────────────────────
+class FakeBotAPI(BaseRequest):
+    """Répond localement à la Bot API ; compte les appels par méthode."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._msg_ids = itertools.count(10_000)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, params: dict) -> dict:
+        return {
+            "message_id": next(self._msg_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "supergroup", "title": "load"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "LoadBot", "username": "loadbot"},
+            "text": str(params.get("text") or params.get("caption") or ""),
+        }
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result: object = {"id": BOT_ID, "is_bot": True, "first_name": "LoadBot", "username": "loadbot"}
+        elif endpoint == "getChatAdministrators":
+            result = [{"status": "creator", "is_anonymous": False,
+                       "user": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}}]
+        elif endpoint.startswith(("send", "edit")):
+            result = self._message(params)
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+# ── Backends prix / RPC simulés ───────────────────────────────────────────────
+def stub_backends(latency: float):
+    async def fake_prices(ids: List[str]):
+        await asyncio.sleep(latency)
+        now = time.time()
+        for cid in ids:
+            bot.PRICES.prices[(cid, "usd")] = (100.0 + len(cid), now)
+            bot.PRICES.prices[(cid, "eur")] = (92.0 + len(cid), now)
+
+    async def fake_rpc_post(session, url, method, params):
+        await asyncio.sleep(latency)
+        return {"jsonrpc": "2.0", "id": 1, "result": None}
+
+    async def fake_rpc_batch(session, url, calls):
+        await asyncio.sleep(latency)
+        return [None] * len(calls)
+
+    class FakeQuotes:
+        name = "stub"
+        max_ids = 30
+
+        async def fetch(self, session, mints):
+            await asyncio.sleep(latency)
+            return {m: 1e-5 * (1 + len(m) % 7) for m in mints}
+
+    bot.PRICES._fetch = fake_prices  # type: ignore[method-assign]
+    bot.QUOTES.source = FakeQuotes()
+    bot.rpc_post = fake_rpc_post
+    bot.rpc_batch = fake_rpc_batch
+
+def seed_tracker(chats: List[int], wallets_per_chat: int):
+    """Quelques wallets suivis par chat pour que !list / !listdetail aient du travail."""
+    rnd = random.Random(7)
+    for cid in chats:
+        cfg = bot._default_chat_cfg()
+        for i in range(wallets_per_chat):
+            addr = bot.b58encode(rnd.randbytes(32))
+            cfg["subs"][addr] = {  # type: ignore[index]
+                "alias": f"w{i}", "added_at": "2025-01-01T00:00:00+00:00",
+                "launchonly": bool(i % 2), "seen_mints": [], "min_sol": 0.5 if i % 3 == 0 else 0.0,
+            }
+        bot.TRACKER_STATE[cid] = cfg
+
+# ── Fabrication des updates ───────────────────────────────────────────────────
+def _weighted(mix: List[Tuple[int, str]]) -> Tuple[List[str], List[int]]:
+    return [v for _w, v in mix], [w for w, _v in mix]
+
+class UpdateFactory:
+    def __init__(self, app, chats: List[int], users: int, cmd_share: float, cb_share: float, seed: int):
+        self.app = app
+        self.chats = chats
+        self.users = users
+        self.cmd_share = cmd_share
+        self.cb_share = cb_share
+        self.rnd = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.cmds = _weighted(COMMAND_MIX)
+        self.cbs = _weighted(CALLBACK_MIX)
+
+    def _user(self) -> dict:
+        uid = self.rnd.randint(1, self.users)
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"user{uid}"}
+
+    def _message(self, chat_id: int, user: dict, text: str) -> dict:
+        return {
+            "message_id": next(self.ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"chat {chat_id}"},
+            "from": user,
+            "text": text,
+        }
+
+    def make(self) -> Tuple[str, Update]:
+        uid = next(self.ids)
+        chat_id = self.rnd.choice(self.chats)
+        user = self._user()
+        r = self.rnd.random()
+        if r < self.cb_share:
+            data = self.rnd.choices(*self.cbs)[0]
+            raw = {"update_id": uid, "callback_query": {
+                "id": str(uid), "from": user, "chat_instance": str(chat_id), "data": data,
+                "message": self._message(chat_id, {"id": BOT_ID, "is_bot": True, "first_name": "LoadBot"}, "menu"),
+            }}
+            kind = "cb:" + data
+        elif r < self.cb_share + self.cmd_share:
+            text = self.rnd.choices(*self.cmds)[0]
+            raw = {"update_id": uid, "message": self._message(chat_id, user, text)}
+            kind = text.split()[0]
+        else:
+            raw = {"update_id": uid, "message": self._message(chat_id, user, self.rnd.choice(CHATTER))}
+            kind = "chatter"
+        return kind, Update.de_json(raw, self.app.bot)
+
+# ── Exécution ─────────────────────────────────────────────────────────────────
+def _pct(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+async def run(args) -> int:
+    stub_backends(args.backend_latency)
+    if not args.with_ratelimit:
+        big = ((1e9, 1e9), (1e9, 1e9))
+        bot.LIMITER.classes = {k: big for k in bot.RATE_CLASSES}
+    api = FakeBotAPI(args.api_latency)
+    app = bot.build_app(request=api)
+    chats = [-1_000_000_000_000 - i for i in range(args.chats)]
+    seed_tracker(chats, args.wallets)
+    factory = UpdateFactory(app, chats, args.users, args.cmd_share, args.cb_share, args.seed)
+    # pré-construit: on mesure le routeur, pas la désérialisation
+    updates = [factory.make() for _ in range(args.updates)]
+
+    await app.initialize()
+    await app.start()
+    proc = app.update_processor
+    lat: Dict[str, List[float]] = {}
+    inflight: set = set()
+
+    async def one(kind: str, upd: Update):
+        t0 = time.perf_counter()
+        await proc.process_update(upd, app.process_update(upd))
+        lat.setdefault(kind, []).append(time.perf_counter() - t0)
+
+    if args.alloc:
+        tracemalloc.start(10)
+        snap0 = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        mem0 = tracemalloc.get_traced_memory()[0]
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    t_start = time.perf_counter()
+    for i, (kind, upd) in enumerate(updates):
+        if interval:
+            delay = t_start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        task = asyncio.create_task(one(kind, upd))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.gather(*inflight)
+    elapsed = time.perf_counter() - t_start
+
+    if args.alloc:
+        mem1, peak = tracemalloc.get_traced_memory()
+        snap1 = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+    await app.stop()
+    await app.shutdown()
+    for t in (bot.PRICES._loop_task, bot.PRICES._inflight):
+        if t is not None:
+            t.cancel()
+
+    done = sum(len(v) for v in lat.values())
+    all_lat = sorted(x for v in lat.values() for x in v)
+    stats = proc.stats() if hasattr(proc, "stats") else {}
+    print(f"\n== {done} updates en {elapsed:.2f}s → {done / elapsed:.0f} updates/s "
+          f"(cible {args.rate:g}/s, {args.chats} chats, {args.users} users)")
+    print(f"latence (file + handler): p50 {_pct(all_lat, .5) * 1e3:.2f} ms • p90 {_pct(all_lat, .9) * 1e3:.2f} ms • "
+          f"p99 {_pct(all_lat, .99) * 1e3:.2f} ms • max {all_lat[-1] * 1e3 if all_lat else 0:.2f} ms")
+    print(f"processeur: {stats}  anti-spam jetés: {bot.LIMITER.dropped}")
+    print(f"\n{'type':<24}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for kind, vals in sorted(lat.items(), key=lambda kv: -len(kv[1])):
+        vals.sort()
+        print(f"{kind:<24}{len(vals):>7}{_pct(vals, .5) * 1e3:>10.2f}{_pct(vals, .99) * 1e3:>10.2f}")
+    print("\nBot API: " + ", ".join(f"{k}={v}" for k, v in api.calls.most_common()))
+    if args.alloc:
+        alloc = sum(s.size_diff for s in snap1.compare_to(snap0, "filename") if s.size_diff > 0)
+        print(f"\nallocations: ~{alloc / max(done, 1):.0f} o/update retenus, "
+              f"croissance nette {(mem1 - mem0) / 1024:.0f} Kio, pic {peak / 1024:.0f} Kio")
+        for s in snap1.compare_to(snap0, "lineno")[:args.alloc_top]:
+            print(f"  {s}")
+    return 0
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Charge synthétique sur le routeur du bot (backends simulés).")
+    ap.add_argument("--updates", type=int, default=10_000, help="nombre d'updates envoyés")
+    ap.add_argument("--rate", type=float, default=1000.0, help="updates/s visés (0 = aussi vite que possible)")
+    ap.add_argument("--chats", type=int, default=50)
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--wallets", type=int, default=20, help="wallets suivis par chat (pour !list/!listdetail)")
+    ap.add_argument("--cmd-share", type=float, default=0.6, help="part de commandes préfixées")
+    ap.add_argument("--cb-share", type=float, default=0.15, help="part de clics sur les boutons")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="latence simulée de la Bot API (s)")
+    ap.add_argument("--backend-latency", type=float, default=0.05, help="latence simulée CoinGecko/RPC (s)")
+    ap.add_argument("--with-ratelimit", action="store_true", help="garder l'anti-spam (sinon désactivé)")
+    ap.add_argument("--alloc", action="store_true", help="mesurer les allocations (tracemalloc)")
+    ap.add_argument("--alloc-top", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# bot.py lit sa config à l'import : environnement jetable avant le premier `import bot`
+_TMP = tempfile.mkdtemp(prefix="bot-tests-")
+atexit.register(shutil.rmtree, _TMP, True)
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ["TRACKER_STORE"] = os.path.join(_TMP, "tracker_state.json")
+os.environ["TRACKER_LEASE_DB"] = os.path.join(_TMP, "lease.db")
+os.environ["HOT_CACHE_STORE"] = os.path.join(_TMP, "hot_cache.json")
+os.environ.pop("FEE_ACCOUNTS", None)  # défaut testé : frais globaux
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
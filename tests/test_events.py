@@ -0,0 +1,32 @@
+import asyncio
+
+import bot
+
+
+def test_failed_flush_requeues_rows_in_order(monkeypatch):
+    store = bot.EventStore(":memory:")
+    store.buffer = [("old",)]
+    store.append(("new",))
+
+    def broken(rows):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "write", broken)
+    assert asyncio.run(store.flush()) is False
+    store.append(("newer",))
+    assert store.buffer == [("old",), ("new",), ("newer",)]
+
+
+def test_requeue_is_capped(monkeypatch):
+    monkeypatch.setattr(bot, "EVENTS_BUFFER_MAX", 3)
+    store = bot.EventStore(":memory:")
+    store.buffer = [(3,), (4,)]
+    store.requeue([(1,), (2,)])
+    assert store.buffer == [(2,), (3,), (4,)] and store.dropped == 1
+
+
+def test_who_only_lists_wallets_of_the_chat():
+    store = bot.EventStore(":memory:")
+    store.write([(100, "s1", "w1", "M", "buy", 1.0, -1.0), (100, "s2", "w2", "M", "buy", 1.0, -1.0)])
+    assert [r[0] for r in store.who("M", 0, ["w2"])] == ["w2"]
+    assert store.who("M", 0, []) == []
@@ -0,0 +1,29 @@
+import asyncio
+
+import bot
+
+
+def _capture(monkeypatch):
+    sent = []
+
+    async def fake_rpc_post(session, url, method, params):
+        sent.append((method, params))
+        return {"result": [{"slot": 1, "prioritizationFee": 5000}]}
+
+    monkeypatch.setattr(bot, "rpc_post", fake_rpc_post)
+    return sent
+
+
+def test_default_sample_is_global(monkeypatch):
+    sent = _capture(monkeypatch)
+    assert bot.FEE_ACCOUNTS == []
+    asyncio.run(bot.FeeSampler()._sample(None))
+    assert sent == [("getRecentPrioritizationFees", [])]
+
+
+def test_configured_accounts_are_sent_as_one_list(monkeypatch):
+    sent = _capture(monkeypatch)
+    accounts = ["CebN5WGQ4jvEPvsVU4EoHEpgzq1VV7AbicfhtW4xC9iM"]
+    monkeypatch.setattr(bot, "FEE_ACCOUNTS", accounts)
+    asyncio.run(bot.FeeSampler()._sample(None))
+    assert sent == [("getRecentPrioritizationFees", [accounts])]
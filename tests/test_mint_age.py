@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import bot
+
+
+def _stub_pages(monkeypatch, pages):
+    calls = []
+
+    async def fake_rpc_post(session, url, method, params):
+        calls.append(params[1].get("before"))
+        return {"result": pages[len(calls) - 1] if len(calls) <= len(pages) else []}
+
+    monkeypatch.setattr(bot, "rpc_post", fake_rpc_post)
+    return calls
+
+
+def _page(start: int, n: int, t0: float):
+    return [{"signature": f"s{start + i}", "blockTime": t0 - start - i} for i in range(n)]
+
+
+def test_full_pages_only_give_a_lower_bound(monkeypatch):
+    now = time.time()
+    pages = [_page(i * 1000, 1000, now - 600) for i in range(bot.MINT_AGE_PAGES)]
+    calls = _stub_pages(monkeypatch, pages)
+    cache = bot.MintAgeCache(10)
+
+    age, exact = asyncio.run(cache.age(None, "http://rpc", "MintA"))
+
+    assert len(calls) == bot.MINT_AGE_PAGES
+    assert not exact
+    assert age >= 600
+    rules = bot.compile_rules("maxage=1h")
+    ev = bot.SwapEvent({}, "owner")
+    ev.age, ev.age_exact = age, exact
+    assert not rules.check(ev)  # historique trop long : le token n'est pas « jeune »
+
+
+def test_short_history_gives_exact_birth(monkeypatch):
+    now = time.time()
+    _stub_pages(monkeypatch, [_page(0, 1000, now - 60), _page(1000, 10, now - 60)])
+    cache = bot.MintAgeCache(10)
+
+    age, exact = asyncio.run(cache.age(None, "http://rpc", "MintB"))
+
+    assert exact
+    assert 60 <= age < 60 + 1010 + 5
+    ev = bot.SwapEvent({}, "owner")
+    ev.age, ev.age_exact = age, exact
+    assert bot.compile_rules("maxage=1h").check(ev)
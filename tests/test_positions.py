@@ -0,0 +1,39 @@
+import asyncio
+
+import bot
+
+WALLET = "CebN5WGQ4jvEPvsVU4EoHEpgzq1VV7AbicfhtW4xC9iM"
+MINT = "So11111111111111111111111111111111111111112"
+
+
+def test_follower_reads_positions_from_shared_db(monkeypatch):
+    monkeypatch.setattr(bot.LEASE, "held", False)
+    bot.EVENTS.save_positions([(WALLET, MINT, 10.0, 1.0, 0.5, 2, 1, 100)])
+    books = asyncio.run(bot.position_books([WALLET, "unknown"]))
+    assert list(books) == [WALLET]
+    realized, _unrealized, unpriced = bot.position_summary(books[WALLET])
+    assert realized == 0.5 and unpriced == 1
+
+
+def _swap(side, amt, sol, ts):
+    ev = bot.SwapEvent.__new__(bot.SwapEvent)
+    ev.owner, ev.side, ev.sol_delta, ev.ts = WALLET, side, sol, ts
+    ev.bought_mint, ev.bought_amt = (MINT, amt) if side == "buy" else (None, 0.0)
+    ev.sold_mint, ev.sold_amt = (MINT, amt) if side == "sell" else (None, 0.0)
+    return ev
+
+
+def test_evicted_position_is_reloaded_before_replay():
+    ledger = bot.PositionLedger()
+    bot.EVENTS.save_positions([(WALLET, MINT, 0.0, 0.0, 2.0, 1, 1, 100)])
+    ledger.apply(_swap("buy", 10.0, -1.0, 200))
+    ledger.apply(_swap("sell", 5.0, 0.8, 201))
+    assert not ledger.by_wallet and len(ledger.cold[(WALLET, MINT)]) == 2
+    keys = list(ledger.cold)
+    ledger.warm(keys, bot._cold_positions(keys))
+    p = ledger.by_wallet[WALLET][MINT]
+    assert (p.qty, p.buys, p.sells) == (5.0, 2, 2)
+    assert abs(p.realized - 2.3) < 1e-9  # 2.0 déjà en base + 0.8 - 0.5 de coût
+    assert ledger.evict(1.0, {WALLET}) == 0  # ouverte, suivie et pas encore écrite
+    bot.EVENTS.save_positions(ledger.take_dirty())
+    assert ledger.evict(1.0, set()) == 1 and not ledger.by_wallet
@@ -0,0 +1,40 @@
+import asyncio
+import struct
+
+import bot
+
+MINT = "CebN5WGQ4jvEPvsVU4EoHEpgzq1VV7AbicfhtW4xC9iM"
+
+
+def _pair(tmp_path):
+    db = str(tmp_path / "lease.db")
+    return bot.SpamIndex(str(tmp_path / "a.bin"), db), bot.SpamIndex(str(tmp_path / "b.bin"), db)
+
+
+def test_admin_edit_reaches_other_instance(tmp_path):
+    leader, follower = _pair(tmp_path)
+    leader.load()
+
+    async def scenario():
+        await follower.edit({MINT: "manual"})
+        await leader.sync()
+        assert leader.is_spam(MINT)
+        await leader.save()  # sauvegarde périodique du leader : ne doit rien écraser
+        await follower.edit({MINT: "allow"})
+        await leader.sync()
+        assert not leader.is_spam(MINT)
+        assert MINT in leader.allow
+
+    asyncio.run(scenario())
+
+
+def test_old_file_rules_are_migrated(tmp_path):
+    leader, _ = _pair(tmp_path)
+    key = bot.b58decode(MINT)
+    raw = struct.pack("<I", 0) + struct.pack("<I", 1) + key + struct.pack("<I", 0)
+    (tmp_path / "a.bin").write_bytes(raw)
+    leader.load()
+    assert leader.manual == {MINT}
+    fresh = bot.SpamIndex(str(tmp_path / "a.bin"), leader.rules_db)
+    fresh.load()
+    assert fresh.manual == {MINT}
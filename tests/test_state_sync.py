@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+import bot
+
+
+def _other_machine_writes(state: dict):
+    """Écriture d'une autre machine : store + version, sans passer par notre mémoire."""
+    version = bot.LEASE.state_version()
+    assert bot.LEASE.bump_state_version(version, lambda: bot._write_store(json.dumps(state))) == version + 1
+
+
+def test_conflicting_save_merges_and_retries(monkeypatch):
+    monkeypatch.setattr(bot, "TRACKER_STATE", {})
+
+    async def scenario():
+        await bot.save_state()
+        st = await bot.tracker_chat_state(1)
+        await bot.save_state()
+        # une autre machine ajoute un chat pendant qu'on modifie le nôtre sans l'avoir relu
+        _other_machine_writes({"1": json.loads(json.dumps(st)), "2": {"rules": "remote"}})
+        st["rules"] = "local"
+        await bot.save_state()
+
+    asyncio.run(scenario())
+    assert bot._state_version == bot.LEASE.state_version()
+    stored = bot.read_state()
+    assert stored[1]["rules"] == "local"
+    assert stored[2]["rules"] == "remote"
+
+
+def test_stale_version_is_refused():
+    version = bot.LEASE.state_version()
+    written = []
+    assert bot.LEASE.bump_state_version(version - 1, lambda: written.append(1)) is None
+    assert not written and bot.LEASE.state_version() == version